@@ -3,6 +3,14 @@ ASGI config for DMS project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with uvicorn to get the async auth endpoints (api/async/*, see
+core.views.auth_async) running on the event loop:
+
+    uvicorn DMS.asgi:application --workers 4 --lifespan off
+
+Any worker can verify a login: the default OTP_CHALLENGE_STORE keeps
+challenges in the database (or use OTP_SIGNED_CHALLENGES).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -25,6 +25,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,14 +57,46 @@ TEMPLATES = [
 WSGI_APPLICATION = 'DMS.wsgi.application'
 AUTH_USER_MODEL = 'core.CustomUser'  # Update this if needed
 
-# Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# Database, configured from DATABASE_URL / DATABASE_REPLICA_URLS / DB_* (see core.db).
+# Without them this is the local db.sqlite3 with persistent connections.
+from core.db import database_settings, env_flag
+
+DATABASES, DATABASE_REPLICAS = database_settings(os.environ, default_url='sqlite:///db.sqlite3', base_dir=BASE_DIR)
+
+# Reads go to DATABASE_REPLICAS; writes, unsafe requests and clients that
+# wrote in the last REPLICA_PIN_SECONDS use the primary
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+
+# With DB_SQLITE_HIGH_CONCURRENCY=1 the auth views' writes go through one
+# writer thread per process (core.write_queue), up to BATCH_SIZE jobs per
+# transaction
+SQLITE_WRITE_QUEUE = {
+    'ENABLED': env_flag(os.environ, 'DB_SQLITE_HIGH_CONCURRENCY'),
+    'BATCH_SIZE': 32,
+    'BATCH_WAIT': 0.002,
+    'TIMEOUT': 10,
 }
 
+# Cache used by the auth user cache, the OTP challenge store and, when
+# configured, the throttles. LocMemCache is per process: with more than one
+# worker set CACHE_URL (e.g. redis://cache:6379/0) so OTP challenges are
+# shared; `manage.py check --deploy` warns otherwise (core.checks).
+if os.environ.get('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -74,8 +108,111 @@ AUTH_PASSWORD_VALIDATORS = [
 # Django Rest Framework + SimpleJWT configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ),
+    # Token buckets used by core.throttling on send-otp / parent-send-otp
+    # and on the register endpoints
+    'DEFAULT_THROTTLE_RATES': {
+        'otp_phone': '3/min',
+        'otp_ip': '30/min',
+        'otp_global': '50/s',
+        'register_ip': '10/min',
+        'register_global': '20/s',
+        'upload_ip': '10/min',
+        'upload_global': '20/s',
+        'upload_chunk_ip': '600/min',
+    },
+}
+
+# Authenticated users are cached for this many seconds (core.authentication)
+JWT_USER_CACHE_ALIAS = 'default'
+JWT_USER_CACHE_TIMEOUT = 60
+
+# Driver profile detail responses are cached per profile version for this
+# many seconds (core.profile_cache); writes change the version, not the entry
+DRIVER_PROFILE_CACHE_ALIAS = 'default'
+DRIVER_PROFILE_CACHE_TIMEOUT = 300
+
+# Where the token buckets live. MemoryBucketBackend is per process;
+# core.throttling.CacheBucketBackend shares them through a cache alias.
+THROTTLE_BUCKET_BACKEND = {
+    'BACKEND': 'core.throttling.MemoryBucketBackend',
+    'OPTIONS': {},
+}
+
+# Phone numbers are stored in E.164 (core.phones). Numbers entered without
+# a country code are national numbers of DEFAULT_COUNTRY_CODE. The Bloom
+# filter of registered numbers answers "not registered" without a query;
+# size BLOOM_CAPACITY above the expected user count.
+PHONE_NUMBERS = {
+    'DEFAULT_COUNTRY_CODE': os.environ.get('PHONE_DEFAULT_COUNTRY_CODE', '91'),
+    'NATIONAL_NUMBER_LENGTH': 10,
+    'BLOOM_CAPACITY': int(os.environ.get('PHONE_BLOOM_CAPACITY', 1_000_000)),
+    'BLOOM_ERROR_RATE': 0.001,
+    'REFRESH_SECONDS': 300,
+}
+
+# OTP challenges (pending registrations, login codes, attempt counters),
+# kept in the default cache, off the primary database. register/verify and
+# send-otp/login may hit different workers, so a multi-worker deployment
+# needs a shared cache (CACHE_URL above). Without one,
+# core.otp_store.DatabaseChallengeStore shares them through the primary
+# database at the cost of writes on every issue and verify;
+# MemoryChallengeStore is per process like LocMemCache.
+OTP_CHALLENGE_STORE = {
+    'BACKEND': 'core.otp_store.CacheChallengeStore',
+    'OPTIONS': {
+        'cache_alias': 'default',
+        'ttl': 300,
+        'max_attempts': 5,
+    },
+}
+
+# Stateless login OTPs (core.otp_tokens). When ENABLED, send-otp and
+# parent-send-otp return a signed `challenge` that login and parent-login
+# verify without the challenge store; every worker needs the same
+# SECRET_KEY (defaults to settings.SECRET_KEY). Reuse and wrong guesses are
+# tracked per process in a cache of REPLAY_CACHE_SIZE challenges.
+OTP_SIGNED_CHALLENGES = {
+    'ENABLED': env_flag(os.environ, 'OTP_SIGNED_CHALLENGES'),
+    'TTL': 300,
+    'MAX_ATTEMPTS': 5,
+    'REPLAY_CACHE_SIZE': 100000,
+}
+
+# In-process vehicle type/college/timing cache (core.reference) used when
+# mapping drivers, importing records, validating vehicle_type and serving
+# api/reference-data. TIMEOUT bounds how long another worker can keep an id
+# after a row is renamed or deleted; HTTP_MAX_AGE is the endpoint's
+# Cache-Control max-age.
+REFERENCE_CACHE = {
+    'MAX_ENTRIES': 512,
+    'TIMEOUT': 300,
+    'HTTP_MAX_AGE': 300,
+}
+
+# Per-route request metrics (core.metrics), served at api/metrics. SAMPLE_RATE
+# of requests also record SQL and non-SQL timings; those made by staff or
+# with the token get a Server-Timing header. METRICS_TOKEN lets a scraper
+# authenticate with X-Metrics-Token.
+REQUEST_METRICS = {
+    'SAMPLE_RATE': float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', 0.05)),
+    'SERVER_TIMING': True,
+}
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# OTP SMS delivery (core.sms). Messages are queued by the views and sent in
+# batches by background threads. Swap PROVIDER for core.sms.HTTPSMSProvider
+# (e.g. against `manage.py run_sms_standin`) or core.sms.FileSMSProvider.
+OTP_DELIVERY = {
+    'PROVIDER': 'core.sms.LogSMSProvider',
+    'OPTIONS': {},
+    'WORKERS': 2,
+    'BATCH_SIZE': 50,
+    'BATCH_WAIT': 0.05,
+    'MAX_RETRIES': 3,
+    'RETRY_BACKOFF': 0.5,
+    'QUEUE_SIZE': 10000,
 }
 
 # Internationalization
@@ -96,5 +233,26 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Profile pictures (core.images): upload cap and the thumbnails generated in
+# the background, as {name: longest side in px}
+PROFILE_PIC_MAX_BYTES = 10 * 1024 * 1024
+PROFILE_THUMBNAIL_FORMAT = 'WEBP'
+PROFILE_THUMBNAIL_SIZES = {
+    'small': 96,
+    'medium': 256,
+    'large': 720,
+}
+
+
 
 
+# Parent registration uploads (core.uploads) are streamed to this directory
+# in UPLOAD_CHUNK_SIZE pieces and kept until the OTP is verified; resumable
+# upload sessions older than UPLOAD_SPOOL_MAX_AGE seconds are purged. Open
+# sessions are capped per client address and in total (count and declared bytes).
+UPLOAD_SPOOL_DIR = os.path.join(BASE_DIR, "spool")
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_SPOOL_MAX_AGE = 24 * 3600
+UPLOAD_MAX_SESSIONS_PER_CLIENT = 5
+UPLOAD_MAX_OPEN_SESSIONS = 1000
+UPLOAD_MAX_OPEN_BYTES = 1024 * 1024 * 1024
@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+def user_cache():
+    return caches[getattr(settings, 'JWT_USER_CACHE_ALIAS', 'default')]
+
+
+def user_version_key(user_id):
+    return f"auth:user-version:{user_id}"
+
+
+def bump_user_version(user_id):
+    """
+    Make every cached copy of this user unreachable. Called from the
+    CustomUser save/delete signals.
+    """
+    user_cache().set(user_version_key(user_id), time.time_ns(), None)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the user from a short-TTL cache keyed by
+    user id and the user's cache version, instead of querying CustomUser on
+    every request. Saving or deleting the user bumps the version (see
+    core.signals), so changes such as is_active take effect on the next
+    request in every process sharing the cache; with a per-process cache
+    other workers may see the old row for up to JWT_USER_CACHE_TIMEOUT.
+    """
+
+    def get_user(self, validated_token):
+        # Password-based revocation needs the live row
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        cache = user_cache()
+        version_key = user_version_key(user_id)
+        version = cache.get(version_key)
+        if version is None:
+            # Evicted or never set: users cached before the eviction must not
+            # be served again, so start a new version rather than assume one
+            cache.add(version_key, time.time_ns(), None)
+            version = cache.get(version_key)
+            if version is None:
+                return super().get_user(validated_token)
+        key = f"auth:user:{user_id}:{version}"
+
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(key, user, getattr(settings, 'JWT_USER_CACHE_TIMEOUT', 60))
+        elif api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
@@ -0,0 +1,68 @@
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+
+@contextmanager
+def scratch_database(test_name=None):
+    """
+    Run the block against a throwaway test database (the same one
+    `manage.py test` builds), so benchmarks never touch db.sqlite3.
+    Replica aliases are pointed at it too, as the test runner does.
+    `test_name` overrides the test database name, e.g. to put the SQLite
+    file in a private directory.
+    """
+    old_name = connection.settings_dict['NAME']
+    old_test = connection.settings_dict['TEST']
+    if test_name:
+        connection.settings_dict['TEST'] = {**old_test, 'NAME': test_name}
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    mirrors = {}
+    for alias in connections:
+        if connections[alias].settings_dict['TEST'].get('MIRROR') == DEFAULT_DB_ALIAS:
+            mirrors[alias] = connections[alias].settings_dict
+            connections[alias].close()
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+    try:
+        yield
+    finally:
+        for alias, settings_dict in mirrors.items():
+            connections[alias].close()
+            connections[alias].settings_dict = settings_dict
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict['TEST'] = old_test
+
+
+class QueryCounter:
+    """
+    execute_wrapper that counts statements. Unlike CaptureQueriesContext it
+    does not depend on DEBUG or on the bounded connection.queries log.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(fn, repeat=5):
+    """
+    Call fn() once to count queries, then `repeat` more times for timing.
+    Returns (query_count, best_seconds, result_of_last_call).
+    """
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        # Every alias, so reads routed to a replica are counted too
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        result = fn()
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return counter.count, best, result
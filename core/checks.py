@@ -0,0 +1,36 @@
+"""
+Deployment checks, run by `manage.py check --deploy`.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Cache backends whose entries are not shared between worker processes
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_challenge_store_shared(app_configs, **kwargs):
+    """
+    OTP challenges must be visible to every worker: a code issued by one
+    must verify on another.
+    """
+    from .otp_store import CacheChallengeStore, MemoryChallengeStore, get_challenge_store
+
+    store = get_challenge_store()
+    hint = (
+        "Set CACHE_URL to a shared cache such as Redis, or use "
+        "core.otp_store.DatabaseChallengeStore; ignore this with a single worker process."
+    )
+    if isinstance(store, MemoryChallengeStore):
+        return [Warning("OTP challenges are kept per process (MemoryChallengeStore).", hint=hint, id='core.W001')]
+    if isinstance(store, CacheChallengeStore):
+        backend = settings.CACHES[store.cache_alias]['BACKEND']
+        if backend in PROCESS_LOCAL_CACHES:
+            return [Warning(
+                f"OTP challenges are kept in the {store.cache_alias!r} cache, which is per process ({backend}).",
+                hint=hint, id='core.W001',
+            )]
+    return []
@@ -0,0 +1,246 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+from .models import College, college_key
+
+logger = logging.getLogger(__name__)
+
+# Below this many characters a query only matches by prefix
+MIN_TRIGRAM_QUERY = 3
+PREFIX_SCORE = 2.0
+WORD_PREFIX_SCORE = 1.0
+# Fuzzy candidates come from the rarest query trigrams; stop adding
+# postings once this many ids have been counted
+MAX_SCANNED = 2000
+# Per requested result, candidates ranked on the rare trigrams that get an
+# exact similarity
+CANDIDATES_PER_RESULT = 2
+# Fuzzy-only matches below this trigram similarity are dropped
+MIN_SIMILARITY = 0.1
+
+
+def trigrams(key):
+    """Trigrams of a college_key(), padded so word starts and ends count."""
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(query_grams, key):
+    grams = trigrams(key)
+    shared = len(query_grams & grams)
+    return shared / (len(query_grams) + len(grams) - shared)
+
+
+def later_words(key):
+    """'st xavier college' -> ['xavier college', 'college']"""
+    words = key.split(' ')
+    return [' '.join(words[i:]) for i in range(1, len(words))]
+
+
+class CollegeIndex:
+    """
+    In-memory typeahead index over active colleges. Sorted lists of the
+    names and of every later word of each name answer prefix queries
+    ("xav" finds "St Xavier College") with bisect; an inverted trigram index
+    finds fuzzy matches ("colege of enginering"). Fuzzy candidates are
+    gathered from the query's rarest trigrams first, so common trigrams
+    such as "col" do not make a search scan the whole index. Updates are
+    incremental: add() and remove() touch only that college's entries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.names = {}
+        self._keys = {}
+        self._name_prefixes = []
+        self._word_prefixes = []
+        self._postings = {}
+        self.built = time.monotonic()
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Index (college_id, college_name) pairs."""
+        index = cls()
+        for college_id, name in rows:
+            index._add(college_id, name, presorted=False)
+        index._name_prefixes.sort()
+        index._word_prefixes.sort()
+        return index
+
+    @classmethod
+    def build(cls):
+        return cls.from_rows(College.objects.filter(is_active=True).values_list('id', 'college_name').iterator())
+
+    def __len__(self):
+        return len(self.names)
+
+    def _add(self, college_id, name, presorted=True):
+        key = college_key(name)
+        self.names[college_id] = name
+        self._keys[college_id] = key
+        entries = [(self._name_prefixes, key)] + [(self._word_prefixes, suffix) for suffix in later_words(key)]
+        for table, entry in entries:
+            if presorted:
+                insort(table, (entry, college_id))
+            else:
+                table.append((entry, college_id))
+        for gram in trigrams(key):
+            self._postings.setdefault(gram, set()).add(college_id)
+
+    def _remove(self, college_id):
+        key = self._keys.pop(college_id, None)
+        if key is None:
+            return
+        del self.names[college_id]
+        entries = [(self._name_prefixes, key)] + [(self._word_prefixes, suffix) for suffix in later_words(key)]
+        for table, entry in entries:
+            position = bisect_left(table, (entry, college_id))
+            if position < len(table) and table[position] == (entry, college_id):
+                del table[position]
+        for gram in trigrams(key):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(college_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def add(self, college_id, name):
+        with self._lock:
+            self._remove(college_id)
+            self._add(college_id, name)
+
+    def remove(self, college_id):
+        with self._lock:
+            self._remove(college_id)
+
+    def _prefix_matches(self, table, key, limit, found):
+        position = bisect_left(table, (key,))
+        added = 0
+        while position < len(table) and added < limit:
+            entry, college_id = table[position]
+            if not entry.startswith(key):
+                break
+            if college_id not in found:
+                found.add(college_id)
+                added += 1
+                yield college_id
+            position += 1
+
+    def _fuzzy_candidates(self, query_grams, count):
+        postings = sorted((self._postings.get(gram, ()) for gram in query_grams), key=len)
+        postings = [posting for posting in postings if posting]
+        if not postings:
+            return []
+        if len(postings[0]) > MAX_SCANNED:
+            # Every trigram is common: require the rarest ones
+            candidates = postings[0]
+            for posting in postings[1:]:
+                if len(candidates) <= MAX_SCANNED:
+                    break
+                candidates = candidates & posting
+            return list(candidates)[:count]
+        shared = Counter()
+        scanned = 0
+        for posting in postings:
+            if scanned + len(posting) > MAX_SCANNED:
+                break
+            shared.update(posting)
+            scanned += len(posting)
+        return [college_id for college_id, _ in shared.most_common(count)]
+
+    def search(self, query, limit=10):
+        """Up to `limit` (college_id, college_name, score) tuples, best first."""
+        key = college_key(query)
+        if not key:
+            return []
+        query_grams = trigrams(key)
+        with self._lock:
+            scores = {}
+            found = set()
+            for college_id in self._prefix_matches(self._name_prefixes, key, limit, found):
+                scores[college_id] = PREFIX_SCORE
+            for college_id in self._prefix_matches(self._word_prefixes, key, limit - len(scores), found):
+                scores[college_id] = WORD_PREFIX_SCORE
+            if len(key) >= MIN_TRIGRAM_QUERY and len(scores) < limit:
+                for college_id in self._fuzzy_candidates(query_grams, limit * CANDIDATES_PER_RESULT):
+                    scores.setdefault(college_id, 0.0)
+            ranked = [
+                (college_id, self.names[college_id], score + similarity(query_grams, self._keys[college_id]))
+                for college_id, score in scores.items()
+            ]
+        ranked = [row for row in ranked if row[2] >= MIN_SIMILARITY]
+        ranked.sort(key=lambda row: (-row[2], len(row[1]), row[1]))
+        return [(college_id, name, round(score, 3)) for college_id, name, score in ranked[:limit]]
+
+    def name(self, college_id):
+        with self._lock:
+            return self.names.get(college_id)
+
+
+_college_index = None
+_college_index_lock = threading.Lock()
+_rebuilding = False
+
+
+def _rebuild_in_background():
+    global _college_index, _rebuilding
+    try:
+        _college_index = CollegeIndex.build()
+    except Exception:
+        logger.exception("Rebuilding the college search index failed")
+    finally:
+        connections.close_all()
+        _rebuilding = False
+
+
+def get_college_index():
+    """
+    The process's CollegeIndex. Saves and deletes in this process update it
+    (core.signals). After REFERENCE_CACHE['TIMEOUT'] seconds it is rebuilt
+    in a background thread, to pick up changes made by other workers, while
+    searches keep using the current one.
+    """
+    global _college_index, _rebuilding
+    index = _college_index
+    if index is None:
+        with _college_index_lock:
+            if _college_index is None:
+                _college_index = CollegeIndex.build()
+            return _college_index
+    timeout = {'TIMEOUT': 300, **getattr(settings, 'REFERENCE_CACHE', {})}['TIMEOUT']
+    if index.built + timeout <= time.monotonic():
+        with _college_index_lock:
+            if not _rebuilding:
+                _rebuilding = True
+                threading.Thread(target=_rebuild_in_background, name='college-index', daemon=True).start()
+    return index
+
+
+def reset_college_index():
+    global _college_index
+    _college_index = None
+
+
+def college_changed(college_id, name=None, is_active=False):
+    """Apply a committed College save or delete to the index, if it has been built."""
+    index = _college_index
+    if index is None:
+        return
+    if is_active:
+        index.add(college_id, name)
+    else:
+        index.remove(college_id)
+
+
+@receiver(setting_changed)
+def reset_college_index_on_setting(setting, **kwargs):
+    if setting in ('REFERENCE_CACHE', 'DATABASES'):
+        reset_college_index()
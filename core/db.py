@@ -0,0 +1,137 @@
+"""
+Database configuration from the environment.
+
+Imported by DMS/settings.py, so it must not touch django.conf.settings.
+
+    DATABASE_URL           primary, e.g. postgres://user:pass@db:5432/dms
+                           or sqlite:///db.sqlite3 (relative to BASE_DIR)
+    DATABASE_REPLICA_URLS  comma-separated read replicas, aliased
+                           replica_1, replica_2, ...
+    DB_CONN_MAX_AGE        seconds a connection is kept open (default 60)
+    DB_POOL                "1" to use psycopg's connection pool on
+                           PostgreSQL instead of persistent connections
+    DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE
+    DB_SQLITE_HIGH_CONCURRENCY
+                           "1" to run SQLite in WAL mode with a busy timeout
+                           and IMMEDIATE transactions (see sqlite_options);
+                           also enables core.write_queue
+    DB_SQLITE_BUSY_TIMEOUT seconds to wait for the write lock (default 5)
+"""
+import os
+import tempfile
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
+
+ENGINES = {
+    'sqlite': 'django.db.backends.sqlite3',
+    'postgres': 'django.db.backends.postgresql',
+    'postgresql': 'django.db.backends.postgresql',
+    'mysql': 'django.db.backends.mysql',
+}
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def env_flag(environ, name):
+    return environ.get(name, '').lower() in TRUE_VALUES
+
+
+def sqlite_options(busy_timeout=5, mmap_bytes=128 * 1024 * 1024):
+    """
+    OPTIONS for SQLite under concurrent writers:
+      - WAL, so readers never block the writer and vice versa;
+      - synchronous=NORMAL, which in WAL mode is still durable against
+        application crashes and skips an fsync per commit;
+      - memory-mapped reads;
+      - a busy timeout instead of failing at once with "database is locked";
+      - IMMEDIATE transactions, which take the write lock at BEGIN. A
+        deferred transaction that reads first and then tries to write cannot
+        wait for the lock and fails straight away.
+    """
+    return {
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            f'PRAGMA mmap_size={mmap_bytes};'
+        ),
+        'timeout': busy_timeout,
+        'transaction_mode': 'IMMEDIATE',
+    }
+
+
+def parse_database_url(url, base_dir=None, conn_max_age=60, pool=None, sqlite=None):
+    """
+    One DATABASES entry from a URL. Query string parameters become
+    OPTIONS (e.g. ?sslmode=require). `pool` is a dict of psycopg pool
+    options, only used for PostgreSQL; `sqlite` is OPTIONS for SQLite.
+    """
+    scheme, _, rest = url.partition('://')
+    if scheme not in ENGINES:
+        raise ImproperlyConfigured(f"Unsupported database URL scheme: {scheme!r}")
+    config = {
+        'ENGINE': ENGINES[scheme],
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': conn_max_age != 0,
+    }
+
+    if scheme == 'sqlite':
+        # sqlite:///relative/path or sqlite:////absolute/path
+        path = rest[1:] if rest.startswith('/') else rest
+        if base_dir is not None and not os.path.isabs(path):
+            path = os.path.join(base_dir, path)
+        config['NAME'] = path
+        if sqlite:
+            config['OPTIONS'] = dict(sqlite)
+        return config
+
+    parts = urlsplit(url)
+    config.update({
+        'NAME': unquote(parts.path.lstrip('/')),
+        'USER': unquote(parts.username or ''),
+        'PASSWORD': unquote(parts.password or ''),
+        'HOST': parts.hostname or '',
+        'PORT': str(parts.port or ''),
+        'OPTIONS': dict(parse_qsl(parts.query)),
+    })
+    if pool and config['ENGINE'] == ENGINES['postgres']:
+        # Django's pool replaces persistent connections; the two cannot be combined
+        config['OPTIONS']['pool'] = pool
+        config['CONN_MAX_AGE'] = 0
+        config['CONN_HEALTH_CHECKS'] = False
+    return config
+
+
+def database_settings(environ, default_url, base_dir=None):
+    """
+    Returns (DATABASES, replica aliases). Replicas mirror the primary in
+    tests, so the test runner builds a single database for all aliases.
+    A SQLite test database is a file rather than SQLite's shared in-memory
+    database, which fails concurrent writers with "table is locked"
+    instead of letting them wait: core.tests races requests from threads.
+    """
+    conn_max_age = int(environ.get('DB_CONN_MAX_AGE', 60))
+    pool = None
+    if env_flag(environ, 'DB_POOL'):
+        pool = {
+            'min_size': int(environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(environ.get('DB_POOL_MAX_SIZE', 10)),
+        }
+    sqlite = None
+    if env_flag(environ, 'DB_SQLITE_HIGH_CONCURRENCY'):
+        sqlite = sqlite_options(busy_timeout=float(environ.get('DB_SQLITE_BUSY_TIMEOUT', 5)))
+
+    databases = {
+        'default': parse_database_url(environ.get('DATABASE_URL', default_url), base_dir, conn_max_age, pool, sqlite),
+    }
+    if databases['default']['ENGINE'] == ENGINES['sqlite']:
+        # One file per run, so concurrent test runs on a host don't share it
+        databases['default']['TEST'] = {'NAME': os.path.join(tempfile.gettempdir(), f'test_dms_{os.getpid()}.sqlite3')}
+    replicas = []
+    urls = [url.strip() for url in environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    for number, url in enumerate(urls, start=1):
+        alias = f'replica_{number}'
+        databases[alias] = parse_database_url(url, base_dir, conn_max_age, pool, sqlite)
+        databases[alias]['TEST'] = {'MIRROR': 'default'}
+        replicas.append(alias)
+    return databases, replicas
@@ -0,0 +1,106 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Children, DriverProfileMapping
+
+# (column name, ORM lookup) pairs for each export
+CHILDREN_EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('full_name', 'full_name'),
+    ('dob', 'dob'),
+    ('age', 'age'),
+    ('children_class', 'children_class'),
+    ('contact_person_name', 'contact_person_name'),
+    ('contact_person_number', 'contact_person_number'),
+    ('alternate_number', 'alternate_number'),
+    ('parent', 'parent_id'),
+    ('parent_phone', 'parent__phone_number'),
+    ('college', 'college_id'),
+    ('college_name', 'college__college_name'),
+    ('collegetiming', 'collegetiming_id'),
+    ('start_shift', 'collegetiming__start_shift'),
+    ('end_shift', 'collegetiming__end_shift'),
+]
+
+DRIVER_EXPORT_FIELDS = [
+    ('mapping', 'id'),
+    ('profile', 'driver_id'),
+    ('user', 'driver__user_id'),
+    ('phone_number', 'driver__user__phone_number'),
+    ('full_name', 'driver__full_name'),
+    ('dob', 'driver__dob'),
+    ('email', 'driver__email'),
+    ('licence_no', 'driver__licence_no'),
+    ('licence_exp_date', 'driver__licence_exp_date'),
+    ('vehicle_type', 'driver__vehicle_type__vehicle_name'),
+    ('vehicle_no', 'driver__vehicle_no'),
+    ('college', 'college_id'),
+    ('college_name', 'college__college_name'),
+    ('timing', 'timing_id'),
+    ('start_shift', 'timing__start_shift'),
+    ('end_shift', 'timing__end_shift'),
+]
+
+EXPORTS = {
+    'children': (Children, CHILDREN_EXPORT_FIELDS),
+    'drivers': (DriverProfileMapping, DRIVER_EXPORT_FIELDS),
+}
+
+# Rows are grouped into pieces of roughly this many bytes before being yielded
+FLUSH_BYTES = 64 * 1024
+
+
+class Echo:
+    """File-like object whose write() just hands the line back (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(kind, college_id, chunk_size=2000):
+    """
+    Yield tuples for every row of `kind` in the college, streamed from the
+    database `chunk_size` rows at a time.
+    """
+    model, fields = EXPORTS[kind]
+    return (
+        model.objects
+        .filter(college_id=college_id)
+        .order_by('id')
+        .values_list(*[lookup for _, lookup in fields])
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def stream_export(kind, college_id, fmt='csv', chunk_size=2000):
+    """
+    Yield the export as text pieces. The CSV header goes out before the query
+    runs, so clients start receiving bytes immediately; memory use does not
+    depend on the number of rows.
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export type: {kind}")
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    columns = [column for column, _ in EXPORTS[kind][1]]
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        encode = writer.writerow
+    else:
+        encoder = DjangoJSONEncoder()
+        encode = lambda row: encoder.encode(dict(zip(columns, row))) + "\n"
+
+    pending, size = [], 0
+    for row in export_rows(kind, college_id, chunk_size):
+        line = encode(row)
+        pending.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield "".join(pending)
+            pending, size = [], 0
+    if pending:
+        yield "".join(pending)
@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from django.template.defaultfilters import filesizeformat
+from rest_framework.exceptions import ValidationError
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THUMBNAIL_SIZES = {
+    'small': 96,
+    'medium': 256,
+    'large': 720,
+}
+
+# Thumbnails are generated on this pool, never on the request thread;
+# it is started by the first upload, not at import
+_executor = None
+_executor_lock = threading.Lock()
+
+# Thumbnail names seen in storage. Thumbnails are only ever replaced, never
+# removed, so a name stays valid once it has been seen.
+MAX_KNOWN_THUMBNAILS = 10000
+_known_thumbnails = set()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumbnails')
+    return _executor
+
+
+def thumbnail_sizes():
+    return getattr(settings, 'PROFILE_THUMBNAIL_SIZES', DEFAULT_THUMBNAIL_SIZES)
+
+
+def thumbnail_format():
+    fmt = getattr(settings, 'PROFILE_THUMBNAIL_FORMAT', 'WEBP').upper()
+    if fmt == 'WEBP' and not features.check('webp'):
+        fmt = 'JPEG'
+    return fmt
+
+
+def thumbnail_name(original_name, size_name):
+    stem, _ = os.path.splitext(original_name)
+    extension = 'webp' if thumbnail_format() == 'WEBP' else 'jpg'
+    return f"thumbnails/{stem}-{size_name}.{extension}"
+
+
+def thumbnail_exists(storage, name):
+    if name in _known_thumbnails:
+        return True
+    if not storage.exists(name):
+        return False
+    if len(_known_thumbnails) >= MAX_KNOWN_THUMBNAILS:
+        _known_thumbnails.clear()
+    _known_thumbnails.add(name)
+    return True
+
+
+def thumbnail_urls(field_file):
+    """
+    {size name: URL} for an image field. Sizes whose thumbnail has not been
+    generated yet point at the original image, so every URL resolves.
+    Storage is checked once per size until the thumbnail is seen.
+    """
+    if not field_file:
+        return None
+    storage = field_file.storage
+    urls = {}
+    for size_name in thumbnail_sizes():
+        name = thumbnail_name(field_file.name, size_name)
+        urls[size_name] = storage.url(name if thumbnail_exists(storage, name) else field_file.name)
+    return urls
+
+
+def validate_image_size(upload):
+    """Reject uploads above settings.PROFILE_PIC_MAX_BYTES."""
+    limit = getattr(settings, 'PROFILE_PIC_MAX_BYTES', 10 * 1024 * 1024)
+    if upload is not None and upload.size > limit:
+        raise ValidationError(f"Image must be at most {filesizeformat(limit)}.")
+    return upload
+
+
+def generate_thumbnails(field_file, overwrite=False):
+    """
+    Decode the image once, apply and drop its EXIF data, and save one
+    downscaled copy per configured size. Returns the names written.
+    """
+    storage = field_file.storage
+    fmt = thumbnail_format()
+    written = []
+
+    with field_file.open('rb') as source, Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA') or fmt == 'JPEG':
+            image = image.convert('RGB')
+
+        for size_name, size in sorted(thumbnail_sizes().items(), key=lambda item: -item[1]):
+            name = thumbnail_name(field_file.name, size_name)
+            if storage.exists(name):
+                if not overwrite:
+                    continue
+                storage.delete(name)
+            # Sizes go from largest to smallest so each resize starts from a smaller image
+            image.thumbnail((size, size), Image.LANCZOS)
+            buffer = BytesIO()
+            # No exif= argument, so no metadata (GPS, camera, ...) is written
+            image.save(buffer, fmt, quality=80, optimize=True)
+            written.append(storage.save(name, ContentFile(buffer.getvalue())))
+
+    return written
+
+
+def _generate_in_background(model, pk, field_name):
+    try:
+        instance = model._default_manager.get(pk=pk)
+        field_file = getattr(instance, field_name)
+        if field_file and generate_thumbnails(field_file):
+            # Responses cached for this version still point at the original image
+            if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+                model._default_manager.filter(pk=pk).update(updated_at=timezone.now())
+    except Exception:
+        logger.exception(f"Thumbnail generation failed for {model.__name__} {pk}")
+
+
+def schedule_thumbnails(instance, field_name='profile_pic'):
+    """Generate thumbnails for `instance` in the background once the transaction commits."""
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return
+    if field_file.storage.exists(thumbnail_name(field_file.name, next(iter(thumbnail_sizes())))):
+        return
+    model, pk = type(instance), instance.pk
+    transaction.on_commit(lambda: get_executor().submit(_generate_in_background, model, pk, field_name))
@@ -0,0 +1,363 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+from rest_framework import serializers
+
+from .models import Children, College, CollegeTiming, CustomUser, DriverProfileMapping, Profile, VehicleType, college_key
+from .phones import InvalidPhoneNumber, get_registered_phones, phone_key
+from .reference import get_reference_cache
+from .serializers import ChildrenImportSerializer, DriverImportSerializer
+
+MAX_ERROR_SAMPLES = 50
+# Larger chunks are cut down to this: a chunk is held in memory and written in one transaction
+MAX_CHUNK_SIZE = 5000
+
+
+class InvalidRecord:
+    """Stands in for a record that could not be parsed; the importers reject its line."""
+
+    def __init__(self, detail):
+        self.detail = detail
+
+
+def iter_records(stream, fmt):
+    """
+    Yield (line_number, dict) pairs from a binary or text stream, one record
+    at a time. `fmt` is 'csv' (with a header row) or 'ndjson'. An NDJSON
+    line that is not a JSON object comes out as an InvalidRecord, so one
+    bad line does not stop the rest of the file.
+    """
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield line_number, InvalidRecord(f"Invalid JSON: {exc}")
+                continue
+            if not isinstance(record, dict):
+                yield line_number, InvalidRecord("Each line must be a JSON object.")
+                continue
+            yield line_number, record
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def format_from_name(filename):
+    return 'ndjson' if filename.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def record_phone_key(value):
+    """phone_key of a cell, or None when it is not a phone number."""
+    try:
+        return phone_key(value)
+    except InvalidPhoneNumber:
+        return None
+
+
+def clean_record(record):
+    """Drop empty cells so optional fields are treated as missing, not blank."""
+    return {key: value for key, value in record.items() if key and value not in ('', None)}
+
+
+def clean_records(chunk, report):
+    """Count the chunk in `report`, reject its unparsable lines and clean the rest."""
+    report.rows += len(chunk)
+    records = []
+    for line_number, record in chunk:
+        if isinstance(record, InvalidRecord):
+            report.reject(line_number, {'non_field_errors': [record.detail]})
+        else:
+            records.append((line_number, clean_record(record)))
+    return records
+
+
+class ReferenceTable:
+    """
+    In-memory lookup of colleges, timings and vehicle types for one import.
+    All three tables are small, so they are loaded once up front; colleges
+    and timings missing from the table are resolved through the shared
+    reference cache (core.reference) the first time they are referenced,
+    like save_driver_profile_mapping does. Resolve them inside the chunk's
+    transaction, so new colleges and timings are only kept when the chunk
+    is, and call rollback() when it is not.
+    """
+
+    def __init__(self):
+        self.college_ids = set()
+        self.colleges = {}
+        for college_id, name in College.objects.filter(is_active=True).values_list('id', 'college_name'):
+            self.college_ids.add(college_id)
+            self.colleges.setdefault(college_key(name), college_id)
+        self.timing_ids = set()
+        self.timings = {}
+        for timing_id, start, end in CollegeTiming.objects.values_list('id', 'start_shift', 'end_shift'):
+            self.timing_ids.add(timing_id)
+            self.timings.setdefault((start, end), timing_id)
+        self.vehicle_types = {}
+        for vehicle_id, name in VehicleType.objects.filter(is_active=True).values_list('id', 'vehicle_name'):
+            self.vehicle_types[str(vehicle_id)] = vehicle_id
+            self.vehicle_types.setdefault(name.casefold(), vehicle_id)
+        self.time_field = serializers.TimeField()
+        self.created = []
+
+    def commit(self):
+        self.created = []
+
+    def rollback(self):
+        """Forget the colleges and timings resolved since the last commit()."""
+        for ids, table, key in self.created:
+            ids.discard(table.pop(key))
+        self.created = []
+
+    def college(self, value):
+        value = str(value).strip()
+        if not value:
+            raise serializers.ValidationError({'college': "Provide college or college_name."})
+        if value.isdigit():
+            if int(value) not in self.college_ids:
+                raise serializers.ValidationError({'college': f"Unknown college id {value}."})
+            return int(value)
+        key = college_key(value)
+        if key not in self.colleges:
+            college_id = get_reference_cache().college_id(value)
+            self.college_ids.add(college_id)
+            self.colleges[key] = college_id
+            self.created.append((self.college_ids, self.colleges, key))
+        return self.colleges[key]
+
+    def timing(self, value=None, start=None, end=None):
+        if value is not None:
+            if not str(value).isdigit() or int(value) not in self.timing_ids:
+                raise serializers.ValidationError({'collegetiming': f"Unknown college timing id {value}."})
+            return int(value)
+        if start is None or end is None:
+            raise serializers.ValidationError({'collegetiming': "Provide collegetiming or start_shift and end_shift."})
+        key = (self.time_field.to_internal_value(start), self.time_field.to_internal_value(end))
+        if key not in self.timings:
+            timing_id = get_reference_cache().timing_id(*key)
+            self.timing_ids.add(timing_id)
+            self.timings[key] = timing_id
+            self.created.append((self.timing_ids, self.timings, key))
+        return self.timings[key]
+
+    def vehicle_type(self, value):
+        try:
+            return self.vehicle_types[str(value).strip().casefold()]
+        except KeyError:
+            raise serializers.ValidationError({'vehicle_type': f"Unknown vehicle type {value}."})
+
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows = 0
+        self.created = 0
+        self.rejected = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def reject(self, line_number, detail):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERROR_SAMPLES:
+            self.errors.append({'line': line_number, 'errors': detail})
+
+    def reject_chunk(self, line_numbers, exc):
+        """Reject the rows of a chunk whose transaction failed."""
+        for line_number in line_numbers:
+            self.reject(line_number, {'non_field_errors': [f"Chunk was not saved: {exc}"]})
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            'kind': self.kind,
+            'rows': self.rows,
+            'created': self.created,
+            'rejected': self.rejected,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed) if elapsed else 0,
+            'errors': self.errors,
+        }
+
+
+def chunked(records, size):
+    if size < 1:
+        raise ValueError("chunk_size must be at least 1.")
+    size = min(size, MAX_CHUNK_SIZE)
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_children(stream, fmt='csv', chunk_size=1000, progress=None):
+    """
+    Stream Children rows into the database.
+
+    Columns: parent (user id) or parent_phone, college (id or name),
+    collegetiming (id) or start_shift + end_shift, and the Children fields.
+    Only one chunk is held in memory at a time; each chunk is written with
+    one bulk_create inside its own transaction.
+    """
+    refs = ReferenceTable()
+    report = ImportReport('children')
+    # One instance validates every row, so its fields are only built once
+    serializer = ChildrenImportSerializer()
+
+    for chunk in chunked(iter_records(stream, fmt), chunk_size):
+        records = clean_records(chunk, report)
+
+        # Resolve parents for the whole chunk in one query
+        phone_keys = {record_phone_key(record['parent_phone']) for _, record in records if 'parent_phone' in record}
+        phone_keys.discard(None)
+        parent_ids = {int(record['parent']) for _, record in records if str(record.get('parent', '')).isdigit()}
+        parents_by_phone = dict(
+            CustomUser.objects.filter(phone_key__in=phone_keys).values_list('phone_key', 'id')
+        ) if phone_keys else {}
+        known_parent_ids = set(
+            CustomUser.objects.filter(id__in=parent_ids).values_list('id', flat=True)
+        ) if parent_ids else set()
+
+        lines = []
+        try:
+            # New colleges and timings are created in the chunk's transaction
+            with transaction.atomic():
+                children = []
+                for line_number, record in records:
+                    try:
+                        if 'parent_phone' in record:
+                            key = record_phone_key(record.pop('parent_phone'))
+                            if key not in parents_by_phone:
+                                raise serializers.ValidationError({'parent_phone': "No user with this phone number."})
+                            record['parent'] = parents_by_phone[key]
+                        elif not str(record.get('parent', '')).isdigit() or int(record['parent']) not in known_parent_ids:
+                            raise serializers.ValidationError({'parent': "Unknown parent id."})
+                        record['college'] = refs.college(record.get('college', record.get('college_name', '')))
+                        record['collegetiming'] = refs.timing(
+                            record.get('collegetiming'), record.get('start_shift'), record.get('end_shift')
+                        )
+                        children.append(Children(**serializer.run_validation(record)))
+                    except serializers.ValidationError as exc:
+                        report.reject(line_number, exc.detail)
+                        continue
+                    lines.append(line_number)
+
+                Children.objects.bulk_create(children)
+        except DatabaseError as exc:
+            refs.rollback()
+            report.reject_chunk(lines, exc)
+        else:
+            refs.commit()
+            report.created += len(children)
+        if progress:
+            progress(report)
+
+    return report
+
+
+def import_drivers(stream, fmt='csv', chunk_size=500, progress=None):
+    """
+    Stream drivers (user + profile + college mapping) into the database.
+
+    Columns follow the driver registration form: phone_number, full_name,
+    dob, email, licence_no, licence_exp_date, vehicle_type (id or name),
+    vehicle_no, college_name, start_shift, end_shift.
+    """
+    refs = ReferenceTable()
+    report = ImportReport('drivers')
+    serializer = DriverImportSerializer()
+
+    for chunk in chunked(iter_records(stream, fmt), chunk_size):
+        records = clean_records(chunk, report)
+
+        keys = {record_phone_key(record.get('phone_number')) for _, record in records}
+        keys.discard(None)
+        existing = set(CustomUser.objects.filter(phone_key__in=keys).values_list('phone_key', flat=True))
+
+        drivers = []
+        for line_number, record in records:
+            key = record_phone_key(record.get('phone_number'))
+            if key is not None and key in existing:
+                report.reject(line_number, {'phone_number': ["A user with this phone number already exists."]})
+                continue
+            try:
+                record['vehicle_type'] = refs.vehicle_type(record.get('vehicle_type', ''))
+            except serializers.ValidationError as exc:
+                report.reject(line_number, exc.detail)
+                continue
+
+            try:
+                data = serializer.run_validation(record)
+            except serializers.ValidationError as exc:
+                report.reject(line_number, exc.detail)
+                continue
+            existing.add(key)
+            drivers.append((line_number, data))
+
+        try:
+            with transaction.atomic():
+                # New colleges and timings are created in the chunk's transaction
+                places = [
+                    (refs.college(data['college_name']), refs.timing(start=data['start_shift'], end=data['end_shift']))
+                    for _, data in drivers
+                ]
+                users = []
+                for _, data in drivers:
+                    # bulk_create skips CustomUser.save(), which sets phone_key
+                    user = CustomUser(
+                        phone_number=data['phone_number'], phone_key=phone_key(data['phone_number']),
+                        is_driver=data['is_driver'], is_student=data['is_student'],
+                    )
+                    user.set_unusable_password()
+                    users.append(user)
+                users = CustomUser.objects.bulk_create(users)
+                profiles = Profile.objects.bulk_create([
+                    Profile(
+                        user=user,
+                        full_name=data['full_name'],
+                        dob=data['dob'],
+                        email=data['email'],
+                        licence_no=data['licence_no'],
+                        licence_exp_date=data['licence_exp_date'],
+                        vehicle_type_id=data['vehicle_type'],
+                        vehicle_no=data['vehicle_no'],
+                    )
+                    for user, (_, data) in zip(users, drivers)
+                ])
+                DriverProfileMapping.objects.bulk_create([
+                    DriverProfileMapping(driver=profile, college_id=college_id, timing_id=timing_id)
+                    for profile, (college_id, timing_id) in zip(profiles, places)
+                ])
+        except DatabaseError as exc:
+            refs.rollback()
+            report.reject_chunk([line_number for line_number, _ in drivers], exc)
+        else:
+            refs.commit()
+            registered = get_registered_phones()
+            for user in users:
+                registered.add(user.phone_key)
+            report.created += len(drivers)
+        if progress:
+            progress(report)
+
+    return report
+
+
+IMPORTERS = {
+    'children': import_children,
+    'drivers': import_drivers,
+}
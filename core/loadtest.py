@@ -0,0 +1,256 @@
+import base64
+import http.client
+import itertools
+import json
+import random
+import re
+import socket
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class JourneyError(Exception):
+    """A step answered with an unexpected status; the rest of the journey is skipped."""
+
+
+def login_body(phone_number, sent):
+    """Login request for a send-otp response, passing on its signed challenge if it has one."""
+    body = {'phone_number': phone_number, 'otp_code': sent['otp_code']}
+    if 'challenge' in sent:
+        body['challenge'] = sent['challenge']
+    return body
+
+
+def jwt_user_id(access_token):
+    """The user_id claim of a JWT, read without verifying it (the server already did)."""
+    payload = access_token.split('.')[1]
+    return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))['user_id']
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else None
+
+
+class Recorder:
+    """Latency, status and query samples per endpoint, shared by all client threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.journeys = {}
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, name, seconds, status_code, queries):
+        with self._lock:
+            entry = self.endpoints.setdefault(name, {'latencies': [], 'statuses': {}, 'queries': []})
+            entry['latencies'].append(seconds)
+            entry['statuses'][status_code] = entry['statuses'].get(status_code, 0) + 1
+            if queries is not None:
+                entry['queries'].append(queries)
+
+    def journey(self, name, ok):
+        with self._lock:
+            entry = self.journeys.setdefault(name, {'completed': 0, 'failed': 0})
+            entry['completed' if ok else 'failed'] += 1
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        endpoints = {}
+        total = errors = 0
+        for name, entry in sorted(self.endpoints.items()):
+            count = len(entry['latencies'])
+            failed = sum(n for code, n in entry['statuses'].items() if code >= 400)
+            total += count
+            errors += failed
+            endpoints[name] = {
+                'requests': count,
+                'rps': round(count / elapsed, 2),
+                'error_rate': round(failed / count, 4),
+                'statuses': {str(code): n for code, n in sorted(entry['statuses'].items())},
+                **{
+                    f'{label}_ms': round(percentile(entry['latencies'], fraction) * 1000, 2)
+                    for label, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))
+                },
+                'queries_per_request': (
+                    round(sum(entry['queries']) / len(entry['queries']), 2) if entry['queries'] else None
+                ),
+            }
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'requests': total,
+            'rps': round(total / elapsed, 2) if elapsed else 0,
+            'error_rate': round(errors / total, 4) if total else 0,
+            'journeys': dict(self.journeys),
+            'endpoints': endpoints,
+        }
+
+
+class ApiClient:
+    """One keep-alive HTTP connection per load-test thread."""
+
+    def __init__(self, base_url, recorder, timeout=30, metrics_token=None):
+        parts = urlsplit(base_url)
+        # Server-Timing, where query counts come from, is only sent with the token
+        self.metrics_token = metrics_token
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+        self.prefix = parts.path.rstrip('/')
+        self.recorder = recorder
+
+    def call(self, name, method, path, data=None, token=None, form=False, expect=(200, 201)):
+        headers = {'Accept': 'application/json'}
+        if self.metrics_token:
+            headers['X-Metrics-Token'] = self.metrics_token
+        body = None
+        if data is not None:
+            if form:
+                body = urlencode(data).encode()
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            else:
+                body = json.dumps(data).encode()
+                headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+
+        started = time.perf_counter()
+        try:
+            if self.connection.sock is None:
+                self.connection.connect()
+                # Small requests must not wait for delayed ACKs
+                self.connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connection.request(method, f'{self.prefix}{path}', body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.recorder.record(name, time.perf_counter() - started, 599, None)
+            raise JourneyError(f"{name}: connection error")
+        elapsed = time.perf_counter() - started
+
+        match = SERVER_TIMING_QUERIES.search(response.getheader('Server-Timing') or '')
+        self.recorder.record(name, elapsed, response.status, int(match.group(1)) if match else None)
+        if response.status not in expect:
+            raise JourneyError(f"{name}: HTTP {response.status}")
+        return json.loads(content) if content else None
+
+
+class Journeys:
+    """
+    User journeys built from the demo endpoints, which return the OTP in
+    their response. `refs` holds the vehicle type, college and timing ids
+    the journeys register against.
+    """
+
+    def __init__(self, refs, reads=3, seed=0):
+        self.refs = refs
+        self.reads = reads
+        self._phones = itertools.count(random.Random(seed).randrange(10 ** 8))
+        self._phones_lock = threading.Lock()
+
+    def phone_number(self):
+        with self._phones_lock:
+            return f"6{next(self._phones) % 10 ** 9:09d}"
+
+    def driver(self, client):
+        phone = self.phone_number()
+        otp = client.call('register', 'POST', '/register', {
+            'phone_number': phone, 'full_name': 'Load Driver', 'dob': '1990-01-01',
+            'email': f'{phone}@example.com', 'licence_no': f'L{phone}', 'licence_exp_date': '2030-01-01',
+            'vehicle_type': self.refs['vehicle_type'], 'vehicle_no': f'KA{phone[-6:]}',
+            'college_name': self.refs['college_name'], 'start_shift': '08:00', 'end_shift': '16:00',
+            'is_driver': True, 'is_student': False,
+        })['otp_code']
+        client.call('verify-otp', 'POST', '/verify-otp', {'phone_number': phone, 'otp_code': otp})
+        sent = client.call('send-otp', 'POST', '/send-otp', {'phone_number': phone})
+        access = client.call('login', 'POST', '/login', login_body(phone, sent))['access']
+        user_id = jwt_user_id(access)
+        for _ in range(self.reads):
+            client.call('driver-profile', 'GET', f'/driver-profile/{user_id}/', token=access)
+
+    def parent(self, client):
+        phone = self.phone_number()
+        otp = client.call('parent-register', 'POST', '/parent-register', {
+            'phone_number': phone, 'full_name': 'Load Parent', 'dob': '1985-01-01',
+            'email': f'{phone}@example.com', 'is_student': True,
+        }, form=True)['otp_code']
+        client.call('parent-verify-otp', 'POST', '/parent-verify-otp', {'phone_number': phone, 'otp_code': otp})
+        sent = client.call('parent-send-otp', 'POST', '/parent-send-otp', {'phone_number': phone})
+        access = client.call('parent-login', 'POST', '/parent-login', login_body(phone, sent))['access']
+        user_id = jwt_user_id(access)
+
+        child_ids = []
+        for number in range(2):
+            created = client.call('children/add', 'POST', '/children/add/', {
+                'parent': user_id, 'college': self.refs['college'], 'collegetiming': self.refs['timing'],
+                'full_name': f'Child {number}', 'dob': '2012-01-01', 'age': 12,
+                'contact_person_name': 'Load Parent', 'contact_person_number': phone,
+            }, token=access)
+            child_ids.append(created['crated_data']['id'])
+        for _ in range(self.reads):
+            client.call('children/list', 'GET', f'/children/list/{user_id}/', token=access)
+        client.call('children/edit', 'PATCH', f'/children/edit/{child_ids[0]}/', {'children_class': '7A'}, token=access)
+
+    def run(self, name, client, recorder):
+        try:
+            getattr(self, name)(client)
+        except JourneyError:
+            recorder.journey(name, False)
+        else:
+            recorder.journey(name, True)
+
+
+def parse_mix(text):
+    """'driver=1,parent=3' -> {'driver': 1.0, 'parent': 3.0}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def run_load(base_url, journeys, mix, users, duration=None, iterations=None, seed=0, metrics_token=None):
+    """
+    Run `users` threads, each repeatedly picking a journey by `mix` weight,
+    until `duration` seconds have passed or each thread has completed
+    `iterations` journeys. Returns the Recorder.
+    """
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration if duration else None
+    names, weights = zip(*mix.items())
+
+    def worker(number):
+        rng = random.Random(seed * 1000 + number)
+        client = ApiClient(base_url, recorder, metrics_token=metrics_token)
+        for iteration in itertools.count():
+            if iterations is not None and iteration >= iterations:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            journeys.run(rng.choices(names, weights)[0], client, recorder)
+        client.connection.close()
+
+    threads = [threading.Thread(target=worker, args=(number,), daemon=True) for number in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recorder.finished = time.perf_counter()
+    return recorder
+
+
+def compare(current, baseline):
+    """Per-endpoint (metric, baseline, current, relative change) rows for p95 latency and throughput."""
+    rows = []
+    for name, entry in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        for metric in ('p95_ms', 'rps', 'queries_per_request'):
+            if before.get(metric) and entry.get(metric) is not None:
+                rows.append((name, metric, before[metric], entry[metric], entry[metric] / before[metric] - 1))
+    return rows
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from core.bench import scratch_database
+from core.loadtest import login_body, percentile
+from core.models import College, CollegeTiming, VehicleType
+from core.views.driver import create_driver_account
+
+# Settings of the benchmarked servers: no throttles (every client shares one
+# address) and signed login challenges, so any worker can verify any login
+SERVER_SETTINGS = """\
+from DMS.settings import *  # noqa: F401,F403
+from DMS.settings import OTP_SIGNED_CHALLENGES, REST_FRAMEWORK
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {scope: '1000000/s' for scope in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']},
+}
+OTP_SIGNED_CHALLENGES = {**OTP_SIGNED_CHALLENGES, 'ENABLED': True}
+"""
+SETTINGS_MODULE = 'bench_async_auth_settings'
+BACKLOG = 2048
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def raise_open_file_limit(needed):
+    """Lift the soft open-file limit towards `needed` (children inherit it); returns the new limit."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    if soft != resource.RLIM_INFINITY and soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        soft = target
+    return soft
+
+
+class KeepAliveClient:
+    """One persistent HTTP/1.1 connection posting JSON, reconnecting after errors."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def post(self, path, data):
+        if self.writer is None:
+            await self.connect()
+        body = json.dumps(data).encode()
+        self.writer.write(
+            f'POST {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body
+        )
+        await self.writer.drain()
+
+        head = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(head[0].split(' ', 2)[1])
+        headers = {}
+        for line in head[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            payload = await self.read_chunked()
+        else:
+            payload = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, json.loads(payload) if payload else {}
+
+    async def read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            chunks.append(await self.reader.readexactly(size + 2))
+            if size == 0:
+                return b''.join(chunk[:-2] for chunk in chunks)
+
+
+class Stats:
+    """Latencies and failures per endpoint, for requests finished inside the measured window."""
+
+    def __init__(self, record_from, deadline):
+        self.record_from = record_from
+        self.deadline = deadline
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+
+    def record(self, name, started, ok):
+        finished = time.monotonic()
+        if not self.record_from <= finished <= self.deadline:
+            return
+        self.latencies[name].append(finished - started)
+        if not ok:
+            self.errors[name] += 1
+
+    def rows(self, duration):
+        names = sorted(self.latencies)
+        for name in [*names, 'all']:
+            latencies = sorted(
+                sum(self.latencies.values(), []) if name == 'all' else self.latencies[name]
+            )
+            errors = sum(self.errors.values()) if name == 'all' else self.errors[name]
+            yield name, len(latencies), len(latencies) / duration, latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync auth endpoints under gunicorn (gthread workers) with "
+        "the async ones (api/async/*) under uvicorn: many keep-alive clients "
+        "run send-otp -> login journeys for seeded drivers against each "
+        "deployment in turn, on a scratch SQLite database, and the command "
+        "reports requests per second, p50/p95/p99 latency and errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000, help="Concurrent keep-alive connections.")
+        parser.add_argument('--duration', type=float, default=30, help="Measured seconds per deployment.")
+        parser.add_argument('--warmup', type=float, default=5, help="Unmeasured seconds before that.")
+        parser.add_argument('--users', type=int, default=500, help="Drivers seeded to log in.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Server processes per deployment.")
+        parser.add_argument('--threads', type=int, default=32, help="Threads per gunicorn worker.")
+        parser.add_argument('--only', choices=['sync', 'async'], help="Benchmark one deployment.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        deployments = [name for name in ('sync', 'async') if options['only'] in (None, name)]
+        servers = {'sync': 'gunicorn', 'async': 'uvicorn'}
+        missing = [servers[name] for name in deployments if find_spec(servers[name]) is None]
+        if missing:
+            raise CommandError(f"Install {' and '.join(missing)} to run this benchmark.")
+        # Client and server ends of every connection, plus headroom
+        limit = raise_open_file_limit(2 * options['connections'] + 512)
+        if limit is not None and limit < 2 * options['connections'] + 64:
+            self.stderr.write(f"Open file limit is {limit}; some of the {options['connections']} connections may fail.")
+
+        random.seed(options['seed'])
+        results = {}
+        with ExitStack() as stack:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix='bench-async-auth-'))
+            database = os.path.join(workdir, 'bench.sqlite3')
+            stack.enter_context(scratch_database(test_name=database))
+            phone_numbers = self.seed_drivers(options['users'])
+            # The servers open the database themselves
+            connections.close_all()
+
+            with open(os.path.join(workdir, f'{SETTINGS_MODULE}.py'), 'w') as handle:
+                handle.write(SERVER_SETTINGS)
+            env = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': SETTINGS_MODULE,
+                'PYTHONPATH': os.pathsep.join(filter(None, [workdir, str(settings.BASE_DIR), os.environ.get('PYTHONPATH')])),
+                'DATABASE_URL': f'sqlite:///{database}',
+                'DB_SQLITE_HIGH_CONCURRENCY': '1',
+                'REQUEST_METRICS_SAMPLE_RATE': '0',
+            }
+            env.pop('DATABASE_REPLICA_URLS', None)
+
+            self.stdout.write(
+                f"{options['connections']} connections, {options['workers']} workers, "
+                f"{options['warmup']:.0f}s warm-up + {options['duration']:.0f}s per deployment"
+            )
+            for name in deployments:
+                port = free_port()
+                argv = self.server_argv(name, port, options)
+                with ExitStack() as server:
+                    self.start_server(server, name, argv, port, env, workdir)
+                    prefix = '/api/async/' if name == 'async' else '/api/'
+                    results[name] = asyncio.run(self.load(port, prefix, phone_numbers, options))
+
+        self.report(results, options['duration'])
+
+    def seed_drivers(self, count):
+        vehicle_type = VehicleType.objects.create(vehicle_name='Bench Van')
+        College.objects.create(college_name='Bench College', is_active=True)
+        CollegeTiming.objects.create(start_shift='08:00', end_shift='16:00')
+        phone_numbers = [f"+9170{number:08d}" for number in range(count)]
+        with transaction.atomic():
+            for phone_number in phone_numbers:
+                create_driver_account({
+                    'phone_number': phone_number, 'full_name': 'Bench Driver', 'dob': '1990-01-01',
+                    'email': 'driver@example.com', 'licence_no': 'L1', 'licence_exp_date': '2030-01-01',
+                    'vehicle_type': vehicle_type.id, 'vehicle_no': 'KA01', 'college_name': 'Bench College',
+                    'start_shift': '08:00', 'end_shift': '16:00', 'is_driver': True, 'is_student': False,
+                })
+        return phone_numbers
+
+    def server_argv(self, name, port, options):
+        if name == 'sync':
+            return [
+                sys.executable, '-m', 'gunicorn', 'DMS.wsgi:application',
+                '--bind', f'127.0.0.1:{port}', '--workers', str(options['workers']),
+                '--worker-class', 'gthread', '--threads', str(options['threads']),
+                '--worker-connections', str(options['connections']), '--backlog', str(BACKLOG),
+                '--keep-alive', '30', '--log-level', 'warning',
+            ]
+        return [
+            sys.executable, '-m', 'uvicorn', 'DMS.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port), '--workers', str(options['workers']),
+            '--backlog', str(BACKLOG), '--timeout-keep-alive', '30', '--lifespan', 'off',
+            '--no-access-log', '--log-level', 'warning',
+        ]
+
+    def start_server(self, stack, name, argv, port, env, workdir):
+        log_path = os.path.join(workdir, f'{name}.log')
+        log = stack.enter_context(open(log_path, 'wb'))
+        process = subprocess.Popen(argv, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        stack.callback(self.stop_server, process)
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                break
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                # Give every worker time to load the application
+                time.sleep(2)
+                return
+            except OSError:
+                time.sleep(0.2)
+        with open(log_path, 'rb') as handle:
+            output = handle.read().decode(errors='replace')[-2000:]
+        raise CommandError(f"{argv[2]} did not start:\n{output}")
+
+    def stop_server(self, process):
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    async def load(self, port, prefix, phone_numbers, options):
+        clients = [KeepAliveClient('127.0.0.1', port) for _ in range(options['connections'])]
+        connecting = asyncio.Semaphore(100)
+
+        async def connect(client):
+            async with connecting:
+                await client.connect()
+
+        connected = await asyncio.gather(*(connect(client) for client in clients), return_exceptions=True)
+        failed = sum(isinstance(result, Exception) for result in connected)
+        if failed:
+            self.stderr.write(f"{failed} of {len(clients)} connections failed to open; they retry during the run.")
+
+        record_from = time.monotonic() + options['warmup']
+        stats = Stats(record_from, record_from + options['duration'])
+        try:
+            await asyncio.gather(*(self.journeys(client, prefix, phone_numbers, stats) for client in clients))
+        finally:
+            for client in clients:
+                client.close()
+        return stats
+
+    async def journeys(self, client, prefix, phone_numbers, stats):
+        while time.monotonic() < stats.deadline:
+            phone_number = random.choice(phone_numbers)
+            sent = await self.request(client, stats, 'send-otp', prefix + 'send-otp', {'phone_number': phone_number})
+            if sent is not None:
+                await self.request(client, stats, 'login', prefix + 'login', login_body(phone_number, sent))
+
+    async def request(self, client, stats, name, path, data):
+        """POST and record it; returns the response data on a 200, else None."""
+        started = time.monotonic()
+        try:
+            status, response = await client.post(path, data)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            client.close()
+            stats.record(name, started, ok=False)
+            # Don't spin on a refused connection
+            await asyncio.sleep(0.1)
+            return None
+        stats.record(name, started, ok=status == 200)
+        return response if status == 200 else None
+
+    def report(self, results, duration):
+        servers = {'sync': 'gunicorn (WSGI)', 'async': 'uvicorn (ASGI)'}
+        self.stdout.write(
+            f"{'deployment':>16} | {'endpoint':>8} | {'requests':>8} | {'req/s':>8} | "
+            f"{'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | errors"
+        )
+        for name, stats in results.items():
+            for endpoint, count, rate, latencies, errors in stats.rows(duration):
+                p50, p95, p99 = (
+                    f"{percentile(latencies, fraction) * 1000:>8.1f}" if latencies else f"{'-':>8}"
+                    for fraction in (0.5, 0.95, 0.99)
+                )
+                self.stdout.write(
+                    f"{servers[name]:>16} | {endpoint:>8} | {count:>8} | {rate:>8.1f} | "
+                    f"{p50} | {p95} | {p99} | {errors}"
+                )
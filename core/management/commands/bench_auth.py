@@ -0,0 +1,70 @@
+import datetime
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.authentication import CachedJWTAuthentication
+from core.bench import scratch_database, measure
+from core.models import (
+    College, CollegeTiming, CustomUser, DriverProfileMapping, Profile, VehicleType,
+)
+from core.views.driver import DriverProfileDetailView
+
+
+class Command(BaseCommand):
+    help = "Compare per-request auth queries and latency of JWTAuthentication and CachedJWTAuthentication."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        with scratch_database():
+            user = self.seed_driver()
+            access = str(RefreshToken.for_user(user).access_token)
+            header = f"Bearer {access}"
+            factory = APIRequestFactory()
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=header)
+            url = reverse('driver-profile-detail', args=[user.id])
+
+            self.stdout.write(f"{'auth class':>26} | {'authenticate()':>22} | {'GET driver-profile':>22}")
+            for auth_class in (JWTAuthentication, CachedJWTAuthentication):
+                authenticator = auth_class()
+
+                def authenticate():
+                    request = Request(factory.get(url, HTTP_AUTHORIZATION=header))
+                    return authenticator.authenticate(request)
+
+                authenticate()  # warm the cache for the cached class
+                auth_queries, auth_seconds, _ = measure(authenticate, repeat)
+
+                with mock.patch.object(DriverProfileDetailView, 'authentication_classes', [auth_class]):
+                    client.get(url)
+                    view_queries, view_seconds, response = measure(lambda: client.get(url), repeat)
+                assert response.status_code == 200, response.status_code
+
+                self.stdout.write(
+                    f"{auth_class.__name__:>26} | {auth_queries:>4} q {auth_seconds * 1e6:>10.1f} us | "
+                    f"{view_queries:>4} q {view_seconds * 1e3:>10.3f} ms"
+                )
+
+    def seed_driver(self):
+        vehicle_type = VehicleType.objects.create(vehicle_name="Van")
+        user = CustomUser.objects.create_user(phone_number="9000000001", is_driver=True)
+        profile = Profile.objects.create(
+            user=user, full_name="Bench Driver", dob="1990-01-01", vehicle_type=vehicle_type,
+        )
+        DriverProfileMapping.objects.create(
+            driver=profile,
+            college=College.objects.create(college_name="Bench College"),
+            timing=CollegeTiming.objects.create(
+                start_shift=datetime.time(8, 0), end_shift=datetime.time(14, 0)
+            ),
+        )
+        return user
@@ -0,0 +1,113 @@
+import base64
+import datetime
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.bench import scratch_database, measure
+from core.models import Children, College, CollegeTiming, CustomUser, Parent_Profile
+from core.serializers import ChildrenListSerializer
+
+
+def keyset_cursor(position):
+    """Build the opaque DRF cursor token that points just after `position`."""
+    return base64.b64encode(urlencode({'p': position}).encode('ascii')).decode('ascii')
+
+
+class Command(BaseCommand):
+    help = "Benchmark ChildrenListByParentView query count and latency at several list sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,1000,100000',
+                            help="Comma separated number of children per parent.")
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--legacy-max', type=int, default=1000,
+                            help="Also time the old un-joined listing for sizes up to this value.")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        repeat = options['repeat']
+        page_size = options['page_size']
+        client = APIClient()
+
+        with scratch_database():
+            college = College.objects.create(college_name="Bench College")
+            timing = CollegeTiming.objects.create(
+                start_shift=datetime.time(8, 0), end_shift=datetime.time(14, 0)
+            )
+
+            rows = []
+            for index, size in enumerate(sizes):
+                parent = CustomUser.objects.create_user(
+                    phone_number=f"9{index:09d}", is_student=True
+                )
+                Parent_Profile.objects.create(user=parent, full_name=f"Parent {index}")
+                self.seed_children(parent, college, timing, size)
+                ids = list(
+                    Children.objects.filter(parent=parent).order_by('id').values_list('id', flat=True)
+                )
+                url = reverse('list-children-by-parent', args=[parent.id])
+
+                full = measure(lambda: client.get(url), repeat)
+                first = measure(lambda: client.get(url, {'page_size': page_size}), repeat)
+                deep_cursor = keyset_cursor(ids[max(len(ids) - page_size - 1, 0)])
+                deep = measure(lambda: client.get(url, {'page_size': page_size, 'cursor': deep_cursor}), repeat)
+
+                row = {
+                    'rows': size,
+                    'full': full[:2],
+                    'first_page': first[:2],
+                    'last_page': deep[:2],
+                    'legacy': None,
+                }
+                if size <= options['legacy_max']:
+                    legacy = measure(
+                        lambda: ChildrenListSerializer(
+                            Children.objects.filter(parent_id=parent.id), many=True
+                        ).data,
+                        repeat,
+                    )
+                    row['legacy'] = legacy[:2]
+                rows.append(row)
+
+        self.report(rows, page_size)
+
+    def seed_children(self, parent, college, timing, size, batch_size=5000):
+        batch = []
+        for number in range(size):
+            batch.append(Children(
+                college=college,
+                collegetiming=timing,
+                parent=parent,
+                full_name=f"Child {number}",
+                dob=datetime.date(2015, 1, 1),
+                age=10,
+                children_class="5A",
+                contact_person_name="Contact",
+                contact_person_number="9876543210",
+            ))
+            if len(batch) >= batch_size:
+                Children.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Children.objects.bulk_create(batch)
+
+    def report(self, rows, page_size):
+        def cell(result):
+            if result is None:
+                return f"{'-':>20}"
+            queries, seconds = result
+            return f"{queries:>6} q {seconds * 1000:>9.2f} ms"
+
+        self.stdout.write(
+            f"{'rows':>8} | {'full list':>20} | {'first page (' + str(page_size) + ')':>20} | "
+            f"{'last page':>20} | {'legacy serializer':>20}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['rows']:>8} | {cell(row['full'])} | {cell(row['first_page'])} | "
+                f"{cell(row['last_page'])} | {cell(row['legacy'])}"
+            )
@@ -0,0 +1,61 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.college_search import CollegeIndex
+from core.loadtest import percentile
+
+WORDS = (
+    'saint', 'xavier', 'national', 'institute', 'technology', 'engineering', 'arts', 'science', 'commerce',
+    'government', 'city', 'royal', 'modern', 'global', 'valley', 'university', 'college', 'academy', 'of', 'memorial',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Build a CollegeIndex over synthetic college names and report build "
+        "time and p50/p99 search latency for prefix, word-prefix and "
+        "misspelled queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--colleges', type=int, default=50000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        towns = [
+            ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randrange(4, 10)))
+            for _ in range(max(options['colleges'] // 10, 1))
+        ]
+        names = [
+            ' '.join([rng.choice(towns).title(), *rng.sample(WORDS, 3)]) for _ in range(options['colleges'])
+        ]
+
+        started = time.perf_counter()
+        index = CollegeIndex.from_rows(enumerate(names, start=1))
+        self.stdout.write(f"Indexed {len(index)} colleges in {time.perf_counter() - started:.2f}s")
+
+        def misspell(name):
+            position = rng.randrange(1, len(name) - 1)
+            return name[:position] + name[position + 1:]
+
+        kinds = {
+            'prefix': lambda name: name[:rng.randrange(2, 8)],
+            'word prefix': lambda name: name.split(' ')[rng.randrange(1, 4)][:4],
+            'misspelled': misspell,
+        }
+        self.stdout.write(f"{'query':>12} | {'p50 ms':>7} | {'p99 ms':>7}")
+        for kind, make_query in kinds.items():
+            latencies = []
+            for _ in range(options['queries']):
+                query = make_query(rng.choice(names))
+                started = time.perf_counter()
+                index.search(query, options['limit'])
+                latencies.append(time.perf_counter() - started)
+            self.stdout.write(
+                f"{kind:>12} | {percentile(latencies, 0.5) * 1000:>7.3f} | {percentile(latencies, 0.99) * 1000:>7.3f}"
+            )
@@ -0,0 +1,102 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from core.bench import scratch_database, measure
+from core.models import Children, College, CollegeTiming, CustomUser, DriverProfileMapping, Parent_Profile, Profile
+from core.serializers import CHILDREN_LIST_ROWS, PROFILE_LIST_ROWS, ChildrenListSerializer, ProfileListSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rendering the children and driver profile lists through the "
+        "DRF serializers and through their values() row serializers "
+        "(core.row_serializers): queries, time to JSON bytes, and whether the "
+        "bytes are identical. Fails if they are not."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--children', type=int, default=10000, help="Children of the one seeded parent.")
+        parser.add_argument('--profiles', type=int, default=1000, help="Seeded driver profiles with a college mapping.")
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        renderer = JSONRenderer()
+
+        with scratch_database():
+            college = College.objects.create(college_name="Bench College")
+            timing = CollegeTiming.objects.create(start_shift=datetime.time(8, 0), end_shift=datetime.time(14, 0))
+            parent = self.seed_children(college, timing, options['children'])
+            self.seed_profiles(college, timing, options['profiles'])
+
+            children = Children.objects.filter(parent=parent).order_by('id')
+            profiles = Profile.objects.order_by('id')
+            cases = [
+                (
+                    f"{options['children']} children",
+                    lambda: renderer.render(ChildrenListSerializer(
+                        children.select_related('college', 'collegetiming', 'parent', 'parent__parent_profile')
+                        .prefetch_related('parent__groups', 'parent__user_permissions'),
+                        many=True,
+                    ).data),
+                    lambda: renderer.render(CHILDREN_LIST_ROWS.render(CHILDREN_LIST_ROWS.values(children))),
+                ),
+                (
+                    f"{options['profiles']} profiles",
+                    lambda: renderer.render(ProfileListSerializer(
+                        profiles.select_related('user', 'driverprofilemapping__college', 'driverprofilemapping__timing')
+                        .prefetch_related('user__groups', 'user__user_permissions'),
+                        many=True,
+                    ).data),
+                    lambda: renderer.render(PROFILE_LIST_ROWS.render(PROFILE_LIST_ROWS.values(profiles))),
+                ),
+            ]
+            results = [(name, measure(drf, repeat), measure(rows, repeat)) for name, drf, rows in cases]
+
+        self.report(results)
+        different = [name for name, drf, rows in results if drf[2] != rows[2]]
+        if different:
+            raise CommandError(f"JSON differs from the DRF serializer for: {', '.join(different)}")
+
+    def seed_children(self, college, timing, size, batch_size=5000):
+        parent = CustomUser.objects.create_user(phone_number="9000000000", is_student=True)
+        Parent_Profile.objects.create(user=parent, full_name="Bench Parent")
+        # A picture name without the post_save thumbnail job (core.signals)
+        Parent_Profile.objects.filter(user=parent).update(profile_pic="parent_profiles/bench.jpg")
+        for start in range(0, size, batch_size):
+            Children.objects.bulk_create([
+                Children(
+                    college=college, collegetiming=timing, parent=parent,
+                    full_name=f"Child {number}", dob=datetime.date(2015, 1, 1 + number % 28), age=10,
+                    children_class="5A", contact_person_name="Contact", contact_person_number="9876543210",
+                )
+                for number in range(start, min(start + batch_size, size))
+            ])
+        return parent
+
+    def seed_profiles(self, college, timing, size):
+        users = CustomUser.objects.bulk_create([
+            CustomUser(phone_number=f"+9170{number:08d}", is_driver=True) for number in range(size)
+        ])
+        profiles = Profile.objects.bulk_create([
+            Profile(
+                user=user, full_name=f"Driver {number}", dob="1990-01-01", licence_exp_date=datetime.date(2030, 1, 1),
+                profile_pic=f"driver-{number}.jpg" if number % 2 else None,
+            )
+            for number, user in enumerate(users)
+        ])
+        DriverProfileMapping.objects.bulk_create([
+            DriverProfileMapping(driver=profile, college=college, timing=timing) for profile in profiles[::2]
+        ])
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'list':>16} | {'serializer':>20} | {'row serializer':>20} | {'speedup':>8} | identical"
+        )
+        for name, drf, rows in results:
+            self.stdout.write(
+                f"{name:>16} | {drf[0]:>6} q {drf[1] * 1000:>9.2f} ms | {rows[0]:>6} q {rows[1] * 1000:>9.2f} ms | "
+                f"{drf[1] / rows[1]:>7.1f}x | {'yes' if drf[2] == rows[2] else 'NO'}"
+            )
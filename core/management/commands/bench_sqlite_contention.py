@@ -0,0 +1,147 @@
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+
+from core.bench import scratch_database
+from core.db import sqlite_options
+from core.models import CustomUser, Parent_Profile
+from core.write_queue import WriteQueue
+
+
+def register_parent(alias, phone_number):
+    """The writes of an OTP verification: check the number, create user and profile."""
+    if CustomUser.objects.using(alias).filter(phone_number=phone_number).exists():
+        return None
+    user = CustomUser.objects.db_manager(alias).create_user(phone_number=phone_number, is_student=True)
+    Parent_Profile.objects.using(alias).create(user=user, full_name="Bench Parent", dob="2000-01-01", email="bench@example.com")
+    return user.pk
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Run N threads of mixed OTP-style reads and registration writes against an "
+        "on-disk SQLite copy of the schema in three modes: the default settings, "
+        "WAL + busy timeout + IMMEDIATE transactions, and the same with the "
+        "core.write_queue group-commit writer. Reports throughput and lock errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--ops', type=int, default=200, help="Operations per worker.")
+        parser.add_argument('--write-ratio', type=float, default=0.5)
+        parser.add_argument('--busy-timeout', type=float, default=5,
+                            help="Busy timeout (seconds) for the WAL modes.")
+        parser.add_argument('--batch-size', type=int, default=32)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("This benchmark needs the default database to be SQLite.")
+
+        workdir = tempfile.mkdtemp(prefix='sqlite-contention-')
+        template = os.path.join(workdir, 'template.sqlite3')
+        modes = [
+            ('default', {}, False),
+            ('wal', sqlite_options(options['busy_timeout']), False),
+            ('wal+queue', sqlite_options(options['busy_timeout']), True),
+        ]
+        try:
+            with scratch_database(test_name=template):
+                base_settings = dict(connection.settings_dict)
+                connection.close()
+                for name, _, _ in modes:
+                    shutil.copyfile(template, os.path.join(workdir, f'{name}.sqlite3'))
+
+            self.stdout.write(
+                f"{options['workers']} workers x {options['ops']} ops, "
+                f"{options['write_ratio']:.0%} writes\n"
+                f"{'mode':>10} | {'ok ops/s':>8} | {'writes/s':>8} | {'lock errors':>11} | "
+                f"{'write p50':>9} | {'write p95':>9} | {'batches':>7}"
+            )
+            for name, sqlite_opts, queued in modes:
+                alias = f'bench_{name}'
+                connections.settings[alias] = {
+                    **base_settings,
+                    'NAME': os.path.join(workdir, f'{name}.sqlite3'),
+                    'OPTIONS': sqlite_opts,
+                    'TEST': {**base_settings['TEST'], 'MIRROR': None},
+                }
+                try:
+                    self.report(name, self.run_mode(alias, queued, options))
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def run_mode(self, alias, queued, options):
+        write_queue = WriteQueue(using=alias, batch_size=options['batch_size']) if queued else None
+        phone_numbers = (f"7{number:09d}" for number in itertools.count())
+        phone_lock = threading.Lock()
+        results = {'ops': 0, 'writes': 0, 'errors': 0, 'latencies': []}
+        results_lock = threading.Lock()
+        start = threading.Barrier(options['workers'] + 1)
+
+        def worker(seed):
+            ops, writes, errors, latencies = 0, 0, 0, []
+            start.wait()
+            for op in range(options['ops']):
+                with phone_lock:
+                    phone_number = next(phone_numbers)
+                is_write = (op * 7919 + seed) % 100 < options['write_ratio'] * 100
+                started = time.perf_counter()
+                try:
+                    if not is_write:
+                        # send-otp: look the number up
+                        CustomUser.objects.using(alias).filter(phone_number=phone_number).exists()
+                    elif write_queue is not None:
+                        write_queue.run(register_parent, alias, phone_number)
+                    else:
+                        with transaction.atomic(using=alias):
+                            register_parent(alias, phone_number)
+                except OperationalError as exc:
+                    if 'locked' not in str(exc):
+                        raise
+                    errors += 1
+                else:
+                    if is_write:
+                        writes += 1
+                        latencies.append(time.perf_counter() - started)
+                ops += 1
+            connections[alias].close()
+            with results_lock:
+                results['ops'] += ops
+                results['writes'] += writes
+                results['errors'] += errors
+                results['latencies'].extend(latencies)
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(options['workers'])]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        results['elapsed'] = time.perf_counter() - started
+        results['batches'] = write_queue.snapshot()['batches'] if write_queue else None
+        return results
+
+    def report(self, name, results):
+        latencies = results['latencies']
+        batches = '-' if results['batches'] is None else results['batches']
+        self.stdout.write(
+            f"{name:>10} | {(results['ops'] - results['errors']) / results['elapsed']:>8.0f} | "
+            f"{results['writes'] / results['elapsed']:>8.0f} | "
+            f"{results['errors']:>11} | {percentile(latencies, 0.5) * 1000:>6.1f} ms | "
+            f"{percentile(latencies, 0.95) * 1000:>6.1f} ms | {batches:>7}"
+        )
@@ -0,0 +1,32 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.exporters import EXPORTS, stream_export
+
+
+class Command(BaseCommand):
+    help = "Stream a college's children or drivers to a CSV/NDJSON file (or stdout)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('college_id', type=int)
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--output', help="File to write; defaults to stdout.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = 0
+        handle = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for piece in stream_export(options['kind'], options['college_id'], options['format'], options['chunk_size']):
+                handle.write(piece)
+                written += len(piece)
+        finally:
+            if options['output']:
+                handle.close()
+
+        if options['output']:
+            self.stderr.write(f"Wrote {written} bytes in {time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.images import generate_thumbnails
+from core.models import Parent_Profile, Profile, TempParent
+
+
+class Command(BaseCommand):
+    help = "Create missing profile picture thumbnails (e.g. for pictures uploaded before thumbnails existed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--overwrite', action='store_true', help="Regenerate thumbnails that already exist.")
+
+    def handle(self, *args, **options):
+        for model in (Profile, Parent_Profile, TempParent):
+            written = failed = 0
+            for instance in model.objects.exclude(profile_pic='').exclude(profile_pic=None).iterator():
+                try:
+                    written += len(generate_thumbnails(instance.profile_pic, overwrite=options['overwrite']))
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} {instance.pk}: {exc}")
+            self.stdout.write(f"{model.__name__}: wrote {written} thumbnails, {failed} failures")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importers import IMPORTERS, format_from_name
+
+
+class Command(BaseCommand):
+    help = "Stream drivers or children from a CSV/NDJSON file into the database in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Defaults to ndjson for .ndjson/.jsonl files, csv otherwise.")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or format_from_name(options['path'])
+
+        def progress(report):
+            data = report.as_dict()
+            self.stdout.write(
+                f"{data['rows']} rows, {data['created']} created, {data['rejected']} rejected "
+                f"({data['rows_per_second']} rows/s)"
+            )
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                report = IMPORTERS[options['kind']](
+                    stream, fmt, chunk_size=options['chunk_size'], progress=progress
+                ).as_dict()
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['created']} of {report['rows']} {report['kind']} rows "
+            f"in {report['elapsed_seconds']}s ({report['rows_per_second']} rows/s)."
+        ))
+        for error in report['errors']:
+            self.stdout.write(f"  line {error['line']}: {error['errors']}")
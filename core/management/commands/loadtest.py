@@ -0,0 +1,185 @@
+import json
+import os
+import platform
+import secrets
+import socket
+import subprocess
+import tempfile
+import threading
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.test.utils import override_settings
+
+from core.bench import scratch_database
+from core.loadtest import Journeys, compare, parse_mix, run_load
+from core.models import College, CollegeTiming, VehicleType
+from core.sms import get_otp_dispatcher, standin_server
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; don't let Nagle hold the body back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_in_background(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive register -> verify -> send-otp -> login journeys for drivers and "
+        "parents (plus driver-profile and children/* calls) with concurrent "
+        "clients and report throughput, p50/p95/p99 latency, error rates and "
+        "DB queries per request as JSON. Without --url it starts its own "
+        "server on a scratch database with a local SMS stand-in."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Base URL of a running server, e.g. http://127.0.0.1:8000/api")
+        parser.add_argument('--users', type=int, default=8, help="Concurrent clients.")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to run.")
+        parser.add_argument('--iterations', type=int, help="Journeys per client instead of --duration.")
+        parser.add_argument('--mix', default='driver=1,parent=3', help="Journey weights.")
+        parser.add_argument('--reads', type=int, default=3, help="Profile/children reads per journey.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--sms-latency-ms', type=float, default=50)
+        parser.add_argument('--keep-throttles', action='store_true',
+                            help="Keep the OTP throttle rates; all clients share one IP, so they trip quickly.")
+        parser.add_argument('--vehicle-type', type=int, help="Vehicle type id to register drivers with (--url only).")
+        parser.add_argument('--college', type=int, help="College id for children (--url only).")
+        parser.add_argument('--timing', type=int, help="College timing id for children (--url only).")
+        parser.add_argument('--college-name', default='Load Test College')
+        parser.add_argument('--metrics-token', help="METRICS_TOKEN of the server, for per-request query counts (--url only).")
+        parser.add_argument('--output', default='loadtest.json')
+        parser.add_argument('--baseline', help="Earlier --output file to compare against.")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        unknown = set(mix) - {'driver', 'parent'}
+        if unknown:
+            raise CommandError(f"Unknown journeys in --mix: {', '.join(sorted(unknown))}")
+
+        with ExitStack() as stack:
+            if options['url']:
+                base_url = options['url']
+                refs = {
+                    'vehicle_type': options['vehicle_type'],
+                    'college': options['college'],
+                    'timing': options['timing'],
+                    'college_name': options['college_name'],
+                }
+                if None in refs.values():
+                    raise CommandError("--url needs --vehicle-type, --college and --timing.")
+                metrics_token = options['metrics_token']
+            else:
+                metrics_token = secrets.token_hex(16)
+                base_url, refs = self.start_local_server(stack, options, metrics_token)
+
+            self.stdout.write(f"{options['users']} clients against {base_url}, mix {options['mix']}")
+            journeys = Journeys(refs, reads=options['reads'], seed=options['seed'])
+            recorder = run_load(
+                base_url, journeys, mix, options['users'],
+                duration=None if options['iterations'] else options['duration'],
+                iterations=options['iterations'], seed=options['seed'], metrics_token=metrics_token,
+            )
+            results = {'meta': self.meta(options, base_url), **recorder.summary()}
+            if not options['url']:
+                get_otp_dispatcher().flush(timeout=10)
+                results['sms'] = get_otp_dispatcher().snapshot()
+
+        with open(options['output'], 'w') as handle:
+            json.dump(results, handle, indent=2)
+        self.report(results)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                self.report_comparison(compare(results, json.load(handle)))
+
+    def start_local_server(self, stack, options, metrics_token):
+        workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix='loadtest-'))
+        stack.enter_context(scratch_database(test_name=os.path.join(workdir, 'loadtest.sqlite3')))
+
+        sms = serve_in_background(standin_server('127.0.0.1', 0, latency_ms=options['sms_latency_ms']))
+        stack.callback(sms.server_close)
+        stack.callback(sms.shutdown)
+
+        overrides = {
+            'OTP_DELIVERY': {
+                **settings.OTP_DELIVERY,
+                'PROVIDER': 'core.sms.HTTPSMSProvider',
+                'OPTIONS': {'url': f'http://127.0.0.1:{sms.server_address[1]}/'},
+            },
+            # Every request reports its query count through Server-Timing
+            'REQUEST_METRICS': {**getattr(settings, 'REQUEST_METRICS', {}), 'SAMPLE_RATE': 1.0},
+            'METRICS_TOKEN': metrics_token,
+        }
+        if not options['keep_throttles']:
+            overrides['REST_FRAMEWORK'] = {
+                **settings.REST_FRAMEWORK,
+                'DEFAULT_THROTTLE_RATES': {scope: '1000000/s' for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']},
+            }
+        stack.enter_context(override_settings(**overrides))
+
+        refs = {
+            'vehicle_type': VehicleType.objects.create(vehicle_name='Load Van').id,
+            'college': College.objects.create(college_name=options['college_name'], is_active=True).id,
+            'timing': CollegeTiming.objects.create(start_shift='08:00', end_shift='16:00').id,
+            'college_name': options['college_name'],
+        }
+
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=False)
+        server.set_app(get_internal_wsgi_application())
+        serve_in_background(server)
+        stack.callback(server.server_close)
+        stack.callback(server.shutdown)
+        return f'http://127.0.0.1:{server.server_address[1]}/api', refs
+
+    def meta(self, options, base_url):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'target': base_url,
+            'self_hosted': not options['url'],
+            'database': settings.DATABASES['default']['ENGINE'],
+            **{key: options[key] for key in ('users', 'duration', 'iterations', 'mix', 'reads', 'seed')},
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f"{results['requests']} requests in {results['elapsed_seconds']}s: "
+            f"{results['rps']} req/s, error rate {results['error_rate']:.2%}, journeys {results['journeys']}"
+        )
+        self.stdout.write(
+            f"{'endpoint':>18} | {'reqs':>6} | {'req/s':>7} | {'errors':>6} | "
+            f"{'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7} | {'queries':>7}"
+        )
+        for name, entry in results['endpoints'].items():
+            queries = '-' if entry['queries_per_request'] is None else entry['queries_per_request']
+            self.stdout.write(
+                f"{name:>18} | {entry['requests']:>6} | {entry['rps']:>7} | {entry['error_rate']:>6.1%} | "
+                f"{entry['p50_ms']:>7} | {entry['p95_ms']:>7} | {entry['p99_ms']:>7} | {queries:>7}"
+            )
+
+    def report_comparison(self, rows):
+        self.stdout.write("Change against baseline:")
+        for name, metric, before, after, change in rows:
+            self.stdout.write(f"{name:>18} {metric:>20}: {before} -> {after} ({change:+.1%})")
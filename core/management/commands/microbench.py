@@ -0,0 +1,81 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bench import scratch_database
+from core.microbench import BENCHMARKS, Fixtures, regressions, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure ops/sec and allocations of the serializer and auth hot paths "
+        "(user/children/profile serializers, OTP validation and hashing, JWT "
+        "issuance, driver profile mapping) on seeded fixtures. With --baseline "
+        "it fails when any of them got slower than --threshold allows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                            help="Run only this benchmark; may be repeated.")
+        parser.add_argument('--seed', type=int, default=1234)
+        parser.add_argument('--children', type=int, default=50, help="Children rows for ChildrenListSerializer.")
+        parser.add_argument('--min-time', type=float, default=0.2, help="Seconds per timing round.")
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--output', help="Write the results as JSON, for use as a later --baseline.")
+        parser.add_argument('--baseline', help="Earlier --output file to compare against.")
+        parser.add_argument('--threshold', type=float, default=0.15,
+                            help="Allowed ops/sec drop against the baseline, as a fraction.")
+        parser.add_argument('--alloc-threshold', type=float,
+                            help="Also fail when peak allocations grow by more than this fraction.")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            fixtures = Fixtures(seed=options['seed'], children=options['children'])
+            results = run_benchmarks(fixtures, options['only'], options['min_time'], options['rounds'])
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)['benchmarks']
+        self.report(results, baseline)
+
+        if options['output']:
+            document = {
+                'meta': {
+                    'timestamp': datetime.now(timezone.utc).isoformat(),
+                    'python': platform.python_version(),
+                    **{key: options[key] for key in ('seed', 'children', 'min_time', 'rounds')},
+                },
+                'benchmarks': results,
+            }
+            with open(options['output'], 'w') as handle:
+                json.dump(document, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is None:
+            return
+        failures = [
+            f"{name}: {before:.0f} -> {after:.0f} ops/s ({change:+.1%})"
+            for name, before, after, change in regressions(results, baseline, options['threshold'])
+        ]
+        if options['alloc_threshold'] is not None:
+            for name, result in results.items():
+                before = baseline.get(name, {}).get('peak_bytes')
+                if before and result['peak_bytes'] / before - 1 > options['alloc_threshold']:
+                    failures.append(f"{name}: peak allocations {before} -> {result['peak_bytes']} bytes")
+        if failures:
+            raise CommandError("Regressions against the baseline:\n" + "\n".join(failures))
+
+    def report(self, results, baseline):
+        self.stdout.write(
+            f"{'benchmark':>28} | {'ops/s':>10} | {'change':>7} | {'peak KiB':>8} | {'queries':>7}"
+        )
+        for name, result in results.items():
+            before = (baseline or {}).get(name)
+            change = f"{result['ops_per_second'] / before['ops_per_second'] - 1:+.1%}" if before else '-'
+            self.stdout.write(
+                f"{name:>28} | {result['ops_per_second']:>10.0f} | {change:>7} | "
+                f"{result['peak_bytes'] / 1024:>8.1f} | {result['queries']:>7}"
+            )
@@ -0,0 +1,261 @@
+import itertools
+import logging
+import os
+import tempfile
+import threading
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, get_internal_wsgi_application
+from django.db import IntegrityError, connections
+from django.test.utils import override_settings
+
+from core.bench import scratch_database
+from core.loadtest import ApiClient, Recorder, login_body
+from core.management.commands.loadtest import QuietRequestHandler, serve_in_background
+from core.models import College, CollegeTiming, CustomUser, DriverProfileMapping, Parent_Profile, Profile, VehicleType
+from core.phones import phone_key
+from core.views.driver import create_driver_account
+from core.write_queue import run_write
+
+STORES = {
+    'memory': ('core.otp_store.MemoryChallengeStore', {}),
+    'cache': ('core.otp_store.CacheChallengeStore', {}),
+    'database': ('core.otp_store.DatabaseChallengeStore', {}),
+}
+MAX_ATTEMPTS = 5
+ANY_STATUS = range(600)
+
+
+class ContentionServer(ThreadedWSGIServer):
+    # Every racing thread connects at once
+    request_queue_size = 256
+
+
+def race(count, fn):
+    """Run fn(0) .. fn(count - 1) in threads released together; returns their results in order."""
+    start = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(number):
+        try:
+            start.wait()
+            results[number] = fn(number)
+        except Exception as exc:
+            results[number] = exc
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent OTP verifications at a local server on a scratch database "
+        "and check the invariants: a registration creates its user exactly once, "
+        "a login code is used exactly once, and no more than max_attempts wrong "
+        "guesses are ever compared. Runs against each challenge store and exits "
+        "with an error on any violation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help="Concurrent requests per race.")
+        parser.add_argument('--rounds', type=int, default=10, help="Races per scenario.")
+        parser.add_argument('--store', choices=['all', *STORES], default='all')
+
+    def handle(self, *args, **options):
+        if options['threads'] <= MAX_ATTEMPTS:
+            raise CommandError(f"--threads must be above max_attempts ({MAX_ATTEMPTS}) to test the attempt limit.")
+        stores = STORES if options['store'] == 'all' else {options['store']: STORES[options['store']]}
+
+        with ExitStack() as stack:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix='otp-contention-'))
+            stack.enter_context(scratch_database(test_name=os.path.join(workdir, 'contention.sqlite3')))
+            stack.enter_context(override_settings(REST_FRAMEWORK={
+                **settings.REST_FRAMEWORK,
+                'DEFAULT_THROTTLE_RATES': {scope: '1000000/s' for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']},
+            }))
+            server = ContentionServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=False)
+            server.set_app(get_internal_wsgi_application())
+            # Rejected requests are expected here; don't log each one (set after loading the app, which configures logging)
+            request_logger = logging.getLogger('django.request')
+            stack.callback(request_logger.setLevel, request_logger.level)
+            request_logger.setLevel(logging.ERROR)
+            serve_in_background(server)
+            stack.callback(server.server_close)
+            stack.callback(server.shutdown)
+
+            self.base_url = f'http://127.0.0.1:{server.server_address[1]}/api'
+            self.vehicle_type = VehicleType.objects.create(vehicle_name='Contention Van').id
+            College.objects.create(college_name='Contention College', is_active=True)
+            CollegeTiming.objects.create(start_shift='08:00', end_shift='16:00')
+            self.phone_numbers = (f"71{number:08d}" for number in itertools.count())
+
+            scenarios = [
+                ('driver verify race', self.driver_verify_race),
+                ('parent verify race', self.parent_verify_race),
+                ('wrong guess race', self.wrong_guess_race),
+                ('login race', self.login_race),
+                ('login guess race', self.login_guess_race),
+                ('account creation race', self.account_creation_race),
+            ]
+            violations = []
+            self.stdout.write(f"{options['threads']} threads x {options['rounds']} rounds")
+            self.stdout.write(f"{'store':>7} | {'scenario':<22} | {'requests':>8} | violations")
+            for store_name, (backend, store_options) in stores.items():
+                store_settings = {'BACKEND': backend, 'OPTIONS': {**store_options, 'ttl': 300, 'max_attempts': MAX_ATTEMPTS}}
+                with override_settings(OTP_CHALLENGE_STORE=store_settings):
+                    for name, scenario in scenarios:
+                        found = []
+                        for _ in range(options['rounds']):
+                            found.extend(scenario(options['threads']))
+                        violations.extend(f"{store_name} / {name}: {message}" for message in found)
+                        self.stdout.write(
+                            f"{store_name:>7} | {name:<22} | {options['threads'] * options['rounds']:>8} | {len(found)}"
+                        )
+
+        for message in violations[:20]:
+            self.stderr.write(message)
+        if violations:
+            raise CommandError(f"{len(violations)} invariant violations.")
+        self.stdout.write(self.style.SUCCESS("All invariants held."))
+
+    def call(self, name, path, data, form=False):
+        """One setup request on its own connection."""
+        client = ApiClient(self.base_url, Recorder())
+        try:
+            return client.call(name, 'POST', path, data, form=form)
+        finally:
+            client.connection.close()
+
+    def registration(self, phone_number):
+        return {
+            'phone_number': phone_number, 'full_name': 'Contention Driver', 'dob': '1990-01-01',
+            'email': 'driver@example.com', 'licence_no': 'L1', 'licence_exp_date': '2030-01-01',
+            'vehicle_type': self.vehicle_type, 'vehicle_no': 'KA01', 'college_name': 'Contention College',
+            'start_shift': '08:00', 'end_shift': '16:00', 'is_driver': True, 'is_student': False,
+        }
+
+    def statuses(self, responses):
+        return sorted(status for status, _ in responses)
+
+    def post_all(self, threads, path, bodies):
+        """POST bodies[i] from thread i, all at once; returns [(status, data)]."""
+        recorders = [Recorder() for _ in range(threads)]
+        clients = [ApiClient(self.base_url, recorder) for recorder in recorders]
+        for client in clients:
+            # Connect up front so the racing requests don't overflow the listen backlog
+            client.connection.connect()
+
+        def post(number):
+            data = clients[number].call('post', 'POST', path, bodies[number], expect=ANY_STATUS)
+            return next(iter(recorders[number].endpoints['post']['statuses'])), data or {}
+
+        try:
+            results = race(threads, post)
+        finally:
+            for client in clients:
+                client.connection.close()
+        # A request that failed outright counts as a 599
+        return [(599, {'detail': str(result)}) if isinstance(result, Exception) else result for result in results]
+
+    def driver_verify_race(self, threads):
+        phone_number = next(self.phone_numbers)
+        otp = self.call('register', '/register', self.registration(phone_number))['otp_code']
+        responses = self.post_all(threads, '/verify-otp', [{'phone_number': phone_number, 'otp_code': otp}] * threads)
+        return self.check_created_once(phone_number, responses, Profile.objects.filter(user__phone_key=phone_key(phone_number)))
+
+    def parent_verify_race(self, threads):
+        phone_number = next(self.phone_numbers)
+        otp = self.call('parent-register', '/parent-register', {
+            'phone_number': phone_number, 'full_name': 'Contention Parent', 'dob': '1985-01-01',
+            'email': 'parent@example.com', 'is_student': True,
+        }, form=True)['otp_code']
+        responses = self.post_all(threads, '/parent-verify-otp', [{'phone_number': phone_number, 'otp_code': otp}] * threads)
+        return self.check_created_once(
+            phone_number, responses, Parent_Profile.objects.filter(user__phone_key=phone_key(phone_number)),
+        )
+
+    def check_created_once(self, phone_number, responses, profiles):
+        violations = []
+        statuses = self.statuses(responses)
+        if statuses.count(201) != 1 or any(status not in (201, 404) for status in statuses):
+            violations.append(f"{phone_number}: expected one 201 and the rest 404, got {statuses}")
+        users = CustomUser.objects.filter(phone_key=phone_key(phone_number)).count()
+        if users != 1 or profiles.count() != 1:
+            violations.append(f"{phone_number}: {users} users and {profiles.count()} profiles")
+        return violations
+
+    def wrong_guess_race(self, threads):
+        phone_number = next(self.phone_numbers)
+        otp = self.call('register', '/register', self.registration(phone_number))['otp_code']
+        wrong = [f"{(int(otp) + number + 1) % 1_000_000:06d}" for number in range(threads)]
+        responses = self.post_all(
+            threads, '/verify-otp', [{'phone_number': phone_number, 'otp_code': code} for code in wrong],
+        )
+        violations = []
+        compared = sorted(
+            data['detail'] for _, data in responses if str(data.get('detail', '')).startswith('Invalid OTP.')
+        )
+        expected = sorted(f"Invalid OTP. Attempts left: {left}" for left in range(MAX_ATTEMPTS))
+        if compared != expected:
+            violations.append(f"{phone_number}: {len(compared)} guesses compared, expected {MAX_ATTEMPTS}: {compared}")
+        if any(status == 201 for status, _ in responses):
+            violations.append(f"{phone_number}: a wrong code created the user")
+        # The challenge is used up: even the right code must not work now
+        status, _ = self.post_all(1, '/verify-otp', [{'phone_number': phone_number, 'otp_code': otp}])[0]
+        if status == 201:
+            violations.append(f"{phone_number}: the right code still worked after {MAX_ATTEMPTS} wrong guesses")
+        return violations
+
+    def login_race(self, threads):
+        phone_number = next(self.phone_numbers)
+        CustomUser.objects.create_user(phone_number=phone_number, is_driver=True)
+        sent = self.call('send-otp', '/send-otp', {'phone_number': phone_number})
+        responses = self.post_all(threads, '/login', [login_body(phone_number, sent)] * threads)
+        statuses = self.statuses(responses)
+        if statuses.count(200) != 1 or any(status not in (200, 400) for status in statuses):
+            return [f"{phone_number}: expected one 200 and the rest 400, got {statuses}"]
+        return []
+
+    def login_guess_race(self, threads):
+        phone_number = next(self.phone_numbers)
+        CustomUser.objects.create_user(phone_number=phone_number, is_driver=True)
+        sent = self.call('send-otp', '/send-otp', {'phone_number': phone_number})
+        wrong = [
+            {**login_body(phone_number, sent), 'otp_code': f"{(int(sent['otp_code']) + number + 1) % 10_000:04d}"}
+            for number in range(threads)
+        ]
+        violations = []
+        if any(status == 200 for status, _ in self.post_all(threads, '/login', wrong)):
+            violations.append(f"{phone_number}: a wrong code logged in")
+        status, _ = self.post_all(1, '/login', [login_body(phone_number, sent)])[0]
+        if status == 200:
+            violations.append(f"{phone_number}: the right code still worked after {threads} wrong guesses")
+        return violations
+
+    def account_creation_race(self, threads):
+        """Verified registrations of one number created at once, as when a re-registration races a verify."""
+        phone_number = next(self.phone_numbers)
+        registration = self.registration(phone_number)
+        results = race(threads, lambda number: run_write(create_driver_account, registration))
+        violations = []
+        created = [result for result in results if not isinstance(result, Exception)]
+        unexpected = [result for result in results if isinstance(result, Exception) and not isinstance(result, IntegrityError)]
+        if len(created) != 1 or unexpected:
+            violations.append(f"{phone_number}: {len(created)} accounts created, unexpected errors {unexpected[:3]}")
+        key = phone_key(phone_number)
+        counts = (
+            CustomUser.objects.filter(phone_key=key).count(),
+            Profile.objects.filter(user__phone_key=key).count(),
+            DriverProfileMapping.objects.filter(driver__user__phone_key=key).count(),
+        )
+        if counts != (1, 1, 1):
+            violations.append(f"{phone_number}: users/profiles/mappings {counts}, expected one each")
+        return violations
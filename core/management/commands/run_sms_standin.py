@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core.sms import standin_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for the SMS gateway. Accepts the batches sent by "
+        "core.sms.HTTPSMSProvider, optionally with artificial latency and failures."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8025)
+        parser.add_argument('--latency-ms', type=float, default=0,
+                            help="Delay added to every batch, like a slow provider.")
+        parser.add_argument('--fail-rate', type=float, default=0,
+                            help="Fraction of batches answered with 503.")
+        parser.add_argument('--output', help="Append received messages to this file as JSON lines.")
+
+    def handle(self, *args, **options):
+        server = standin_server(
+            options['host'], options['port'],
+            latency_ms=options['latency_ms'],
+            fail_rate=options['fail_rate'],
+            output=options['output'],
+            on_batch=lambda messages: self.stdout.write(f"received batch of {len(messages)}"),
+        )
+        self.stdout.write(f"SMS stand-in listening on http://{options['host']}:{options['port']}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
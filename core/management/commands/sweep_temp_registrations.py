@@ -0,0 +1,105 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import OTPChallenge, TempParent, TempUser
+from core.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired TempUser/TempParent registrations and OTP challenges in small batches, "
+        "one short transaction per batch, and report throughput and lock wait."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=600,
+                            help="Delete registrations created more than this many seconds ago.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help="Seconds to sleep between batches so other writers get the lock.")
+        parser.add_argument('--loop', type=float, default=0,
+                            help="Keep running, sweeping again every N seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            for model in (TempUser, TempParent, OTPChallenge):
+                self.report(model, self.sweep(model, options))
+            # Pictures of registrations that were never verified, abandoned resumable uploads
+            purge_stale_uploads()
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    def expired(self, model, options):
+        if model is OTPChallenge:
+            # Past the grace period of core.otp_store.DatabaseChallengeStore
+            return model.objects.filter(retain_until__lt=time.time()).order_by('retain_until')
+        cutoff = timezone.now() - timedelta(seconds=options['older_than'])
+        return model.objects.filter(created_at__lt=cutoff).order_by('created_at')
+
+    def sweep(self, model, options):
+        stats = {'rows': 0, 'batches': 0, 'lock_wait': 0.0, 'max_lock_wait': 0.0, 'max_hold': 0.0}
+        started = time.perf_counter()
+
+        while True:
+            # Read the batch outside the write transaction, using the expiry index
+            ids = list(self.expired(model, options).values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+
+            deleted, lock_wait, hold = self.delete_batch(model, ids)
+            stats['rows'] += deleted
+            stats['batches'] += 1
+            stats['lock_wait'] += lock_wait
+            stats['max_lock_wait'] = max(stats['max_lock_wait'], lock_wait)
+            stats['max_hold'] = max(stats['max_hold'], hold)
+
+            if len(ids) < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+
+        stats['elapsed'] = time.perf_counter() - started
+        return stats
+
+    def delete_batch(self, model, ids):
+        """
+        Delete `ids` in one transaction.
+        Returns (rows deleted, seconds waiting for the write lock, seconds holding it).
+        """
+        if connection.vendor == 'sqlite':
+            # BEGIN IMMEDIATE takes the write lock up front, so its duration is the lock wait
+            table = connection.ops.quote_name(model._meta.db_table)
+            placeholders = ', '.join(['%s'] * len(ids))
+            with connection.cursor() as cursor:
+                requested = time.perf_counter()
+                cursor.execute('BEGIN IMMEDIATE')
+                acquired = time.perf_counter()
+                try:
+                    cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', ids)
+                    deleted = cursor.rowcount
+                    cursor.execute('COMMIT')
+                except Exception:
+                    cursor.execute('ROLLBACK')
+                    raise
+            return deleted, acquired - requested, time.perf_counter() - acquired
+
+        with transaction.atomic():
+            requested = time.perf_counter()
+            list(model.objects.select_for_update().filter(id__in=ids).values_list('id', flat=True))
+            acquired = time.perf_counter()
+            deleted, _ = model.objects.filter(id__in=ids).delete()
+        return deleted, acquired - requested, time.perf_counter() - acquired
+
+    def report(self, model, stats):
+        rate = stats['rows'] / stats['elapsed'] if stats['elapsed'] else 0
+        self.stdout.write(
+            f"{model.__name__}: deleted {stats['rows']} rows in {stats['batches']} batches, "
+            f"{stats['elapsed']:.2f}s ({rate:.0f} rows/s); "
+            f"lock wait total {stats['lock_wait'] * 1000:.1f} ms, "
+            f"max {stats['max_lock_wait'] * 1000:.1f} ms; "
+            f"longest lock hold {stats['max_hold'] * 1000:.1f} ms"
+        )
@@ -0,0 +1,282 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+# Route labels keep these methods; anything else a client sends is 'other'
+HTTP_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+# OTP events counted per challenge purpose (core.otp_store)
+OTP_ISSUED = 'issued'
+OTP_VERIFIED = 'verified'
+OTP_FAILED = 'failed'
+OTP_EXPIRED = 'expired'
+OTP_EXHAUSTED = 'exhausted'
+
+
+def method_label(method):
+    return method if method in HTTP_METHODS else 'other'
+
+
+def metrics_token_matches(request):
+    """Whether the request carries settings.METRICS_TOKEN as X-Metrics-Token."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    return bool(token) and constant_time_compare(request.headers.get('X-Metrics-Token', ''), token)
+
+
+def metrics_settings():
+    return {
+        'SAMPLE_RATE': 0.05,
+        'SERVER_TIMING': True,
+        **getattr(settings, 'REQUEST_METRICS', {}),
+    }
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense. Not locked; see MetricsRegistry."""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class RequestSample:
+    """SQL timings of one sampled request."""
+    __slots__ = ('queries', 'sql_seconds', 'slowest_seconds', 'slowest_sql')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_sql = None
+
+    def app_seconds(self, total):
+        """Time spent outside SQL (views, serializers, rendering) out of `total`."""
+        return max(total - self.sql_seconds, 0.0)
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql_seconds += elapsed
+            if elapsed > self.slowest_seconds:
+                self.slowest_seconds = elapsed
+                self.slowest_sql = sql
+
+
+current_sample = ContextVar('request_metrics_sample', default=None)
+
+
+def sample_queries(execute, sql, params, many, context):
+    """
+    execute_wrapper kept on every connection (install_query_sampling) that
+    hands queries to the current request's RequestSample, if it has one.
+    The sample travels in a ContextVar, which sync_to_async copies into its
+    threads, so async views are sampled like sync ones.
+    """
+    sample = current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    return sample(execute, sql, params, many, context)
+
+
+def install_query_sampling(sender, connection, **kwargs):
+    """connection_created receiver for sample_queries."""
+    if sample_queries not in connection.execute_wrappers:
+        # First, so that connection.execute_wrapper() blocks, which pop the
+        # last wrapper, never remove it
+        connection.execute_wrappers.insert(0, sample_queries)
+
+
+class MetricsRegistry:
+    """
+    Process-wide request and OTP metrics. Every gunicorn worker keeps its
+    own; Prometheus adds them up across the scraped targets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.responses = {}
+        self.queries = {}
+        self.sql_seconds = {}
+        self.app_seconds = {}
+        self.slowest = {}
+        self.otp_events = {}
+
+    def record_request(self, route, method, status_code, seconds, sample=None):
+        labels = (route, method)
+        with self._lock:
+            self.durations.setdefault(labels, Histogram(DURATION_BUCKETS)).observe(seconds)
+            key = (route, method, str(status_code))
+            self.responses[key] = self.responses.get(key, 0) + 1
+            if sample is None:
+                return
+            self.queries.setdefault(labels, Histogram(QUERY_BUCKETS)).observe(sample.queries)
+            self.sql_seconds.setdefault(labels, Histogram(DURATION_BUCKETS)).observe(sample.sql_seconds)
+            self.app_seconds.setdefault(labels, Histogram(DURATION_BUCKETS)).observe(sample.app_seconds(seconds))
+            new_slowest = sample.slowest_seconds > self.slowest.get(labels, (0.0, None))[0]
+            if new_slowest:
+                self.slowest[labels] = (sample.slowest_seconds, sample.slowest_sql)
+        if new_slowest:
+            logger.info(
+                f"Slowest query so far on {method} {route}: "
+                f"{sample.slowest_seconds * 1000:.1f} ms: {sample.slowest_sql}"
+            )
+
+    def count_otp(self, purpose, event):
+        with self._lock:
+            key = (purpose, event)
+            self.otp_events[key] = self.otp_events.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'durations': {labels: _copy(histogram) for labels, histogram in self.durations.items()},
+                'responses': dict(self.responses),
+                'queries': {labels: _copy(histogram) for labels, histogram in self.queries.items()},
+                'sql_seconds': {labels: _copy(histogram) for labels, histogram in self.sql_seconds.items()},
+                'app_seconds': {labels: _copy(histogram) for labels, histogram in self.app_seconds.items()},
+                'slowest': {labels: seconds for labels, (seconds, _) in self.slowest.items()},
+                'otp_events': dict(self.otp_events),
+            }
+
+
+def _copy(histogram):
+    copy = Histogram(histogram.buckets)
+    copy.counts = list(histogram.counts)
+    copy.sum = histogram.sum
+    copy.count = histogram.count
+    return copy
+
+
+registry = MetricsRegistry()
+
+
+def count_otp(purpose, event):
+    """Count an OTP event (OTP_ISSUED, OTP_VERIFIED, ...) for a challenge purpose."""
+    registry.count_otp(purpose, event)
+
+
+# ============================ Prometheus text format ============================
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _histogram_lines(name, help_text, histograms):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for (route, method), histogram in sorted(histograms.items()):
+        for bound, total in histogram.cumulative():
+            lines.append(f'{name}_bucket{_labels(route=route, method=method, le=bound)} {total}')
+        lines.append(f'{name}_sum{_labels(route=route, method=method)} {histogram.sum}')
+        lines.append(f'{name}_count{_labels(route=route, method=method)} {histogram.count}')
+    return lines
+
+
+def _counter_lines(name, help_text, kind, samples):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    lines.extend(f'{name}{_labels(**labels)} {value}' for labels, value in samples)
+    return lines
+
+
+def render_prometheus():
+    """Request, OTP, throttle, SMS, cache and write-queue metrics in the Prometheus text format."""
+    from core.phones import get_registered_phones
+    from core.reference import get_reference_cache
+    from core.sms import get_otp_dispatcher
+    from core.throttling import get_throttle_counters
+    from core.write_queue import get_write_queue
+
+    data = registry.snapshot()
+    lines = []
+    lines += _histogram_lines('dms_http_request_duration_seconds', 'Request latency by route.', data['durations'])
+    lines += _counter_lines(
+        'dms_http_responses_total', 'Responses by route and status code.', 'counter',
+        (({'route': route, 'method': method, 'status': code}, count)
+         for (route, method, code), count in sorted(data['responses'].items())),
+    )
+    lines += _histogram_lines('dms_http_request_queries', 'SQL statements per sampled request.', data['queries'])
+    lines += _histogram_lines('dms_http_request_sql_seconds', 'Total SQL time per sampled request.', data['sql_seconds'])
+    lines += _histogram_lines(
+        'dms_http_request_app_seconds', 'Time outside SQL (views, serializers, rendering) per sampled request.',
+        data['app_seconds'],
+    )
+    lines += _counter_lines(
+        'dms_http_request_slowest_query_seconds', 'Slowest statement seen on a sampled request.', 'gauge',
+        (({'route': route, 'method': method}, seconds) for (route, method), seconds in sorted(data['slowest'].items())),
+    )
+    lines += _counter_lines(
+        'dms_otp_events_total', 'OTP challenges issued, verified, failed, expired and exhausted.', 'counter',
+        (({'purpose': purpose, 'event': event}, count) for (purpose, event), count in sorted(data['otp_events'].items())),
+    )
+    lines += _counter_lines(
+        'dms_throttle_requests_total', 'Throttle decisions by scope.', 'counter',
+        (({'scope': scope, 'outcome': outcome}, count)
+         for scope, counts in sorted(get_throttle_counters().items()) for outcome, count in sorted(counts.items())),
+    )
+
+    sms = get_otp_dispatcher().snapshot()
+    lines += _counter_lines(
+        'dms_otp_sms_total', 'OTP SMS dispatcher counters.', 'counter',
+        (({'outcome': name}, sms[name]) for name in ('enqueued', 'dropped', 'sent', 'failed', 'retries', 'batches')),
+    )
+    lines += _counter_lines('dms_otp_sms_queued', 'OTP SMS waiting to be sent.', 'gauge', [({}, sms['queued'])])
+    lines += _counter_lines(
+        'dms_otp_sms_latency_ms', 'OTP SMS delivery latency quantiles.', 'gauge',
+        (({'quantile': quantile}, sms[f'latency_p{quantile[2:]}_ms'])
+         for quantile in ('0.50', '0.95', '0.99') if sms[f'latency_p{quantile[2:]}_ms'] is not None),
+    )
+
+    references = get_reference_cache().snapshot()
+    lines += _counter_lines(
+        'dms_reference_cache_lookups_total', 'College and timing lookups by outcome.', 'counter',
+        (({'outcome': name}, references[name]) for name in ('hits', 'misses')),
+    )
+
+    phones = get_registered_phones().snapshot()
+    lines += _counter_lines(
+        'dms_phone_registered_checks_total',
+        'Registration phone checks answered by the Bloom filter alone (skipped) or by a query (checked).', 'counter',
+        (({'outcome': name}, phones[name]) for name in ('skipped', 'checked')),
+    )
+
+    write_queue = get_write_queue()
+    if write_queue is not None:
+        stats = write_queue.snapshot()
+        lines += _counter_lines(
+            'dms_write_queue_total', 'SQLite write queue counters.', 'counter',
+            (({'kind': name}, stats[name]) for name in ('jobs', 'failed', 'cancelled', 'batches')),
+        )
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,191 @@
+import random
+import time
+import tracemalloc
+from datetime import date, time as clock
+
+from .bench import measure
+from .models import (
+    Children, College, CollegeTiming, CustomUser, DriverProfileMapping, Parent_Profile, Profile, VehicleType, hash_otp,
+)
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register `factory(fixtures) -> callable` as the benchmark `name`."""
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+class Fixtures:
+    """
+    Deterministic data for the benchmarks: one driver with profile and
+    college mapping, one parent with `children` children. The same seed
+    always gives the same rows, so runs are comparable.
+    """
+
+    def __init__(self, seed=1234, children=50):
+        rng = random.Random(seed)
+        vehicle_type = VehicleType.objects.create(vehicle_name="Van")
+        self.college = College.objects.create(college_name="Seeded College", is_active=True)
+        self.timing = CollegeTiming.objects.create(start_shift=clock(8, 0), end_shift=clock(16, 0))
+
+        self.driver = CustomUser.objects.create_user(phone_number=f"9{rng.randrange(10 ** 9):09d}", is_driver=True)
+        self.profile = Profile.objects.create(
+            user=self.driver, full_name="Seeded Driver", dob="1990-01-01", email="driver@example.com",
+            licence_no="DL0001", licence_exp_date="2030-01-01", vehicle_type=vehicle_type, vehicle_no="KA01AB1234",
+        )
+        DriverProfileMapping.objects.create(driver=self.profile, college=self.college, timing=self.timing)
+
+        self.parent = CustomUser.objects.create_user(phone_number=f"8{rng.randrange(10 ** 9):09d}", is_student=True)
+        Parent_Profile.objects.create(user=self.parent, full_name="Seeded Parent", dob="1985-01-01", email="parent@example.com")
+        Children.objects.bulk_create([
+            Children(
+                parent=self.parent, college=self.college, collegetiming=self.timing,
+                full_name=f"Child {number}", dob=date(2010 + rng.randrange(8), 1 + rng.randrange(12), 1),
+                age=6 + rng.randrange(10), contact_person_name="Seeded Parent",
+                contact_person_number=f"7{rng.randrange(10 ** 9):09d}",
+            )
+            for number in range(children)
+        ])
+
+        self.driver = CustomUser.objects.select_related('profile', 'profile__vehicle_type').get(pk=self.driver.pk)
+        self.children = list(
+            Children.objects.filter(parent=self.parent)
+            .select_related('college', 'collegetiming', 'parent', 'parent__parent_profile')
+            .order_by('id')
+        )
+
+
+@benchmark('GetCustomUserSerializer')
+def bench_user_serializer(fixtures):
+    from .serializers import GetCustomUserSerializer
+    return lambda: GetCustomUserSerializer(fixtures.driver).data
+
+
+@benchmark('ChildrenListSerializer')
+def bench_children_serializer(fixtures):
+    from .serializers import ChildrenListSerializer
+    return lambda: ChildrenListSerializer(fixtures.children, many=True).data
+
+
+@benchmark('ProfileListSerializer')
+def bench_profile_serializer(fixtures):
+    from .serializers import ProfileListSerializer
+    return lambda: ProfileListSerializer(fixtures.profile).data
+
+
+@benchmark('CHILDREN_LIST_ROWS')
+def bench_children_rows(fixtures):
+    from .serializers import CHILDREN_LIST_ROWS
+    rows = CHILDREN_LIST_ROWS.values(Children.objects.filter(parent=fixtures.parent).order_by('id'))
+    return lambda: CHILDREN_LIST_ROWS.render(rows.all())
+
+
+@benchmark('PROFILE_LIST_ROWS')
+def bench_profile_rows(fixtures):
+    from .serializers import PROFILE_LIST_ROWS
+    rows = PROFILE_LIST_ROWS.values(Profile.objects.filter(pk=fixtures.profile.pk))
+    return lambda: PROFILE_LIST_ROWS.render(rows.all())[0]
+
+
+@benchmark('VerifyOTPSerializer')
+def bench_verify_otp_serializer(fixtures):
+    from .serializers import VerifyOTPSerializer
+    data = {'phone_number': fixtures.driver.phone_number, 'otp_code': '4821'}
+    return lambda: VerifyOTPSerializer(data=data).is_valid(raise_exception=True)
+
+
+@benchmark('hash_otp')
+def bench_hash_otp(fixtures):
+    return lambda: hash_otp('4821')
+
+
+@benchmark('RefreshToken.for_user')
+def bench_jwt(fixtures):
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    def issue():
+        refresh = RefreshToken.for_user(fixtures.driver)
+        return str(refresh), str(refresh.access_token)
+    return issue
+
+
+@benchmark('save_driver_profile_mapping')
+def bench_driver_mapping(fixtures):
+    from .utils import save_driver_profile_mapping
+    return lambda: save_driver_profile_mapping(
+        fixtures.profile, fixtures.college.college_name, fixtures.timing.start_shift, fixtures.timing.end_shift,
+    )
+
+
+def measure_ops(fn, min_time=0.2, rounds=5):
+    """
+    Best-of-`rounds` throughput. Each round calls fn() in batches until
+    `min_time` seconds have passed.
+    """
+    fn()
+    batch = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(batch):
+            fn()
+        if time.perf_counter() - started >= min_time / 10:
+            break
+        batch *= 2
+
+    best = 0.0
+    for _ in range(rounds):
+        calls = 0
+        started = time.perf_counter()
+        while True:
+            for _ in range(batch):
+                fn()
+            calls += batch
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_time:
+                break
+        best = max(best, calls / elapsed)
+    return best
+
+
+def measure_peak_bytes(fn):
+    """Peak memory traced by tracemalloc during one call of fn(), after a warm-up call."""
+    fn()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - start
+
+
+def run_benchmarks(fixtures, names=None, min_time=0.2, rounds=5):
+    results = {}
+    for name, factory in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        fn = factory(fixtures)
+        results[name] = {
+            'ops_per_second': round(measure_ops(fn, min_time, rounds), 1),
+            'peak_bytes': measure_peak_bytes(fn),
+            'queries': measure(fn, repeat=0)[0],
+        }
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Benchmarks whose throughput fell by more than `threshold` (a fraction) against the baseline."""
+    slower = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        change = result['ops_per_second'] / before['ops_per_second'] - 1
+        if change < -threshold:
+            slower.append((name, before['ops_per_second'], result['ops_per_second'], change))
+    return slower
@@ -0,0 +1,143 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from core.metrics import RequestSample, current_sample, method_label, metrics_settings, metrics_token_matches, registry
+from core.routers import begin_routing, end_routing, pin_seconds, pin_user, resolved_user, routing_state
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaPinningMiddleware:
+    """
+    Read-your-writes for core.routers.PrimaryReplicaRouter. Unsafe requests
+    use the primary throughout; after a write the client is pinned to the
+    primary for REPLICA_PIN_SECONDS, through a cookie (browser sessions,
+    the admin) and per authenticated user in the cache (API clients).
+    """
+    cookie_name = 'db_pinned'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, 'DATABASE_REPLICAS', ()):
+            return self.get_response(request)
+        token = begin_routing(self.pinned(request), request)
+        try:
+            response = self.get_response(request)
+            state = routing_state()
+        finally:
+            end_routing(token)
+
+        if state.wrote:
+            self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'DATABASE_REPLICAS', ()):
+            return await self.get_response(request)
+        # The routing state is a mutable object, so writes made in
+        # sync_to_async threads below still mark it
+        token = begin_routing(self.pinned(request), request)
+        try:
+            response = await self.get_response(request)
+            state = routing_state()
+        finally:
+            end_routing(token)
+
+        if state.wrote:
+            # request.user may still be a lazy, database-backed lookup
+            await sync_to_async(self.pin)(request, response)
+        return response
+
+    def pinned(self, request):
+        return request.method not in SAFE_METHODS or self.cookie_name in request.COOKIES
+
+    def pin(self, request, response):
+        seconds = pin_seconds()
+        response.set_cookie(self.cookie_name, '1', max_age=seconds, httponly=True, samesite='Lax')
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_user(user.pk)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records every request's latency and status per route (the URL pattern,
+    e.g. api/children/list/<int:parent_id>/) and method for core.metrics;
+    methods outside HTTP_METHODS are recorded as 'other'.
+
+    A SAMPLE_RATE fraction of requests (settings.REQUEST_METRICS) also
+    records SQL timing: query count, total SQL time and slowest statement,
+    and the time spent outside SQL (views, serializers, rendering). Queries
+    reach the sample through core.metrics.sample_queries, so those of async
+    views, run in sync_to_async threads, are counted as well. Sampled
+    responses to staff users and to scrapers sending METRICS_TOKEN carry a
+    Server-Timing header with the breakdown, for dev tools and load tests.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = metrics_settings()
+        sample = RequestSample() if random.random() < config['SAMPLE_RATE'] else None
+        started = time.perf_counter()
+        if sample is None:
+            response = self.get_response(request)
+        else:
+            token = current_sample.set(sample)
+            try:
+                response = self.get_response(request)
+            finally:
+                current_sample.reset(token)
+        return self.record(request, response, config, sample, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        config = metrics_settings()
+        sample = RequestSample() if random.random() < config['SAMPLE_RATE'] else None
+        started = time.perf_counter()
+        if sample is None:
+            response = await self.get_response(request)
+        else:
+            token = current_sample.set(sample)
+            try:
+                response = await self.get_response(request)
+            finally:
+                current_sample.reset(token)
+        return self.record(request, response, config, sample, time.perf_counter() - started)
+
+    def record(self, request, response, config, sample, elapsed):
+        match = request.resolver_match
+        route = match.route if match is not None else 'unmatched'
+        registry.record_request(route, method_label(request.method), response.status_code, elapsed, sample)
+        if sample is not None and config['SERVER_TIMING'] and self.may_see_timing(request):
+            response['Server-Timing'] = (
+                f'db;dur={sample.sql_seconds * 1000:.2f};desc="{sample.queries} queries", '
+                f'db-slowest;dur={sample.slowest_seconds * 1000:.2f}, '
+                f'app;dur={sample.app_seconds(elapsed) * 1000:.2f}, '
+                f'total;dur={elapsed * 1000:.2f}'
+            )
+        return response
+
+    def may_see_timing(self, request):
+        # Only a user the request already authenticated; no extra session lookup
+        if metrics_token_matches(request):
+            return True
+        user = resolved_user(request)
+        return bool(user is not None and user.is_staff)
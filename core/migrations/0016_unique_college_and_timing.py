@@ -0,0 +1,64 @@
+from django.db import migrations, models
+
+
+def college_key(name):
+    return ' '.join(str(name).split()).casefold()
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Fill College.name_key and fold duplicate colleges and timings into the
+    oldest row of each group, so the unique constraints can be added.
+    """
+    College = apps.get_model('core', 'College')
+    CollegeTiming = apps.get_model('core', 'CollegeTiming')
+    Children = apps.get_model('core', 'Children')
+    DriverProfileMapping = apps.get_model('core', 'DriverProfileMapping')
+    # The database being migrated, not wherever the router sends reads
+    db = schema_editor.connection.alias
+
+    keep = {}
+    for college in College.objects.using(db).order_by('id'):
+        key = college_key(college.college_name)
+        if key in keep:
+            Children.objects.using(db).filter(college_id=college.id).update(college_id=keep[key])
+            DriverProfileMapping.objects.using(db).filter(college_id=college.id).update(college_id=keep[key])
+            college.delete()
+        else:
+            keep[key] = college.id
+            College.objects.using(db).filter(id=college.id).update(name_key=key)
+
+    keep = {}
+    for timing in CollegeTiming.objects.using(db).order_by('id'):
+        key = (timing.start_shift, timing.end_shift)
+        if key in keep:
+            Children.objects.using(db).filter(collegetiming_id=timing.id).update(collegetiming_id=keep[key])
+            DriverProfileMapping.objects.using(db).filter(timing_id=timing.id).update(timing_id=keep[key])
+            timing.delete()
+        else:
+            keep[key] = timing.id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_index_temp_registration_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='college',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=100, null=True),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='college',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=100, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='collegetiming',
+            constraint=models.UniqueConstraint(fields=('start_shift', 'end_shift'), name='unique_college_timing'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+SEPARATORS = re.compile(r'[\s\-().]')
+
+
+class InvalidPhoneNumber(ValueError):
+    pass
+
+
+def normalize_phone(value):
+    """core.phones.normalize_phone as of this migration."""
+    options = getattr(settings, 'PHONE_NUMBERS', {})
+    country_code = str(options.get('DEFAULT_COUNTRY_CODE', '91'))
+    national_length = options.get('NATIONAL_NUMBER_LENGTH', 10)
+
+    text = SEPARATORS.sub('', str(value or ''))
+    if text.startswith('+'):
+        digits = text[1:]
+    elif text.startswith('00'):
+        digits = text[2:]
+    else:
+        digits = text[1:] if text.startswith('0') and len(text) == national_length + 1 else text
+        if not (len(digits) == len(country_code) + national_length and digits.startswith(country_code)):
+            if len(digits) != national_length:
+                raise InvalidPhoneNumber()
+            digits = country_code + digits
+    if not digits.isdigit() or not 8 <= len(digits) <= 15 or digits[0] == '0':
+        raise InvalidPhoneNumber()
+    return '+' + digits
+
+
+def normalize_phone_numbers(apps, schema_editor):
+    """
+    Store every phone number in E.164 form and fill phone_key. Rows already
+    in E.164 keep their number; a row whose number normalizes to one that is
+    already taken, or that cannot be parsed, is left as it is without a key;
+    CustomUser.objects.get_by_phone finds those by their stored number.
+    """
+    CustomUser = apps.get_model('core', 'CustomUser')
+    db = schema_editor.connection.alias
+
+    normalized = {}
+    for user_id, phone_number in CustomUser.objects.using(db).values_list('id', 'phone_number'):
+        try:
+            normalized[user_id] = (phone_number, normalize_phone(phone_number))
+        except InvalidPhoneNumber:
+            pass
+
+    taken = set()
+    # Numbers that are already canonical claim their key first
+    order = sorted(normalized.items(), key=lambda item: (item[1][0] != item[1][1], item[0]))
+    for user_id, (phone_number, e164) in order:
+        if e164 in taken:
+            continue
+        taken.add(e164)
+        CustomUser.objects.using(db).filter(id=user_id).update(phone_number=e164, phone_key=int(e164[1:]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_unique_college_and_timing'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='phone_number',
+            field=models.CharField(db_index=True, max_length=16, unique=True),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='phone_key',
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(normalize_phone_numbers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_profile_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OTPChallenge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('otp_hash', models.CharField(max_length=64)),
+                ('payload', models.BinaryField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField()),
+                ('expires_at', models.FloatField()),
+                ('retain_until', models.FloatField(db_index=True)),
+            ],
+        ),
+    ]
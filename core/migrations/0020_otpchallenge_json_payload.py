@@ -0,0 +1,28 @@
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+def drop_pickled_challenges(apps, schema_editor):
+    """Pending challenges live for minutes; their pickled payloads are not converted."""
+    OTPChallenge = apps.get_model('core', 'OTPChallenge')
+    OTPChallenge.objects.using(schema_editor.connection.alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_otpchallenge'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_pickled_challenges, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='otpchallenge',
+            name='payload',
+        ),
+        migrations.AddField(
+            model_name='otpchallenge',
+            name='payload',
+            field=models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_otpchallenge_json_payload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='college',
+            name='name_key',
+            field=models.CharField(db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='college',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('name_key',), name='unique_active_college_name'),
+        ),
+    ]
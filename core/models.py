@@ -2,7 +2,9 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils import timezone
 import hashlib
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import RegexValidator
+from .phones import InvalidPhoneNumber, normalize_phone, phone_key
 alphanumeric = RegexValidator(r'^[0-9a-zA-Z]*$', 'Only alphanumeric characters are allowed.')
 
 
@@ -10,11 +12,50 @@ alphanumeric = RegexValidator(r'^[0-9a-zA-Z]*$', 'Only alphanumeric characters a
 def hash_otp(otp):
     return hashlib.sha256(otp.encode()).hexdigest()
 
+def college_key(name):
+    """Case- and whitespace-insensitive form of a college name, unique per College."""
+    return ' '.join(str(name).split()).casefold()
+
+class CustomUserQuerySet(models.QuerySet):
+
+    def get_by_phone(self, phone_number):
+        """
+        The user with this phone number, matched on phone_key. Users whose
+        number migration 0017 could not normalize (it did not parse, or
+        another row already had its E.164 form) have no phone_key and are
+        matched on the phone_number they were stored with, exactly as sent.
+        """
+        key = _lookup_key(phone_number)
+        if key is not None:
+            try:
+                return self.get(phone_key=key)
+            except self.model.DoesNotExist:
+                pass
+        return self.get(phone_key__isnull=True, phone_number=str(phone_number))
+
+    async def aget_by_phone(self, phone_number):
+        key = _lookup_key(phone_number)
+        if key is not None:
+            try:
+                return await self.aget(phone_key=key)
+            except self.model.DoesNotExist:
+                pass
+        return await self.aget(phone_key__isnull=True, phone_number=str(phone_number))
+
+
+def _lookup_key(phone_number):
+    try:
+        return phone_key(phone_number)
+    except InvalidPhoneNumber:
+        return None
+
+
 # Custom User Manager
-class CustomUserManager(BaseUserManager):
+class CustomUserManager(BaseUserManager.from_queryset(CustomUserQuerySet)):
     def create_user(self, phone_number, **extra_fields):
         if not phone_number:
             raise ValueError("The phone number must be set")
+        phone_number = normalize_phone(phone_number)
         extra_fields.setdefault('is_staff', False)
         extra_fields.setdefault('is_superuser', False)
         user = self.model(phone_number=phone_number, **extra_fields)
@@ -65,14 +106,15 @@ class TempUser(models.Model):
     end_shift = models.TimeField()
     max_attempts = models.PositiveIntegerField(default=5)
     attempt_count = models.PositiveIntegerField(default=0)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)  # used by sweep_temp_registrations
 
     def __str__(self):
         return f"{self.full_name} ({self.phone_number})"
 
 # Custom User Model
 class CustomUser(AbstractBaseUser, PermissionsMixin):
-    phone_number = models.CharField(max_length=15, unique=True, db_index=True)
+    phone_number = models.CharField(max_length=16, unique=True, db_index=True)  # E.164, see core.phones
+    phone_key = models.BigIntegerField(unique=True, null=True, editable=False)  # phone_key(phone_number)
     otp_hash = models.CharField(max_length=64, null=True, blank=True)
     otp_created_at = models.DateTimeField(default=timezone.now,null=True, blank=True)
     is_driver = models.BooleanField(default=False)
@@ -88,6 +130,55 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return str(self.phone_number)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        # The values as loaded, to tell which fields a save changes
+        user._loaded_values = dict(zip(field_names, values))
+        return user
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Also how a deferred field is loaded
+        self._remember_loaded_values(fields)
+
+    def _remember_loaded_values(self, fields=None):
+        loaded = getattr(self, '_loaded_values', {})
+        deferred = self.get_deferred_fields()
+        for field in self._meta.concrete_fields:
+            if field.attname not in deferred and (fields is None or field.attname in fields or field.name in fields):
+                loaded[field.attname] = getattr(self, field.attname)
+        self._loaded_values = loaded
+
+    def changed_fields(self):
+        """
+        attnames of the fields whose value differs from the row as loaded
+        or last saved; every field of a user not saved yet. A deferred field
+        counts once it is assigned.
+        """
+        if self._state.adding:
+            return {field.attname for field in self._meta.concrete_fields}
+        loaded = getattr(self, '_loaded_values', {})
+        return {
+            field.attname for field in self._meta.concrete_fields
+            if field.attname in self.__dict__ and (field.attname not in loaded or self.__dict__[field.attname] != loaded[field.attname])
+        }
+
+    def save(self, *args, **kwargs):
+        # Only a new or changed number gets a new key. Migration 0017 left
+        # some legacy rows without one because another user holds their
+        # E.164 form; saving them otherwise would break the unique key.
+        update_fields = kwargs.get('update_fields')
+        if 'phone_number' in self.changed_fields() and (update_fields is None or 'phone_number' in update_fields):
+            try:
+                self.phone_key = phone_key(self.phone_number)
+            except InvalidPhoneNumber:
+                self.phone_key = None
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields = {*update_fields, 'phone_key'}
+        super().save(*args, **kwargs)
+        self._remember_loaded_values(update_fields)
+
     class Meta:
         ordering = ['-date_joined']
         verbose_name = 'Custom User'
@@ -104,6 +195,9 @@ class Profile(models.Model):
     licence_exp_date = models.DateField(null=True, blank=True)
     vehicle_type = models.ForeignKey(VehicleType, on_delete=models.CASCADE, null=True, blank=True)
     vehicle_no = models.CharField(max_length=20, null=True, blank=True)
+    # Version of the driver-profile response: also advanced when the user,
+    # college mapping, college or timing change (core.signals)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Profile of {self.user.phone_number}"
@@ -111,16 +205,28 @@ class Profile(models.Model):
 # College Model
 class College(models.Model):
     college_name = models.CharField(max_length=100)
+    name_key = models.CharField(max_length=100, db_index=True, editable=False)  # college_key(college_name)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.college_name
 
+    def save(self, *args, **kwargs):
+        self.name_key = college_key(self.college_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'college_name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_key'}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['college_name']
         verbose_name = 'College'
         verbose_name_plural = 'Colleges'
+        constraints = [
+            # A deactivated college keeps its name; a new active one can take it again
+            models.UniqueConstraint(fields=['name_key'], condition=models.Q(is_active=True), name='unique_active_college_name'),
+        ]
 
 # =========================== College Timing Model ======================
 class CollegeTiming(models.Model):
@@ -131,11 +237,17 @@ class CollegeTiming(models.Model):
     def __str__(self):
         return f"Timing: {self.start_shift} - {self.end_shift}"
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['start_shift', 'end_shift'], name='unique_college_timing'),
+        ]
+
 # ===============================  Driver Profile Mapping Model =======================
 class DriverProfileMapping(models.Model):
     driver = models.OneToOneField(Profile, on_delete=models.CASCADE)
     college = models.ForeignKey(College, on_delete=models.CASCADE)
     timing = models.ForeignKey(CollegeTiming, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Driver {self.driver.full_name} at {self.college.college_name}"
@@ -167,12 +279,28 @@ class TempParent(models.Model):
     
     max_attempts = models.PositiveIntegerField(default=5)
     attempt_count = models.PositiveIntegerField(default=0)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)  # used by sweep_temp_registrations
 
     def __str__(self):
         return f"{self.full_name} ({self.phone_number})"
 
 
+# ======================= Pending OTP challenges ============================
+class OTPChallenge(models.Model):
+    """A pending OTP of core.otp_store.DatabaseChallengeStore, keyed by core.otp_store.challenge_key()."""
+    key = models.CharField(max_length=100, unique=True)
+    otp_hash = models.CharField(max_length=64)
+    payload = models.JSONField(null=True, encoder=DjangoJSONEncoder)  # sign-up data of a registration
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField()
+    # Unix timestamps, like core.otp_store.Challenge
+    expires_at = models.FloatField()
+    retain_until = models.FloatField(db_index=True)  # used by sweep_temp_registrations
+
+    def __str__(self):
+        return self.key
+
+
 # ======================= Chidren Profile Model ============================
 class Children(models.Model):
     college = models.ForeignKey(College, on_delete=models.CASCADE, related_name='child')
@@ -0,0 +1,352 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import IntegrityError, router, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .metrics import OTP_EXHAUSTED, OTP_EXPIRED, OTP_FAILED, OTP_VERIFIED
+
+# Challenge purposes, used as key prefixes
+DRIVER_REGISTRATION = 'driver-register'
+PARENT_REGISTRATION = 'parent-register'
+LOGIN = 'login'
+
+# Verification outcome besides the core.metrics OTP_* events
+NOT_FOUND = 'not-found'
+
+
+def challenge_key(purpose, phone_number):
+    return f"otp:{purpose}:{phone_number}"
+
+
+class Challenge:
+    """
+    A pending OTP: the hashed code, attempt counter, expiry and (for
+    registrations) the validated sign-up data waiting for verification.
+    """
+    __slots__ = ('otp_hash', 'payload', 'attempts', 'max_attempts', 'expires_at', 'retain_until')
+
+    def __init__(self, otp_hash, payload, max_attempts, expires_at, retain_until, attempts=0):
+        self.otp_hash = otp_hash
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.expires_at = expires_at
+        self.retain_until = retain_until
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def is_expired(self):
+        return time.time() > self.expires_at
+
+    @property
+    def attempts_left(self):
+        return self.max_attempts - self.attempts
+
+
+class Verification:
+    """
+    Result of BaseChallengeStore.verify(): `outcome` is OTP_VERIFIED,
+    OTP_FAILED, OTP_EXPIRED, OTP_EXHAUSTED or NOT_FOUND; `challenge` is set
+    when it is OTP_VERIFIED.
+    """
+    __slots__ = ('outcome', 'challenge', 'attempts_left')
+
+    def __init__(self, outcome, challenge=None, attempts_left=0):
+        self.outcome = outcome
+        self.challenge = challenge
+        self.attempts_left = attempts_left
+
+    @property
+    def verified(self):
+        return self.outcome == OTP_VERIFIED
+
+
+class BaseChallengeStore:
+    """
+    Holds OTP challenges outside the primary database.
+
+    `ttl` is how long a code is valid. Entries are kept for another `grace`
+    seconds so a late verify still gets "OTP expired" instead of "not found",
+    after which the store evicts them on its own.
+    """
+
+    def __init__(self, ttl=300, grace=300, max_attempts=5):
+        self.ttl = ttl
+        self.grace = grace
+        self.max_attempts = max_attempts
+
+    def new_challenge(self, otp_hash, payload):
+        now = time.time()
+        return Challenge(
+            otp_hash=otp_hash,
+            payload=payload,
+            max_attempts=self.max_attempts,
+            expires_at=now + self.ttl,
+            retain_until=now + self.ttl + self.grace,
+        )
+
+    def issue(self, key, otp_hash, payload=None):
+        """Store a fresh challenge under `key`, replacing any previous one."""
+        raise NotImplementedError
+
+    def verify(self, key, otp_hash):
+        """
+        Check one guess as a single atomic step and return a Verification.
+        A correct guess consumes the challenge, so concurrent verifies of the
+        same code get OTP_VERIFIED exactly once; every wrong guess counts, so
+        no more than `max_attempts` guesses are ever compared.
+        Expired and exhausted challenges are discarded.
+        """
+        raise NotImplementedError
+
+    # Used by the async views (core.views.auth_async). A store may do network
+    # I/O, so by default these run the sync method in a worker thread.
+    async def aissue(self, key, otp_hash, payload=None):
+        return await sync_to_async(self.issue)(key, otp_hash, payload)
+
+    async def averify(self, key, otp_hash):
+        return await sync_to_async(self.verify)(key, otp_hash)
+
+
+class MemoryChallengeStore(BaseChallengeStore):
+    """
+    In-process store. Only suitable when a single process serves the OTP
+    endpoints; DatabaseChallengeStore and CacheChallengeStore share state
+    between workers. Past `max_entries` the oldest challenges are dropped
+    even if still live, which is why the register endpoints are throttled
+    (core.throttling.REGISTRATION_THROTTLE_CLASSES).
+    """
+
+    def __init__(self, max_entries=100000, **options):
+        super().__init__(**options)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # Every entry has the same lifetime, so insertion order is expiry order
+        while self._entries:
+            key, challenge = next(iter(self._entries.items()))
+            if challenge.retain_until > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def issue(self, key, otp_hash, payload=None):
+        challenge = self.new_challenge(otp_hash, payload)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = challenge
+            self._evict(time.time())
+        return challenge
+
+    def verify(self, key, otp_hash):
+        with self._lock:
+            challenge = self._entries.get(key)
+            if challenge is None or challenge.retain_until <= time.time():
+                self._entries.pop(key, None)
+                return Verification(NOT_FOUND)
+            if challenge.attempts >= challenge.max_attempts:
+                del self._entries[key]
+                return Verification(OTP_EXHAUSTED)
+            if challenge.is_expired():
+                del self._entries[key]
+                return Verification(OTP_EXPIRED)
+            if challenge.otp_hash != otp_hash:
+                challenge.attempts += 1
+                return Verification(OTP_FAILED, attempts_left=challenge.attempts_left)
+            del self._entries[key]
+            return Verification(OTP_VERIFIED, challenge)
+
+    # Nothing to wait for: call straight from the event loop
+    async def aissue(self, key, otp_hash, payload=None):
+        return self.issue(key, otp_hash, payload)
+
+    async def averify(self, key, otp_hash):
+        return self.verify(key, otp_hash)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CacheChallengeStore(BaseChallengeStore):
+    """
+    Store backed by a Django cache alias, the default. With
+    django.core.cache.backends.redis.RedisCache it is shared by every worker;
+    LocMemCache works as a local stand-in for development and single-process
+    deployments (core.checks warns about it under `check --deploy`).
+
+    The attempt counter lives in its own key so wrong guesses are counted
+    with the cache's atomic incr(), and a correct guess relies on delete()
+    reporting whether it removed the key. DatabaseCache has neither (its
+    incr() is a get and a set, and its writes give up silently when the
+    database is busy): use DatabaseChallengeStore instead.
+    """
+
+    def __init__(self, cache_alias='default', **options):
+        super().__init__(**options)
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def issue(self, key, otp_hash, payload=None):
+        challenge = self.new_challenge(otp_hash, payload)
+        timeout = self.ttl + self.grace
+        self.cache.set_many({key: challenge, f"{key}:attempts": 0}, timeout)
+        return challenge
+
+    def verify(self, key, otp_hash):
+        challenge = self.cache.get(key)
+        if challenge is None:
+            return Verification(NOT_FOUND)
+        # Take the attempt before comparing: incr() is atomic, so concurrent
+        # guesses each get their own number and only max_attempts are compared
+        try:
+            attempt = self.cache.incr(f"{key}:attempts")
+        except ValueError:
+            return Verification(NOT_FOUND)
+        if attempt > challenge.max_attempts:
+            self.cache.delete_many([key, f"{key}:attempts"])
+            return Verification(OTP_EXHAUSTED)
+        if challenge.is_expired():
+            self.cache.delete_many([key, f"{key}:attempts"])
+            return Verification(OTP_EXPIRED)
+        if challenge.otp_hash != otp_hash:
+            return Verification(OTP_FAILED, attempts_left=challenge.max_attempts - attempt)
+        # delete() is true for exactly one caller
+        if not self.cache.delete(key):
+            return Verification(NOT_FOUND)
+        self.cache.delete(f"{key}:attempts")
+        challenge.attempts = attempt - 1
+        return Verification(OTP_VERIFIED, challenge)
+
+
+class DatabaseChallengeStore(BaseChallengeStore):
+    """
+    Store backed by the OTPChallenge table, shared by every worker like the
+    TempUser/TempParent rows it replaces. For deployments without a shared
+    cache: each issue is a DELETE and an INSERT and each verify an UPDATE
+    and usually a DELETE on the primary, outside core.write_queue, which is
+    the write traffic CacheChallengeStore keeps off the database.
+
+    Every step is a single statement, so the database settles races: a
+    guess is compared only after a conditional UPDATE counted it below
+    max_attempts, and only the caller whose DELETE removed the row gets
+    OTP_VERIFIED. Exhausted rows stay until the key is reissued; rows past
+    their grace period are removed by the sweep_temp_registrations command.
+    Every query goes to the primary, even outside a pinned request: a
+    replica may not have the row yet, and the count read back must be the
+    one the UPDATE wrote. Payloads are stored as JSON, so dates and times
+    come back as ISO strings.
+    """
+
+    @property
+    def rows(self):
+        from .models import OTPChallenge
+        return OTPChallenge.objects.db_manager(router.db_for_write(OTPChallenge))
+
+    def _row_fields(self, challenge):
+        return {
+            'otp_hash': challenge.otp_hash,
+            'payload': challenge.payload,
+            'attempts': 0,
+            'max_attempts': challenge.max_attempts,
+            'expires_at': challenge.expires_at,
+            'retain_until': challenge.retain_until,
+        }
+
+    def issue(self, key, otp_hash, payload=None):
+        challenge = self.new_challenge(otp_hash, payload)
+        fields = self._row_fields(challenge)
+        # Replacing the row gives it a new id, so a guess still holding the
+        # old one cannot count against or take the new challenge
+        self.rows.filter(key=key).delete()
+        try:
+            self.rows.create(key=key, **fields)
+        except IntegrityError:
+            # A concurrent issue for the same key won; the last one counts
+            self.rows.filter(key=key).delete()
+            self.rows.create(key=key, **fields)
+        return challenge
+
+    # issue() with the async ORM. averify() keeps the default thread: the
+    # guess is counted in a transaction, which the async ORM cannot open.
+    async def aissue(self, key, otp_hash, payload=None):
+        challenge = self.new_challenge(otp_hash, payload)
+        fields = self._row_fields(challenge)
+        await self.rows.filter(key=key).adelete()
+        try:
+            await self.rows.acreate(key=key, **fields)
+        except IntegrityError:
+            await self.rows.filter(key=key).adelete()
+            await self.rows.acreate(key=key, **fields)
+        return challenge
+
+    def verify(self, key, otp_hash):
+        row = (
+            self.rows.filter(key=key, retain_until__gt=time.time())
+            .values_list('id', 'otp_hash', 'payload', 'max_attempts', 'expires_at', 'retain_until')
+            .first()
+        )
+        if row is None:
+            return Verification(NOT_FOUND)
+        row_id, stored_hash, payload, max_attempts, expires_at, retain_until = row
+        challenge = self.rows.filter(id=row_id)
+
+        # Count the guess before comparing it. The row stays locked until
+        # the commit, so the count read back is this guess's own number.
+        with transaction.atomic(using=challenge.db):
+            counted = challenge.filter(attempts__lt=max_attempts).update(attempts=F('attempts') + 1)
+            attempt = challenge.values_list('attempts', flat=True).first() if counted else None
+        if attempt is None:
+            # Left in place: a counted guess may still be on its way to taking it
+            return Verification(OTP_EXHAUSTED if challenge.exists() else NOT_FOUND)
+        if time.time() > expires_at:
+            challenge.delete()
+            return Verification(OTP_EXPIRED)
+        if stored_hash != otp_hash:
+            return Verification(OTP_FAILED, attempts_left=max_attempts - attempt)
+        deleted, _ = challenge.delete()
+        if not deleted:
+            return Verification(NOT_FOUND)
+        return Verification(OTP_VERIFIED, Challenge(
+            otp_hash=stored_hash, payload=payload, max_attempts=max_attempts,
+            expires_at=expires_at, retain_until=retain_until, attempts=attempt - 1,
+        ))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_challenge_store():
+    """Return the store configured by settings.OTP_CHALLENGE_STORE."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, 'OTP_CHALLENGE_STORE', {})
+                backend = import_string(config.get('BACKEND', 'core.otp_store.CacheChallengeStore'))
+                _store = backend(**config.get('OPTIONS', {}))
+    return _store
+
+
+@receiver(setting_changed)
+def reset_challenge_store(setting, **kwargs):
+    global _store
+    if setting == 'OTP_CHALLENGE_STORE':
+        _store = None
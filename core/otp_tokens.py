@@ -0,0 +1,195 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .metrics import OTP_EXHAUSTED, OTP_EXPIRED, OTP_FAILED
+
+SALT = 'core.otp_tokens'
+
+
+class ChallengeRejected(Exception):
+    """A signed challenge that does not verify. `outcome` is the metrics event to count."""
+
+    def __init__(self, detail, outcome=OTP_FAILED):
+        super().__init__(detail)
+        self.detail = detail
+        self.outcome = outcome
+
+
+def signed_challenge_settings():
+    return {
+        'ENABLED': False,
+        'SECRET_KEY': None,
+        'FALLBACK_KEYS': [],
+        'TTL': 300,
+        'MAX_ATTEMPTS': 5,
+        'REPLAY_CACHE_SIZE': 100000,
+        **getattr(settings, 'OTP_SIGNED_CHALLENGES', {}),
+    }
+
+
+def signed_challenges_enabled():
+    return bool(signed_challenge_settings()['ENABLED'])
+
+
+class UsedChallenges:
+    """
+    Bounded record of challenge nonces seen by this process: attempt
+    counts and whether the challenge was used. Entries go away when their
+    challenge expires. When the cache is full an unexpired entry is evicted,
+    and every challenge expiring no later than it is treated as expired from
+    then on, so an eviction can never re-open a used challenge.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.horizon = 0
+
+    def _evict(self, now):
+        while self._entries:
+            nonce, (_, expires, _) = next(iter(self._entries.items()))
+            if expires > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[nonce]
+            if expires > now:
+                self.horizon = max(self.horizon, expires)
+
+    def _entry(self, nonce, expires):
+        entry = self._entries.get(nonce)
+        if entry is None:
+            entry = self._entries[nonce] = [0, expires, False]
+            self._evict(time.time())
+        return entry
+
+    def reserve(self, nonce, expires, max_attempts):
+        """
+        Count a guess before it is compared, in one step under the lock, so
+        concurrent guesses cannot all pass the limit. Raises ChallengeRejected
+        if the challenge was used, ran out of attempts or fell behind the
+        horizon. A wrong guess keeps its attempt; a right one uses the
+        challenge (use()).
+        """
+        with self._lock:
+            # Taken first: adding the entry may evict others and move the horizon
+            entry = self._entry(nonce, expires)
+            if expires <= self.horizon:
+                raise ChallengeRejected("OTP expired. Please request a new OTP.", OTP_EXPIRED)
+            if entry[2]:
+                raise ChallengeRejected("Invalid OTP.")
+            if entry[0] >= max_attempts:
+                raise ChallengeRejected("Maximum OTP attempts exceeded. Please request a new OTP.", OTP_EXHAUSTED)
+            entry[0] += 1
+
+    def use(self, nonce, expires):
+        """Mark the challenge used. False if another request used it first."""
+        with self._lock:
+            if expires <= self.horizon:
+                return False
+            entry = self._entry(nonce, expires)
+            if entry[2]:
+                return False
+            entry[2] = True
+            return True
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SignedChallenges:
+    """
+    Stateless OTP challenges. issue() returns a token, signed with
+    django.core.signing, that carries the purpose, phone number, expiry, a
+    random nonce and an HMAC of the code keyed with the server secret; the
+    client sends it back with the code. verify() checks all of it without
+    touching the database or a shared store, so any worker holding the
+    secret can verify any challenge. Reuse and guessing are stopped by
+    UsedChallenges, which is per process: with N workers a challenge can
+    be tried up to N * MAX_ATTEMPTS times before it expires and, in the
+    worst case, used once on each worker. Use the challenge store
+    (core.otp_store) where that is not acceptable.
+    """
+
+    def __init__(self, secret_key, fallback_keys=(), ttl=300, max_attempts=5, replay_cache_size=100000):
+        self.secret_key = secret_key
+        self.fallback_keys = list(fallback_keys)
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.used = UsedChallenges(replay_cache_size)
+
+    def _code_mac(self, secret, purpose, phone_number, nonce, expires, otp_code):
+        value = f'{purpose}:{phone_number}:{nonce}:{expires}:{otp_code}'
+        return salted_hmac(SALT, value, secret=secret, algorithm='sha256').hexdigest()
+
+    def issue(self, purpose, phone_number, otp_code):
+        nonce = secrets.token_urlsafe(12)
+        expires = int(time.time()) + self.ttl
+        payload = {
+            'p': purpose,
+            'n': phone_number,
+            'x': expires,
+            'r': nonce,
+            'c': self._code_mac(self.secret_key, purpose, phone_number, nonce, expires, otp_code),
+        }
+        return signing.dumps(payload, key=self.secret_key, salt=SALT)
+
+    def verify(self, purpose, phone_number, otp_code, token):
+        """Use up the challenge `token` for `otp_code`; raises ChallengeRejected unless it is valid."""
+        try:
+            payload = signing.loads(token, key=self.secret_key, salt=SALT, fallback_keys=self.fallback_keys)
+        except signing.BadSignature:
+            raise ChallengeRejected("Invalid OTP.")
+        if payload.get('p') != purpose or payload.get('n') != phone_number:
+            raise ChallengeRejected("Invalid OTP.")
+
+        nonce, expires = payload['r'], payload['x']
+        if expires <= time.time():
+            raise ChallengeRejected("OTP expired. Please request a new OTP.", OTP_EXPIRED)
+        self.used.reserve(nonce, expires, self.max_attempts)
+
+        code_matches = any(
+            constant_time_compare(self._code_mac(secret, purpose, phone_number, nonce, expires, otp_code), payload['c'])
+            for secret in [self.secret_key, *self.fallback_keys]
+        )
+        if not code_matches:
+            raise ChallengeRejected("Invalid OTP.")
+
+        # Fails if a concurrent login already used it
+        if not self.used.use(nonce, expires):
+            raise ChallengeRejected("Invalid OTP.")
+
+
+_signed_challenges = None
+_signed_challenges_lock = threading.Lock()
+
+
+def get_signed_challenges():
+    """Return the SignedChallenges configured by settings.OTP_SIGNED_CHALLENGES."""
+    global _signed_challenges
+    if _signed_challenges is None:
+        with _signed_challenges_lock:
+            if _signed_challenges is None:
+                options = signed_challenge_settings()
+                _signed_challenges = SignedChallenges(
+                    options['SECRET_KEY'] or settings.SECRET_KEY,
+                    fallback_keys=options['FALLBACK_KEYS'],
+                    ttl=options['TTL'],
+                    max_attempts=options['MAX_ATTEMPTS'],
+                    replay_cache_size=options['REPLAY_CACHE_SIZE'],
+                )
+    return _signed_challenges
+
+
+@receiver(setting_changed)
+def reset_signed_challenges(setting, **kwargs):
+    global _signed_challenges
+    if setting in ('OTP_SIGNED_CHALLENGES', 'SECRET_KEY'):
+        _signed_challenges = None
@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ChildrenCursorPagination(CursorPagination):
+    """
+    Keyset pagination on Children.id.
+    Each page is a single `WHERE id > <cursor> ORDER BY id LIMIT n` query,
+    so the cost of a page does not grow with the number of rows before it.
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
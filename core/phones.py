@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+SEPARATORS = re.compile(r'[\s\-().]')
+
+
+class InvalidPhoneNumber(ValueError):
+    pass
+
+
+def phone_settings():
+    return {
+        'DEFAULT_COUNTRY_CODE': '91',
+        'NATIONAL_NUMBER_LENGTH': 10,
+        'BLOOM_CAPACITY': 1_000_000,
+        'BLOOM_ERROR_RATE': 0.001,
+        'REFRESH_SECONDS': 300,
+        **getattr(settings, 'PHONE_NUMBERS', {}),
+    }
+
+
+def normalize_phone(value):
+    """
+    E.164 form ('+919876543210') of a phone number. '+' or '00' mark an
+    international number; otherwise the number is national (an optional
+    trunk '0' is dropped) in the DEFAULT_COUNTRY_CODE, unless it already
+    starts with that code and is exactly long enough to include it.
+    """
+    options = phone_settings()
+    country_code = str(options['DEFAULT_COUNTRY_CODE'])
+    national_length = options['NATIONAL_NUMBER_LENGTH']
+
+    text = SEPARATORS.sub('', str(value or ''))
+    if text.startswith('+'):
+        digits = text[1:]
+    elif text.startswith('00'):
+        digits = text[2:]
+    else:
+        digits = text[1:] if text.startswith('0') and len(text) == national_length + 1 else text
+        if not (len(digits) == len(country_code) + national_length and digits.startswith(country_code)):
+            if len(digits) != national_length:
+                raise InvalidPhoneNumber(f"Enter a {national_length}-digit number or include the country code.")
+            digits = country_code + digits
+    if not digits.isdigit() or not 8 <= len(digits) <= 15 or digits[0] == '0':
+        raise InvalidPhoneNumber("Enter a valid phone number.")
+    return '+' + digits
+
+
+def phone_key(value):
+    """The E.164 digits of a phone number as an integer, e.g. 919876543210."""
+    return int(normalize_phone(value)[1:])
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over integers: no false negatives, false
+    positives at about `error_rate` once `capacity` items are added.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.to_bytes(8, 'big'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RegisteredPhones:
+    """
+    Bloom filter of the phone_key of every CustomUser. A number the filter
+    has never seen is not registered, so sign-up checks for new numbers
+    skip the database; a hit is confirmed with a query. Users created in
+    this process are added as they are saved (core.signals). Users created
+    by other workers are picked up when the filter is reloaded, in a
+    background thread, every `refresh_seconds`; until then the unique
+    phone_key column is what stops a duplicate. The filter is first loaded
+    by the first check that needs it, not when the process starts.
+    """
+
+    def __init__(self, capacity, error_rate, refresh_seconds):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._filter = None
+        self._refreshing = False
+        self.loaded = None
+        self.skipped = 0
+        self.checked = 0
+
+    def load(self):
+        from .models import CustomUser
+
+        keys = CustomUser.objects.filter(phone_key__isnull=False).values_list('phone_key', flat=True)
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        for key in keys.iterator(chunk_size=10000):
+            bloom.add(key)
+        with self._lock:
+            self._filter = bloom
+            self.loaded = time.monotonic()
+        if bloom.count > self.capacity:
+            logger.warning(
+                f"{bloom.count} phone numbers exceed PHONE_NUMBERS['BLOOM_CAPACITY'] ({self.capacity}); "
+                f"registration checks will query the database more often."
+            )
+
+    def _refresh(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Reloading the registered phone number filter failed")
+        finally:
+            connections.close_all()
+            self._refreshing = False
+
+    def add(self, key):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(key)
+
+    def might_exist(self, key):
+        if self._filter is None:
+            # One thread scans the table; the others wait for its filter
+            with self._load_lock:
+                if self._filter is None:
+                    self.load()
+        elif self.loaded + self.refresh_seconds <= time.monotonic():
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh, name='registered-phones', daemon=True).start()
+        with self._lock:
+            return key in self._filter
+
+    def is_registered(self, key):
+        """Whether a CustomUser has this phone_key; queries only on a filter hit."""
+        from .models import CustomUser
+
+        exists = self.might_exist(key)
+        with self._lock:
+            if exists:
+                self.checked += 1
+            else:
+                self.skipped += 1
+        return exists and CustomUser.objects.filter(phone_key=key).exists()
+
+    def snapshot(self):
+        with self._lock:
+            return {'skipped': self.skipped, 'checked': self.checked}
+
+
+_registered_phones = None
+
+
+def get_registered_phones():
+    global _registered_phones
+    if _registered_phones is None:
+        options = phone_settings()
+        _registered_phones = RegisteredPhones(
+            options['BLOOM_CAPACITY'], options['BLOOM_ERROR_RATE'], options['REFRESH_SECONDS'],
+        )
+    return _registered_phones
+
+
+@receiver(setting_changed)
+def reset_registered_phones(setting, **kwargs):
+    global _registered_phones
+    if setting in ('PHONE_NUMBERS', 'DATABASES'):
+        _registered_phones = None
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import DriverProfileMapping, Profile
+
+
+def profile_cache():
+    return caches[getattr(settings, 'DRIVER_PROFILE_CACHE_ALIAS', 'default')]
+
+
+def version_stamp(updated_at):
+    return 0 if updated_at is None else int(updated_at.timestamp() * 1_000_000)
+
+
+class ProfileVersion:
+    """
+    The row versions a driver-profile response is built from: the
+    profile's updated_at and its college mapping's, if it has one.
+    Deleting and re-creating the mapping changes the version too.
+    """
+
+    def __init__(self, profile_id, profile_updated_at, mapping_updated_at):
+        self.profile_id = profile_id
+        self.profile_updated_at = profile_updated_at
+        self.mapping_updated_at = mapping_updated_at
+
+    @classmethod
+    def load(cls, user_id):
+        """The version of the driver's profile, or None; one indexed query, no serialization."""
+        row = (
+            Profile.objects.filter(user_id=user_id)
+            .values_list('id', 'updated_at', 'driverprofilemapping__updated_at')
+            .first()
+        )
+        return None if row is None else cls(*row)
+
+    @property
+    def tag(self):
+        return f'{self.profile_id}-{version_stamp(self.profile_updated_at)}-{version_stamp(self.mapping_updated_at)}'
+
+    @property
+    def etag(self):
+        return f'"{self.tag}"'
+
+    @property
+    def last_modified(self):
+        return max(filter(None, (self.profile_updated_at, self.mapping_updated_at)))
+
+
+def touch_profiles(profiles):
+    """
+    Advance updated_at of the Profile queryset `profiles`, for changes to
+    rows their driver-profile response includes. Called from core.signals.
+    """
+    profiles.update(updated_at=timezone.now())
+
+
+def touch_mappings(mappings):
+    """The same for a DriverProfileMapping queryset."""
+    mappings.update(updated_at=timezone.now())
+
+
+def cached_profile_data(version, request, build):
+    """
+    The driver-profile response data for `version`, from the cache or from
+    build(). Keys carry the version, so a write makes every cached copy of
+    the profile unreachable in all processes sharing the cache, like the
+    user cache in core.authentication. They also carry the scheme and
+    host, which the picture URLs are built from.
+    """
+    key = f"driver-profile:{version.tag}:{request.build_absolute_uri('/')}"
+    cache = profile_cache()
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, getattr(settings, 'DRIVER_PROFILE_CACHE_TIMEOUT', 300))
+    return data
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import router, transaction
+from django.dispatch import receiver
+from django.utils.dateparse import parse_time
+
+from .models import College, CollegeTiming, VehicleType, college_key
+
+
+def timing_key(start_shift, end_shift):
+    """(start, end) as datetime.time values; strings such as '08:00' are parsed."""
+    def as_time(value):
+        if isinstance(value, str):
+            parsed = parse_time(value.strip())
+            if parsed is None:
+                raise ValueError(f"Invalid shift time {value!r}.")
+            return parsed
+        return value
+    return as_time(start_shift), as_time(end_shift)
+
+
+class LRU:
+    """Bounded mapping with per-entry expiry. Not locked; see ReferenceCache."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.timeout)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, value):
+        """Drop every key that maps to value."""
+        for key in [key for key, (held, _) in self._entries.items() if held == value]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ReferenceData:
+    """
+    One load of the vehicle type, college and timing tables. `document` is
+    what the reference-data endpoint serves; `version` is a hash of it, so
+    every process holding the same rows reports the same version.
+    """
+
+    def __init__(self, vehicle_types, colleges, timings):
+        self.vehicle_types = {row['id']: row for row in vehicle_types}
+        self.college_names = {row['id']: row['college_name'] for row in colleges}
+        self.document = {
+            'vehicle_types': [
+                {'id': row['id'], 'vehicle_name': row['vehicle_name']} for row in vehicle_types if row['is_active']
+            ],
+            'colleges': [{'id': row['id'], 'college_name': row['college_name']} for row in colleges],
+            'timings': [
+                {'id': row['id'], 'start_shift': row['start_shift'].isoformat(), 'end_shift': row['end_shift'].isoformat()}
+                for row in timings
+            ],
+        }
+        canonical = json.dumps(self.document, sort_keys=True, separators=(',', ':'))
+        self.version = hashlib.sha256(canonical.encode()).hexdigest()[:20]
+        self.loaded = time.monotonic()
+
+    @classmethod
+    def load(cls):
+        return cls(
+            list(VehicleType.objects.order_by('id').values('id', 'vehicle_name', 'is_active', 'created_at')),
+            list(College.objects.filter(is_active=True).order_by('college_name', 'id').values('id', 'college_name')),
+            list(CollegeTiming.objects.order_by('start_shift', 'end_shift').values('id', 'start_shift', 'end_shift')),
+        )
+
+    def vehicle_type(self, pk):
+        """A fresh VehicleType for pk, or None when there is no such row."""
+        row = self.vehicle_types.get(pk)
+        return None if row is None else VehicleType(**row)
+
+    def college_name(self, pk):
+        """The name of active College pk, or None."""
+        return self.college_names.get(pk)
+
+
+class ReferenceCache:
+    """
+    Resolves college names and shift times to College and CollegeTiming ids.
+    Hits cost no queries; misses use get_or_create against the unique
+    active name_key and (start_shift, end_shift) constraints, so concurrent
+    registrations of a new college end up on the same row. It also holds
+    the ReferenceData snapshot behind VehicleTypeField and the
+    reference-data endpoint. Entries are dropped when a VehicleType,
+    College or CollegeTiming is saved or deleted in this process
+    (core.signals; a College drops only the names that map to it) and
+    after TIMEOUT seconds, which bounds how long other workers can hold
+    on to a stale id.
+    """
+
+    def __init__(self, max_entries=512, timeout=300):
+        self._lock = threading.Lock()
+        self.timeout = timeout
+        self._colleges = LRU(max_entries, timeout)
+        self._timings = LRU(max_entries, timeout)
+        self._data = None
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, table, key):
+        with self._lock:
+            value = table.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def _remember(self, table, key, value, model):
+        def put():
+            with self._lock:
+                table.put(key, value)
+        # A row created inside a transaction that later rolls back must not stay cached
+        transaction.on_commit(put, using=router.db_for_write(model))
+
+    def college_id(self, college_name):
+        key = college_key(college_name)
+        college_id = self._lookup(self._colleges, key)
+        if college_id is None:
+            # Inactive colleges are never picked: a new active one is created, as before name_key
+            college, _ = College.objects.get_or_create(
+                name_key=key, is_active=True, defaults={'college_name': ' '.join(str(college_name).split())},
+            )
+            college_id = college.id
+            self._remember(self._colleges, key, college_id, College)
+        return college_id
+
+    def timing_id(self, start_shift, end_shift):
+        key = timing_key(start_shift, end_shift)
+        timing_id = self._lookup(self._timings, key)
+        if timing_id is None:
+            timing, _ = CollegeTiming.objects.get_or_create(start_shift=key[0], end_shift=key[1])
+            timing_id = timing.id
+            self._remember(self._timings, key, timing_id, CollegeTiming)
+        return timing_id
+
+    def reference_data(self):
+        data = self._data
+        if data is None or data.loaded + self.timeout <= time.monotonic():
+            data = ReferenceData.load()
+            if transaction.get_connection(router.db_for_read(VehicleType)).in_atomic_block:
+                # It may include rows that are rolled back later
+                return data
+            with self._lock:
+                self._data = data
+        return data
+
+    def vehicle_type(self, pk):
+        """
+        VehicleType `pk` from the snapshot. Ids the snapshot does not know
+        are looked up once, in case another process just added them.
+        """
+        vehicle_type = self.reference_data().vehicle_type(pk)
+        if vehicle_type is None:
+            vehicle_type = VehicleType.objects.filter(pk=pk).first()
+            if vehicle_type is not None:
+                self.forget_reference_data()
+        return vehicle_type
+
+    def college_name(self, pk):
+        """
+        Name of the active College `pk`, from the snapshot, with the same
+        one-query fallback as vehicle_type().
+        """
+        name = self.reference_data().college_name(pk)
+        if name is None:
+            name = College.objects.filter(pk=pk, is_active=True).values_list('college_name', flat=True).first()
+            if name is not None:
+                self.forget_reference_data()
+        return name
+
+    def forget_reference_data(self):
+        with self._lock:
+            self._data = None
+
+    def forget_college(self, college_id):
+        with self._lock:
+            self._colleges.discard(college_id)
+            self._data = None
+
+    def forget_colleges(self):
+        with self._lock:
+            self._colleges.clear()
+            self._data = None
+
+    def forget_timings(self):
+        with self._lock:
+            self._timings.clear()
+            self._data = None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'colleges': len(self._colleges),
+                'timings': len(self._timings),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_reference_cache = None
+
+
+def reference_cache_settings():
+    return {
+        'MAX_ENTRIES': 512,
+        'TIMEOUT': 300,
+        'HTTP_MAX_AGE': 300,
+        **getattr(settings, 'REFERENCE_CACHE', {}),
+    }
+
+
+def get_reference_cache():
+    global _reference_cache
+    if _reference_cache is None:
+        options = reference_cache_settings()
+        _reference_cache = ReferenceCache(max_entries=options['MAX_ENTRIES'], timeout=options['TIMEOUT'])
+    return _reference_cache
+
+
+@receiver(setting_changed)
+def reset_reference_cache(setting, **kwargs):
+    global _reference_cache
+    if setting in ('REFERENCE_CACHE', 'DATABASES'):
+        _reference_cache = None
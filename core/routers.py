@@ -0,0 +1,139 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject, empty
+
+
+class RoutingState:
+    """
+    Per-request routing flags. A mutable object (rather than a bare
+    ContextVar value) so a write in a copied context, e.g. a thread started
+    by sync_to_async, still pins the rest of the request.
+    """
+
+    def __init__(self, pinned=False, request=None):
+        self.pinned = pinned
+        self.wrote = False
+        self.request = request
+        self.user_checked = False
+
+
+_routing_state = ContextVar('db_routing_state', default=None)
+
+
+def routing_state():
+    state = _routing_state.get()
+    if state is None:
+        state = RoutingState()
+        _routing_state.set(state)
+    return state
+
+
+def begin_routing(pinned=False, request=None):
+    """Start a fresh routing state; returns the token for end_routing()."""
+    return _routing_state.set(RoutingState(pinned, request))
+
+
+def end_routing(token):
+    _routing_state.reset(token)
+
+
+def pin_seconds():
+    """How long after a write a client keeps reading from the primary (replication lag budget)."""
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def user_pin_key(user_id):
+    return f'db:pin:user:{user_id}'
+
+
+def pin_user(user_id):
+    cache.set(user_pin_key(user_id), 1, pin_seconds())
+
+
+def resolved_user(request):
+    """
+    The request's user if it has already been looked up, else None. The
+    lazy user set by AuthenticationMiddleware is not evaluated here: its
+    session and user queries are routed too, and would come back to the
+    router while the lookup is still running.
+    """
+    user = getattr(request, '_cached_user', None)
+    if user is not None:
+        return user
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        # Evaluated through another reference, or still pending
+        return None if user._wrapped is empty else user._wrapped
+    # Set directly, e.g. by DRF after authenticating the request
+    return user
+
+
+def _user_recently_wrote(state):
+    """
+    Whether the request's user wrote within REPLICA_PIN_SECONDS on an earlier
+    request. Token-authenticated API clients send no cookies, so their
+    stickiness is kept per user in the cache. Checked once, as soon as an
+    authenticated user has been resolved (DRF authenticates inside the
+    view, after the middleware has run); until then reads are not pinned.
+    """
+    user = resolved_user(state.request)
+    if user is None or not user.is_authenticated:
+        return False
+    # Before the cache lookup, which may itself read through this router
+    state.user_checked = True
+    return bool(cache.get(user_pin_key(user.pk)))
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes go to the primary. Reads go to a random replica from
+    settings.DATABASE_REPLICAS, except when the current request is pinned to
+    the primary: unsafe methods (all OTP flows are POSTs), any request that
+    has already written, and clients that wrote within REPLICA_PIN_SECONDS
+    (see core.middleware.ReplicaPinningMiddleware).
+    """
+
+    @staticmethod
+    def databases():
+        return {DEFAULT_DB_ALIAS, *getattr(settings, 'DATABASE_REPLICAS', ())}
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if not replicas:
+            return None
+        state = routing_state()
+        if not state.pinned and not state.user_checked and state.request is not None:
+            state.pinned = _user_recently_wrote(state)
+        if state.pinned:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Follow relations on the database the instance came from
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db not in (None, *self.databases()):
+            # An alias outside primary/replicas (e.g. a benchmark copy) routes itself
+            return None
+        state = routing_state()
+        state.pinned = True
+        state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = self.databases()
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        if db in getattr(settings, 'DATABASE_REPLICAS', ()):
+            return False
+        return None
@@ -0,0 +1,231 @@
+"""
+Read-only rendering of a ModelSerializer straight from values() rows.
+
+A RowSerializer compiles its serializer's fields once into a plan: the
+values() lookup each field reads (nested serializers become joins), and
+which fields can take the database value as it is. Rendering fetches
+those columns in one query, plus one per many-to-many field, and builds
+the same dicts DRF would, without model instances or per-row
+serializers. Fields that format their value (dates, times, files,
+ThumbnailURLsField, ...) still go through the serializer's own
+to_representation(), so the JSON is identical to the DRF output.
+
+Supported fields: model fields and forward/one-to-one relations reached
+through `source`, nested ModelSerializers, primary-key many-to-many
+lists, and SerializerMethodFields that return a nested serializer's data
+(`method_fields`). Anything else raises ImproperlyConfigured when the
+plan is compiled.
+"""
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import models
+from rest_framework import relations, serializers
+
+# Fields whose to_representation() returns the value values() gives for them
+IDENTITY_FIELDS = (
+    serializers.BooleanField, serializers.CharField, serializers.EmailField,
+    serializers.IntegerField, serializers.ReadOnlyField,
+)
+
+
+class Column:
+    """A field read from one column."""
+
+    def __init__(self, name, column, identity, file_field=None):
+        self.name = name
+        self.column = column
+        self.identity = identity
+        self.file_field = file_field
+
+
+class Nested:
+    """A nested serializer; `column` is its primary key, None when there is no related row."""
+
+    def __init__(self, name, column, plan, serializer_class=None):
+        self.name = name
+        self.column = column
+        self.plan = plan
+        self.serializer_class = serializer_class
+
+
+class Many:
+    """Primary keys of a many-to-many field, fetched by the owner's primary key in `column`."""
+
+    def __init__(self, name, column, field):
+        self.name = name
+        self.column = column
+        self.field = field
+
+    def fetch(self, owner_ids):
+        through = self.field.remote_field.through
+        source, target = self.field.m2m_field_name(), self.field.m2m_reverse_field_name()
+        # In the related model's default order, as a prefetch would return them
+        ordering = [
+            f'-{target}__{order[1:]}' if order.startswith('-') else f'{target}__{order}'
+            for order in self.field.related_model._meta.ordering
+        ]
+        pks = {}
+        rows = (
+            through.objects.filter(**{f'{source}__in': owner_ids})
+            .order_by(*ordering, 'pk').values_list(source, target)
+        )
+        for owner_id, pk in rows:
+            pks.setdefault(owner_id, []).append(pk)
+        return lambda owner_id: pks.get(owner_id, [])
+
+
+def resolve(model, attrs):
+    """(model, field) for a serializer source on `model`, following forward and one-to-one relations."""
+    field = None
+    for attr in attrs:
+        if field is not None:
+            if not (field.many_to_one or field.one_to_one):
+                raise ImproperlyConfigured(f"Cannot follow {field} in a row serializer source.")
+            model = field.related_model
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            raise ImproperlyConfigured(f"{model.__name__}.{attr} is not a model field.")
+    return model, field
+
+
+def compile_plan(serializer, model, prefix='', method_fields=None):
+    method_fields = method_fields or {}
+    entries = []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        name = field.field_name
+
+        if name in method_fields:
+            source, serializer_class = method_fields[name]
+            _, related = resolve(model, source.split('.'))
+            lookup = prefix + source.replace('.', '__')
+            plan = compile_plan(serializer_class(), related.related_model, lookup + '__')
+            entries.append(Nested(name, lookup + '__pk', plan, serializer_class))
+            continue
+        if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+            raise ImproperlyConfigured(
+                f"{type(serializer).__name__}.{name} needs the instance; list it in method_fields."
+            )
+
+        _, model_field = resolve(model, field.source_attrs)
+        lookup = prefix + '__'.join(field.source_attrs)
+
+        if isinstance(field, serializers.BaseSerializer):
+            if isinstance(field, serializers.ListSerializer):
+                raise ImproperlyConfigured(f"{type(serializer).__name__}.{name}: nested lists are not supported.")
+            plan = compile_plan(field, model_field.related_model, lookup + '__')
+            entries.append(Nested(name, lookup + '__pk', plan))
+        elif isinstance(field, relations.ManyRelatedField):
+            child = field.child_relation
+            if type(child) is not relations.PrimaryKeyRelatedField or child.pk_field is not None:
+                raise ImproperlyConfigured(f"{type(serializer).__name__}.{name}: only primary key lists are supported.")
+            owner_pk = prefix + '__'.join([*field.source_attrs[:-1], 'pk'])
+            entries.append(Many(name, owner_pk, model_field))
+        elif isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is None:
+            # values() gives the related primary key for a relation
+            entries.append(Column(name, lookup, identity=True))
+        else:
+            file_field = model_field if isinstance(model_field, models.FileField) else None
+            identity = type(field) in IDENTITY_FIELDS and file_field is None
+            entries.append(Column(name, lookup, identity, file_field))
+    return Plan(entries)
+
+
+class Plan:
+    def __init__(self, entries):
+        self.entries = entries
+
+    @property
+    def columns(self):
+        columns = []
+        for entry in self.entries:
+            columns.append(entry.column)
+            if isinstance(entry, Nested):
+                columns.extend(entry.plan.columns)
+        return list(dict.fromkeys(columns))
+
+    def bind(self, serializer, rows):
+        """
+        (name, column, convert, nested) for each field, with convert taken
+        from the fields of `serializer`, which carry the render context.
+        nested is (bound plan, {primary key: data}) for nested serializers.
+        """
+        bound = []
+        fields = serializer.fields
+        for entry in self.entries:
+            if isinstance(entry, Nested):
+                nested = entry.serializer_class() if entry.serializer_class else fields[entry.name]
+                bound.append((entry.name, entry.column, None, (entry.plan.bind(nested, rows), {})))
+            elif isinstance(entry, Many):
+                owner_ids = {row[entry.column] for row in rows} - {None}
+                bound.append((entry.name, entry.column, entry.fetch(owner_ids), None))
+            elif entry.identity:
+                bound.append((entry.name, entry.column, None, None))
+            elif entry.file_field is not None:
+                bound.append((entry.name, entry.column, file_converter(entry.file_field, fields[entry.name]), None))
+            else:
+                bound.append((entry.name, entry.column, fields[entry.name].to_representation, None))
+        return bound
+
+
+def file_converter(model_field, field):
+    # The field expects the FieldFile a model instance would hold
+    def convert(name):
+        return field.to_representation(model_field.attr_class(None, model_field, name))
+    return convert
+
+
+def build(bound, row):
+    data = {}
+    for name, column, convert, nested in bound:
+        value = row[column]
+        if value is None:
+            data[name] = None
+        elif nested is not None:
+            # Rows sharing a related row share its dict, built once per render
+            plan, built = nested
+            nested_data = built.get(value)
+            if nested_data is None:
+                nested_data = built[value] = build(plan, row)
+            data[name] = nested_data
+        elif convert is None:
+            data[name] = value
+        else:
+            data[name] = convert(value)
+    return data
+
+
+class RowSerializer:
+    """
+    The output of `serializer_class(instances, many=True).data`, built from
+    values() rows. `method_fields` maps a SerializerMethodField name to
+    (source, serializer class) when the method returns
+    `serializer_class(instance.<source>).data`, or None when the related
+    row does not exist. Related rows that repeat across the list (the
+    parent of every child) are rendered once and the same dict is reused,
+    so treat the result as read-only.
+
+        rows = CHILDREN_LIST_ROWS.values(queryset)  # a values() queryset, can be paginated
+        data = CHILDREN_LIST_ROWS.render(rows, context={'request': request})
+    """
+
+    def __init__(self, serializer_class, method_fields=None):
+        self.serializer_class = serializer_class
+        self.method_fields = method_fields or {}
+        self._plan = None
+
+    @property
+    def plan(self):
+        if self._plan is None:
+            self._plan = compile_plan(self.serializer_class(), self.serializer_class.Meta.model, '', self.method_fields)
+        return self._plan
+
+    def values(self, queryset):
+        """`queryset` as values() rows holding every column the plan reads."""
+        return queryset.select_related(None).prefetch_related(None).values(*self.plan.columns)
+
+    def render(self, rows, context=None):
+        rows = list(rows)
+        bound = self.plan.bind(self.serializer_class(context=context or {}), rows)
+        return [build(bound, row) for row in rows]
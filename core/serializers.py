@@ -1,6 +1,11 @@
 from rest_framework import serializers
-from .models import CustomUser, Profile, TempUser,TempParent, VehicleType, Parent_Profile, hash_otp,Children, College,CollegeTiming,DriverProfileMapping
-from django.utils import timezone
+from .models import CustomUser, Profile, VehicleType, Parent_Profile, hash_otp,Children, College,CollegeTiming,DriverProfileMapping
+from .otp_store import get_challenge_store, challenge_key, DRIVER_REGISTRATION, PARENT_REGISTRATION
+from .images import thumbnail_urls, validate_image_size
+from .uploads import UploadRejected, keep_upload, open_completed_upload
+from .reference import get_reference_cache
+from .phones import InvalidPhoneNumber, get_registered_phones, normalize_phone, phone_key
+from .row_serializers import RowSerializer
 import random
 import re 
 
@@ -12,54 +17,137 @@ def generate_otp() -> str:
     return str(random.randint(1000, 9999))
 
 
+class ThumbnailURLsField(serializers.ReadOnlyField):
+    """
+    Per-size thumbnail URLs for an image field, e.g.
+    {"small": ".../x-small.webp", "medium": ..., "large": ...}.
+    """
+
+    def to_representation(self, value):
+        urls = thumbnail_urls(value)
+        request = self.context.get('request')
+        if urls and request is not None:
+            urls = {size: request.build_absolute_uri(url) for size, url in urls.items()}
+        return urls
+
+
+def canonical_phone_number(value):
+    """E.164 form of a submitted phone number (core.phones)."""
+    try:
+        return normalize_phone(value)
+    except InvalidPhoneNumber as exc:
+        raise serializers.ValidationError(str(exc))
+
+
+def phone_number_registered(phone_number):
+    """Whether a user has this (E.164) number; new numbers are answered without a query."""
+    return get_registered_phones().is_registered(phone_key(phone_number))
+
+
+class VehicleTypeField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField for VehicleType that validates against the
+    process-local reference snapshot (core.reference) instead of querying.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', VehicleType.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        vehicle_type = get_reference_cache().vehicle_type(pk)
+        if vehicle_type is None:
+            self.fail('does_not_exist', pk_value=data)
+        return vehicle_type
+
+
 class RegistrationSerializer(serializers.Serializer):
     full_name = serializers.CharField(max_length=200)
     dob = serializers.CharField(max_length=20)
     email = serializers.EmailField()
-    phone_number = serializers.CharField(max_length=15)
+    phone_number = serializers.CharField(max_length=20)
     licence_no = serializers.CharField(max_length=20)
     licence_exp_date = serializers.DateField()
-    vehicle_type = serializers.PrimaryKeyRelatedField(queryset=VehicleType.objects.all())
+    vehicle_type = VehicleTypeField()
     vehicle_no = serializers.CharField(max_length=20)
     is_driver = serializers.BooleanField()
     is_student = serializers.BooleanField()
-    college_name = serializers.CharField(max_length=100)
+    # An existing college picked from colleges/search, or a free-text name
+    college = serializers.IntegerField(required=False)
+    college_name = serializers.CharField(max_length=100, required=False)
     start_shift = serializers.TimeField()
     end_shift = serializers.TimeField()
 
     def validate_phone_number(self, value):
         """
-        Check if a real user already exists with this phone number.
+        Normalize the number and check if a real user already exists with it.
         """
-        if CustomUser.objects.filter(phone_number=value).exists():
+        phone_number = canonical_phone_number(value)
+        if phone_number_registered(phone_number):
             raise serializers.ValidationError("A user with this phone number already exists.")
-        return value
+        return phone_number
+
+    def validate(self, attrs):
+        if attrs.get('college') is not None:
+            college_name = get_reference_cache().college_name(attrs['college'])
+            if college_name is None:
+                raise serializers.ValidationError({'college': "Unknown college."})
+            attrs['college_name'] = college_name
+        elif not attrs.get('college_name'):
+            raise serializers.ValidationError({'college_name': "Provide college_name or college."})
+        return attrs
 
     def create(self, validated_data):
         """
-        Create a TempUser and generate OTP.
+        Store the registration in the OTP challenge store and generate OTP.
         """
         phone_number = validated_data['phone_number']
         self.validate_phone_number(phone_number)
-        TempUser.objects.filter(phone_number=phone_number).delete()
 
         # Generate OTP and hash it
         otp_code = generate_otp()
         hashed_otp = hash_otp(otp_code)
 
-        # Create TempUser
-        temp_user = TempUser.objects.create(
-            **validated_data,
-            otp_hash=hashed_otp,
-            otp_created_at=timezone.now(),
+        # Keep the sign-up data with the challenge until it is verified
+        payload = dict(validated_data, vehicle_type=validated_data['vehicle_type'].pk)
+        challenge = get_challenge_store().issue(
+            challenge_key(DRIVER_REGISTRATION, phone_number),
+            hashed_otp,
+            payload,
         )
 
-        return temp_user, otp_code
+        return challenge, otp_code
+
+
+class DriverImportSerializer(RegistrationSerializer):
+    """
+    RegistrationSerializer rules for bulk import (core.importers).
+    The vehicle type is resolved from the importer's lookup table and phone
+    numbers are checked against existing users once per chunk, so
+    validating a row does not hit the database.
+    """
+    vehicle_type = serializers.IntegerField()
+    is_driver = serializers.BooleanField(default=True)
+    is_student = serializers.BooleanField(default=False)
+
+    def validate_phone_number(self, value):
+        return canonical_phone_number(value)
 
 
 class VerifyOTPSerializer(serializers.Serializer):
     phone_number = serializers.CharField()
     otp_code = serializers.CharField()
+    # The signed challenge returned by send-otp when OTP_SIGNED_CHALLENGES is enabled
+    challenge = serializers.CharField(required=False, max_length=512)
+
+    def validate_phone_number(self, value):
+        return canonical_phone_number(value)
 
     def validate_otp_code(self, value):
         """
@@ -69,12 +157,26 @@ class VerifyOTPSerializer(serializers.Serializer):
             raise serializers.ValidationError("OTP must contain digits only.")
         return value
 
+
+class LoginOTPSerializer(VerifyOTPSerializer):
+    """
+    VerifyOTPSerializer for logins. A number that does not normalize is
+    kept as sent, for the accounts CustomUser.objects.get_by_phone matches
+    on their stored number.
+    """
+
+    def validate_phone_number(self, value):
+        try:
+            return normalize_phone(value)
+        except InvalidPhoneNumber:
+            return value
+
 #====================== User Serializer =======================
 
 class CustomUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
-        fields = '__all__'
+        exclude = ['phone_key']
 
 
 
@@ -82,13 +184,15 @@ class ProfileSerializer(serializers.ModelSerializer):
     """
     Serializer for user profile details.
     """
-    vehicle_type = serializers.PrimaryKeyRelatedField(queryset=VehicleType.objects.all())
+    vehicle_type = VehicleTypeField()
+    profile_pic_thumbnails = ThumbnailURLsField(source='profile_pic')
 
     class Meta:
         model = Profile
         fields = [
             'full_name',
             'profile_pic',
+            'profile_pic_thumbnails',
             'dob',
             'email',
             'licence_no',
@@ -100,6 +204,8 @@ class ProfileSerializer(serializers.ModelSerializer):
 
 #===================Parent Profile serializer=======================
 class ParentProfileSerializer(serializers.ModelSerializer):
+     profile_pic_thumbnails = ThumbnailURLsField(source='profile_pic')
+
      class Meta:
         model = Parent_Profile
         fields = '__all__'
@@ -131,56 +237,64 @@ class ParentRegistrationSerializer(serializers.Serializer):
     full_name = serializers.CharField(max_length=200)
     dob = serializers.CharField(max_length=20)
     email = serializers.EmailField()
-    phone_number = serializers.CharField(max_length=15)
+    phone_number = serializers.CharField(max_length=20)
    
     is_student = serializers.BooleanField()
-    profile_pic = serializers.ImageField(required=False, allow_null=True)  # Add this field
-
-   
+    profile_pic = serializers.ImageField(required=False, allow_null=True, validators=[validate_image_size])  # Add this field
+    # Finished resumable upload (core.views.uploads), instead of profile_pic
+    upload_id = serializers.CharField(required=False, write_only=True)
+
+    def validate(self, attrs):
+        upload_id = attrs.pop('upload_id', None)
+        if upload_id:
+            if attrs.get('profile_pic'):
+                raise serializers.ValidationError("Send either profile_pic or upload_id, not both.")
+            try:
+                upload = open_completed_upload(upload_id)
+            except UploadRejected as exc:
+                raise serializers.ValidationError({'upload_id': exc.detail})
+            attrs['profile_pic'] = self.fields['profile_pic'].run_validation(upload)
+        return attrs
 
     def validate_phone_number(self, value):
         """
-        Check if a real Parent already exists with this phone number.
+        Require a 10-digit national number, normalize it and check if a real
+        Parent already exists with it.
         """
-        if not re.fullmatch(r"\d{10}", value): 
+        if not re.fullmatch(r"\d{10}", value):
             raise serializers.ValidationError("Phone number must be exactly 10 digits.")
-        if CustomUser.objects.filter(phone_number=value).exists():
+        phone_number = canonical_phone_number(value)
+        if phone_number_registered(phone_number):
             raise serializers.ValidationError("A Parent with this phone number already exists.")
-        return value
+        return phone_number
 
     def create(self, validated_data):
         """
-        Create a TempUser and generate OTP.
+        Store the registration in the OTP challenge store and generate OTP.
         """
         phone_number = validated_data['phone_number']
-        self.validate_phone_number(phone_number)
-        TempParent.objects.filter(phone_number=phone_number).delete()
+        # Already normalized by validate_phone_number(); only the registration check is repeated
+        if phone_number_registered(phone_number):
+            raise serializers.ValidationError("A Parent with this phone number already exists.")
 
         # Generate OTP and hash it
         otp_code = generate_otp()
         hashed_otp = hash_otp(otp_code)
 
+        # The picture stays in the spool directory until the OTP is verified
         profile_pic = validated_data.pop('profile_pic', None)
-
-        # Create TempUser
-        temp_parent = TempParent.objects.create(
-            **validated_data,
-            otp_hash=hashed_otp,
-            otp_created_at=timezone.now(),
+        if profile_pic:
+            validated_data['profile_pic_path'] = keep_upload(profile_pic)
+            validated_data['profile_pic_name'] = profile_pic.name
+
+        # Keep the sign-up data with the challenge until it is verified
+        challenge = get_challenge_store().issue(
+            challenge_key(PARENT_REGISTRATION, phone_number),
+            hashed_otp,
+            validated_data,
         )
 
-        
-
-        # ✅ Create Parent Profile
-        # parent_profile = Parent_Profile.objects.create(
-        #     #user=user,
-        #     full_name=validated_data["full_name"],
-        #     dob=validated_data.get("dob", ""),
-        #     email=validated_data.get("email", ""),
-        #     profile_pic=profile_pic
-        # )
-        
-        return temp_parent, otp_code
+        return challenge, otp_code
 
 
 
@@ -190,7 +304,7 @@ class ParentRegistrationSerializer(serializers.Serializer):
 class CollegeSerializer(serializers.ModelSerializer):
     class Meta:
         model = College
-        fields = '__all__'
+        exclude = ['name_key']
 
 class CollegeTimingSerializer(serializers.ModelSerializer):
     class Meta:
@@ -219,6 +333,17 @@ class ChildrenSerializer(serializers.ModelSerializer):
         return value
     
 
+class ChildrenImportSerializer(ChildrenSerializer):
+    """
+    ChildrenSerializer rules for bulk import (core.importers).
+    Foreign keys arrive as ids the importer has already resolved, so
+    validating a row does not hit the database.
+    """
+    college = serializers.IntegerField(source='college_id')
+    collegetiming = serializers.IntegerField(source='collegetiming_id')
+    parent = serializers.IntegerField(source='parent_id')
+
+
 class ChildrenListSerializer(serializers.ModelSerializer):
     college = CollegeSerializer()  # Include College details
     collegetiming = CollegeTimingSerializer()  # Include CollegeTiming details
@@ -244,29 +369,43 @@ class ProfileListSerializer(serializers.ModelSerializer):
     college = serializers.SerializerMethodField()
     collegetiming = serializers.SerializerMethodField()
     user = CustomUserSerializer()  # Change 'driver' to 'user'
+    profile_pic_thumbnails = ThumbnailURLsField(source='profile_pic')
 
     class Meta:
         model = Profile
         fields = '__all__'
 
+    # The mapping comes through the reverse one-to-one, so a profile loaded
+    # with select_related('driverprofilemapping__college',
+    # 'driverprofilemapping__timing') needs no further queries
     def get_college(self, obj):
         try:
-            mapping = DriverProfileMapping.objects.get(driver=obj)
-            return CollegeSerializer(mapping.college).data
+            return CollegeSerializer(obj.driverprofilemapping.college).data
         except DriverProfileMapping.DoesNotExist:
             return None
 
     def get_collegetiming(self, obj):
         try:
-            mapping = DriverProfileMapping.objects.get(driver=obj)
-            return CollegeTimingSerializer(mapping.timing).data
+            return CollegeTimingSerializer(obj.driverprofilemapping.timing).data
         except DriverProfileMapping.DoesNotExist:
             return None
 
+
+# The list serializers rendered from values() rows (core.row_serializers),
+# for the children list and driver profile views
+CHILDREN_LIST_ROWS = RowSerializer(ChildrenListSerializer)
+PROFILE_LIST_ROWS = RowSerializer(ProfileListSerializer, method_fields={
+    'college': ('driverprofilemapping.college', CollegeSerializer),
+    'collegetiming': ('driverprofilemapping.timing', CollegeTimingSerializer),
+})
+
 class ProfileUpdateSerializer(serializers.ModelSerializer):
+    vehicle_type = VehicleTypeField(allow_null=True, required=False)
+
     class Meta:
         model = Profile
         fields = ['full_name', 'profile_pic', 'dob', 'email', 'licence_no', 'licence_exp_date', 'vehicle_type', 'vehicle_no']
+        extra_kwargs = {'profile_pic': {'validators': [validate_image_size]}}
 
 
 # ====================Serializer for DriverProfileMapping ============================
@@ -0,0 +1,96 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .authentication import bump_user_version
+from .college_search import college_changed, reset_college_index
+from .phones import get_registered_phones
+from .images import schedule_thumbnails
+from .models import College, CollegeTiming, CustomUser, DriverProfileMapping, Parent_Profile, Profile, VehicleType
+from .profile_cache import touch_mappings, touch_profiles
+from .reference import get_reference_cache
+from .serializers import CustomUserSerializer
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    bump_user_version(instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+def remember_registered_phone(sender, instance, created, **kwargs):
+    if created and instance.phone_key is not None:
+        get_registered_phones().add(instance.phone_key)
+
+
+def profile_user_fields():
+    """attnames of the CustomUser fields in driver-profile responses (ProfileListSerializer.user)."""
+    return {field.attname for field in CustomUser._meta.concrete_fields} - set(CustomUserSerializer.Meta.exclude)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=College)
+@receiver(post_save, sender=CollegeTiming)
+def touch_driver_profiles(sender, instance, created, update_fields, **kwargs):
+    # New rows are in no driver-profile response yet, so creating them costs no query here
+    if created:
+        return
+    if sender is CustomUser:
+        changed = instance.changed_fields()
+        if update_fields is not None:
+            changed &= update_fields
+        # e.g. a save that changes nothing, or only phone_key
+        if changed & profile_user_fields():
+            touch_profiles(Profile.objects.filter(user=instance))
+    elif sender is College:
+        touch_mappings(DriverProfileMapping.objects.filter(college=instance))
+    else:
+        touch_mappings(DriverProfileMapping.objects.filter(timing=instance))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=Parent_Profile)
+def generate_profile_pic_thumbnails(sender, instance, **kwargs):
+    schedule_thumbnails(instance)
+
+
+@receiver(post_save, sender=College)
+@receiver(post_delete, sender=College)
+def invalidate_cached_college(sender, instance, **kwargs):
+    # By id, since a renamed college is still cached under its old name
+    get_reference_cache().forget_college(instance.pk)
+
+
+@receiver(post_save, sender=College)
+def index_saved_college(sender, instance, using, **kwargs):
+    college_id, name, is_active = instance.pk, instance.college_name, instance.is_active
+    transaction.on_commit(lambda: college_changed(college_id, name, is_active), using=using)
+
+
+@receiver(post_delete, sender=College)
+def unindex_deleted_college(sender, instance, using, **kwargs):
+    college_id = instance.pk
+    transaction.on_commit(lambda: college_changed(college_id), using=using)
+
+
+@receiver(post_save, sender=CollegeTiming)
+@receiver(post_delete, sender=CollegeTiming)
+def invalidate_cached_timings(sender, **kwargs):
+    get_reference_cache().forget_timings()
+
+
+@receiver(post_save, sender=VehicleType)
+@receiver(post_delete, sender=VehicleType)
+def invalidate_cached_vehicle_types(sender, **kwargs):
+    get_reference_cache().forget_reference_data()
+
+
+@receiver(post_migrate)
+def invalidate_reference_cache(sender, **kwargs):
+    # flush and migrate (e.g. test databases) replace the rows without saving them
+    cache = get_reference_cache()
+    cache.forget_colleges()
+    cache.forget_timings()
+    cache.forget_reference_data()
+    reset_college_index()
@@ -0,0 +1,271 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class SMSMessage:
+    __slots__ = ('phone_number', 'text', 'enqueued_at')
+
+    def __init__(self, phone_number, text):
+        self.phone_number = phone_number
+        self.text = text
+        self.enqueued_at = time.monotonic()
+
+    def as_dict(self):
+        return {"phone_number": self.phone_number, "text": self.text}
+
+
+# ============================ Providers ============================
+
+class BaseSMSProvider:
+    """
+    Sends a batch of messages in one provider call.
+    Raise any exception to have the whole batch retried.
+    """
+
+    def send_batch(self, messages):
+        raise NotImplementedError
+
+
+class LogSMSProvider(BaseSMSProvider):
+    """Writes the messages to the log (development default)."""
+
+    def send_batch(self, messages):
+        for message in messages:
+            logger.info(f"SMS to {message.phone_number}: {message.text}")
+
+
+class FileSMSProvider(BaseSMSProvider):
+    """Appends each batch to a file as JSON lines. Used as a stand-in in tests."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages):
+        lines = "".join(json.dumps(message.as_dict()) + "\n" for message in messages)
+        with self._lock, open(self.path, "a") as handle:
+            handle.write(lines)
+
+
+class HTTPSMSProvider(BaseSMSProvider):
+    """
+    POSTs {"messages": [...]} as JSON to `url`. Pointed at
+    `manage.py run_sms_standin` it acts as a loopback stand-in for a real
+    SMS gateway.
+    """
+
+    def __init__(self, url, timeout=5, headers=None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+
+    def send_batch(self, messages):
+        body = json.dumps({"messages": [message.as_dict() for message in messages]}).encode()
+        request = urllib.request.Request(self.url, data=body, headers=self.headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise RuntimeError(f"SMS provider answered {response.status}")
+
+
+def standin_server(host='127.0.0.1', port=8025, latency_ms=0, fail_rate=0, output=None, on_batch=None):
+    """
+    A local stand-in for the SMS gateway that accepts HTTPSMSProvider
+    batches, optionally with artificial latency and failures. Returns the
+    (not yet serving) server; port 0 picks a free port.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency_ms / 1000)
+            if random.random() < fail_rate:
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            messages = json.loads(body or b'{}').get('messages', [])
+            if output:
+                with open(output, 'a') as handle:
+                    for message in messages:
+                        handle.write(json.dumps(message) + "\n")
+            if on_batch:
+                on_batch(messages)
+
+            self.send_response(202)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({"accepted": len(messages)}).encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+# ============================ Dispatcher ============================
+
+class OTPDispatcher:
+    """
+    Queues SMS messages and delivers them from background threads, so
+    request latency does not depend on the provider.
+
+    Each worker takes up to `batch_size` messages (waiting at most
+    `batch_wait` seconds to fill a batch), sends them in one provider call
+    and retries failed batches with exponential backoff.
+    """
+
+    def __init__(self, provider, workers=2, batch_size=50, batch_wait=0.05,
+                 max_retries=3, retry_backoff=0.5, queue_size=10000):
+        self.provider = provider
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = {'enqueued': 0, 'dropped': 0, 'sent': 0, 'failed': 0, 'retries': 0, 'batches': 0}
+        self.latencies = deque(maxlen=10000)
+        self._stats_lock = threading.Lock()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"otp-dispatch-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, phone_number, text):
+        """Queue a message without blocking. Returns False if the queue is full."""
+        if not self._threads:
+            self.start()
+        try:
+            self.queue.put_nowait(SMSMessage(phone_number, text))
+        except queue.Full:
+            self._count('dropped')
+            logger.warning(f"OTP dispatch queue full, dropped SMS to {phone_number}")
+            return False
+        self._count('enqueued')
+        return True
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._deliver(batch)
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _deliver(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.provider.send_batch(batch)
+            except Exception as exc:
+                if attempt == self.max_retries:
+                    self._count('failed', len(batch))
+                    logger.error(f"Giving up on {len(batch)} OTP SMS after {attempt + 1} attempts: {exc}")
+                    return
+                self._count('retries')
+                time.sleep(self.retry_backoff * (2 ** attempt))
+            else:
+                break
+
+        delivered_at = time.monotonic()
+        with self._stats_lock:
+            self.stats['sent'] += len(batch)
+            self.stats['batches'] += 1
+            self.latencies.extend(delivered_at - message.enqueued_at for message in batch)
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been handled."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout=5):
+        self._stopping.set()
+        self.flush(timeout)
+
+    def snapshot(self):
+        """Counters plus p50/p95/p99 delivery latency in milliseconds."""
+        with self._stats_lock:
+            data = dict(self.stats)
+            latencies = sorted(self.latencies)
+        data['queued'] = self.queue.qsize()
+        for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            value = latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] if latencies else None
+            data[f'latency_{name}_ms'] = None if value is None else round(value * 1000, 2)
+        return data
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_otp_dispatcher():
+    """Return the dispatcher configured by settings.OTP_DELIVERY."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                config = dict(getattr(settings, 'OTP_DELIVERY', {}))
+                provider_class = import_string(config.pop('PROVIDER', 'core.sms.LogSMSProvider'))
+                provider = provider_class(**config.pop('OPTIONS', {}))
+                _dispatcher = OTPDispatcher(provider, **{key.lower(): value for key, value in config.items()})
+                atexit.register(_dispatcher.shutdown)
+    return _dispatcher
+
+
+@receiver(setting_changed)
+def reset_otp_dispatcher(setting, **kwargs):
+    global _dispatcher
+    if setting == 'OTP_DELIVERY' and _dispatcher is not None:
+        _dispatcher.shutdown()
+        _dispatcher = None
+
+
+def send_otp_sms(phone_number, otp_code):
+    """Queue the OTP text for `phone_number`; returns immediately."""
+    return get_otp_dispatcher().enqueue(phone_number, f"Your DMS verification code is {otp_code}")
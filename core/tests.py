@@ -1,3 +1,1272 @@
-from django.test import TestCase
+import contextlib
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import Group, Permission
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connections, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import empty
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core import images
+from core.authentication import CachedJWTAuthentication, user_version_key
+from core.checks import check_challenge_store_shared
+from core.college_search import CollegeIndex, reset_college_index
+from core.importers import MAX_CHUNK_SIZE, chunked, import_children
+from core.loadtest import Recorder, compare, jwt_user_id, login_body, parse_mix
+from core.management.commands.otp_contention import MAX_ATTEMPTS, race
+from core.metrics import OTP_EXHAUSTED, OTP_EXPIRED, OTP_FAILED, OTP_VERIFIED, registry
+from core.microbench import BENCHMARKS, Fixtures, regressions, run_benchmarks
+from core.models import Children, College, CollegeTiming, CustomUser, OTPChallenge, Parent_Profile, Profile, TempParent, VehicleType
+from core.otp_store import NOT_FOUND, CacheChallengeStore, DatabaseChallengeStore, MemoryChallengeStore
+from core.otp_tokens import ChallengeRejected, SignedChallenges
+from core.phones import BloomFilter, RegisteredPhones, get_registered_phones
+from core.reference import ReferenceCache, get_reference_cache
+from core.routers import PrimaryReplicaRouter, begin_routing, end_routing, pin_user, routing_state
+from core.serializers import CHILDREN_LIST_ROWS, PROFILE_LIST_ROWS, ChildrenListSerializer, ProfileListSerializer
+from core.sms import BaseSMSProvider, HTTPSMSProvider, OTPDispatcher, SMSMessage, standin_server
+from core.throttling import reset_bucket_backend
+from core.uploads import open_completed_upload
+from core.views.driver import create_driver_account
+from core.views.otp import issue_login_otp
+from core.write_queue import WriteQueue, WriteQueueBusy
+
+REPLICA = 'replica_1'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class PrimaryReplicaRouterTests(TestCase):
+    """Routing decisions only; no query reaches the replica alias."""
+
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.user = CustomUser.objects.create_user('9876543210')
+
+    def route(self, request, pinned=False):
+        token = begin_routing(pinned, request)
+        self.addCleanup(end_routing, token)
+        return self.router.db_for_read(CustomUser)
+
+    def test_unpinned_reads_go_to_a_replica(self):
+        self.assertEqual(self.route(RequestFactory().get('/')), REPLICA)
+
+    def test_pinned_request_reads_the_primary(self):
+        self.assertEqual(self.route(RequestFactory().get('/'), pinned=True), 'default')
+
+    def test_write_pins_the_rest_of_the_request(self):
+        self.assertEqual(self.route(RequestFactory().get('/')), REPLICA)
+        self.assertEqual(self.router.db_for_write(CustomUser), 'default')
+        self.assertEqual(self.router.db_for_read(CustomUser), 'default')
+
+    def test_user_who_wrote_recently_reads_the_primary(self):
+        pin_user(self.user.pk)
+        request = RequestFactory().get('/')
+        # As DRF does once it has authenticated the request
+        request.user = self.user
+        self.assertEqual(self.route(request), 'default')
+
+    def test_other_users_read_a_replica(self):
+        pin_user(self.user.pk)
+        request = RequestFactory().get('/')
+        request.user = CustomUser.objects.create_user('9876543211')
+        self.assertEqual(self.route(request), REPLICA)
+        self.assertTrue(routing_state().user_checked)
+
+    def test_lazy_session_user_is_not_resolved(self):
+        request = RequestFactory().get('/')
+        SessionMiddleware(lambda request: HttpResponse()).process_request(request)
+        AuthenticationMiddleware(lambda request: HttpResponse()).process_request(request)
+        self.assertEqual(self.route(request), REPLICA)
+        self.assertIs(request.user._wrapped, empty)
+        self.assertFalse(routing_state().user_checked)
+
+
+class ReplicaSessionRequestTests(TransactionTestCase):
+    """
+    Session-backed requests through ReplicaPinningMiddleware, the admin in
+    particular. With DATABASE_REPLICA_URLS set (e.g. to a second local
+    SQLite file) the reads go to that alias, a test mirror of the primary;
+    without it they are routed to the primary under the replica alias name
+    'default'. Mirrors only see committed rows, hence TransactionTestCase.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser('9876543210')
+
+    def get_admin_index(self, replicas):
+        self.client.force_login(self.admin)
+        with override_settings(DATABASE_REPLICAS=replicas):
+            return self.client.get(reverse('admin:index'))
+
+    def test_admin_index_with_primary_as_replica(self):
+        self.assertEqual(self.get_admin_index(['default']).status_code, 200)
+
+    @skipUnless(getattr(settings, 'DATABASE_REPLICAS', ()), "DATABASE_REPLICA_URLS is not set")
+    def test_admin_index_with_replica(self):
+        self.assertEqual(self.get_admin_index(list(settings.DATABASE_REPLICAS)).status_code, 200)
+
+
+@override_settings(REQUEST_METRICS={'SAMPLE_RATE': 1.0, 'SERVER_TIMING': True}, METRICS_TOKEN='scraper-token')
+class RequestMetricsTests(TransactionTestCase):
+    # GETs read from a replica when DATABASE_REPLICA_URLS is set
+    databases = '__all__'
+
+    def test_server_timing_needs_staff_or_token(self):
+        url = reverse('metrics')
+        self.assertNotIn('Server-Timing', self.client.get(url))
+        self.assertIn('app;dur=', self.client.get(url, HTTP_X_METRICS_TOKEN='scraper-token')['Server-Timing'])
+        token = RefreshToken.for_user(CustomUser.objects.create_superuser('9876543210')).access_token
+        self.assertIn('Server-Timing', self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}'))
+
+    def test_unknown_methods_share_one_label(self):
+        self.client.generic('BREW', reverse('reference-data'))
+        methods = {method for _, method, _ in registry.snapshot()['responses']}
+        self.assertIn('other', methods)
+        self.assertNotIn('BREW', methods)
+
+
+class PhoneLookupTests(TestCase):
+
+    def test_numbers_match_on_phone_key(self):
+        user = CustomUser.objects.create_user('9876543210')
+        self.assertEqual(CustomUser.objects.get_by_phone('+91 98765-43210'), user)
+
+    def test_users_without_phone_key_match_their_stored_number(self):
+        # As migration 0017 leaves a number it cannot normalize
+        user = CustomUser.objects.create(phone_number='12345', is_student=True)
+        self.assertIsNone(user.phone_key)
+        self.assertEqual(CustomUser.objects.get_by_phone('12345'), user)
+        with self.assertRaises(CustomUser.DoesNotExist):
+            CustomUser.objects.get_by_phone('012345')
+
+    def legacy_user(self, phone_number):
+        # As migration 0017 leaves a row whose E.164 form another user holds
+        user = CustomUser.objects.create_user('9000000009', is_student=True)
+        CustomUser.objects.filter(pk=user.pk).update(phone_number=phone_number, phone_key=None)
+        return CustomUser.objects.get(pk=user.pk)
+
+    def test_colliding_legacy_user_can_be_saved(self):
+        CustomUser.objects.create_user('9876543210')
+        legacy = self.legacy_user('09876543210')
+        legacy.is_active = False
+        legacy.save()
+        legacy.save(update_fields=['is_active'])
+        legacy.refresh_from_db()
+        self.assertIsNone(legacy.phone_key)
+        self.assertFalse(legacy.is_active)
+
+    def test_changed_number_gets_a_new_key(self):
+        legacy = self.legacy_user('09876543210')
+        legacy.phone_number = '+919876543211'
+        legacy.save(update_fields=['phone_number'])
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.phone_key, 919876543211)
+        deferred = CustomUser.objects.only('id').get(pk=legacy.pk)
+        deferred.phone_number = '+919876543212'
+        deferred.save()
+        self.assertEqual(CustomUser.objects.get(pk=legacy.pk).phone_key, 919876543212)
+
+    def test_user_without_phone_key_can_log_in(self):
+        CustomUser.objects.create(phone_number='54321', is_student=True)
+        sent = self.client.post(reverse('parent-send-otp'), {'phone_number': '54321'})
+        self.assertEqual(sent.status_code, 200)
+        response = self.client.post(reverse('parent-login'), {'phone_number': '54321', 'otp_code': sent.json()['otp_code']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_and_invalid_numbers(self):
+        self.assertEqual(self.client.post(reverse('parent-send-otp'), {'phone_number': '9000000009'}).status_code, 404)
+        self.assertEqual(self.client.post(reverse('parent-send-otp'), {'phone_number': '123'}).status_code, 400)
+
+    def test_parent_registration_needs_ten_digits(self):
+        response = self.client.post(reverse('parent-register'), {
+            'phone_number': '+919876543210', 'full_name': 'Parent', 'dob': '1985-01-01',
+            'email': 'parent@example.com', 'is_student': True,
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('phone_number', response.json())
+
+
+class ChallengeStoreTests(TransactionTestCase):
+    """
+    The otp_contention invariants for each challenge store, with the
+    guesses raced from threads: a code verifies exactly once and no more
+    than max_attempts guesses are ever compared.
+    """
+    THREADS = 8
+    STORES = {
+        'memory': MemoryChallengeStore,
+        'cache': CacheChallengeStore,
+        'database': DatabaseChallengeStore,
+    }
+
+    def setUp(self):
+        cache.clear()
+
+    def stores(self, **options):
+        for name, backend in self.STORES.items():
+            with self.subTest(store=name):
+                yield backend(max_attempts=MAX_ATTEMPTS, **options)
+
+    def test_code_verifies_exactly_once(self):
+        for store in self.stores():
+            store.issue('otp:test:once', 'right', {'full_name': 'Driver'})
+            results = race(self.THREADS, lambda number: store.verify('otp:test:once', 'right'))
+            outcomes = sorted(result.outcome for result in results)
+            self.assertEqual(outcomes, sorted([OTP_VERIFIED] + [NOT_FOUND] * (self.THREADS - 1)))
+            verified = next(result for result in results if result.verified)
+            self.assertEqual(verified.challenge.payload, {'full_name': 'Driver'})
+
+    def test_wrong_guesses_stop_at_max_attempts(self):
+        for store in self.stores():
+            store.issue('otp:test:guess', 'right')
+            results = race(self.THREADS, lambda number: store.verify('otp:test:guess', f'wrong-{number}'))
+            compared = sorted(result.attempts_left for result in results if result.outcome == OTP_FAILED)
+            self.assertEqual(compared, list(range(MAX_ATTEMPTS)))
+            self.assertTrue(all(result.outcome in (OTP_FAILED, OTP_EXHAUSTED, NOT_FOUND) for result in results))
+            # Used up: the right code no longer works either
+            self.assertFalse(store.verify('otp:test:guess', 'right').verified)
+
+    def test_reissue_replaces_the_challenge(self):
+        for store in self.stores():
+            store.issue('otp:test:reissue', 'first')
+            store.issue('otp:test:reissue', 'second')
+            self.assertEqual(store.verify('otp:test:reissue', 'first').outcome, OTP_FAILED)
+            self.assertTrue(store.verify('otp:test:reissue', 'second').verified)
+
+    def test_expired_challenge(self):
+        for store in self.stores(ttl=-1):
+            store.issue('otp:test:expired', 'right')
+            self.assertEqual(store.verify('otp:test:expired', 'right').outcome, OTP_EXPIRED)
+            self.assertEqual(store.verify('otp:test:expired', 'right').outcome, NOT_FOUND)
+
+    def test_database_payload_is_stored_as_json(self):
+        store = DatabaseChallengeStore()
+        store.issue('otp:test:json', 'right', {'licence_exp_date': datetime.date(2030, 1, 1), 'vehicle_type': 3})
+        self.assertEqual(
+            OTPChallenge.objects.get(key='otp:test:json').payload, {'licence_exp_date': '2030-01-01', 'vehicle_type': 3},
+        )
+        self.assertEqual(store.verify('otp:test:json', 'right').challenge.payload['licence_exp_date'], '2030-01-01')
+
+
+@override_settings(OTP_CHALLENGE_STORE={'BACKEND': 'core.otp_store.DatabaseChallengeStore'})
+class DatabaseChallengeStoreRegistrationTests(TestCase):
+
+    def test_registration_round_trips_through_json(self):
+        vehicle_type = VehicleType.objects.create(vehicle_name='Van')
+        response = self.client.post(reverse('register'), {
+            'phone_number': '7100000009', 'full_name': 'Driver', 'dob': '1990-01-01',
+            'email': 'driver@example.com', 'licence_no': 'L1', 'licence_exp_date': '2030-01-01',
+            'vehicle_type': vehicle_type.id, 'vehicle_no': 'KA01', 'college_name': 'Test College',
+            'start_shift': '08:00', 'end_shift': '16:00', 'is_driver': True, 'is_student': False,
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.client.post(
+            reverse('verify-otp'), {'phone_number': '7100000009', 'otp_code': response.json()['otp_code']},
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        profile = Profile.objects.get(user__phone_number='+917100000009')
+        self.assertEqual(profile.licence_exp_date, datetime.date(2030, 1, 1))
+        self.assertEqual(profile.driverprofilemapping.timing.start_shift, datetime.time(8, 0))
+
+
+class ChallengeStoreDeployCheckTests(SimpleTestCase):
+
+    def test_process_local_store_warns(self):
+        for store, caches in [
+            ({'BACKEND': 'core.otp_store.MemoryChallengeStore'}, settings.CACHES),
+            ({'BACKEND': 'core.otp_store.CacheChallengeStore'}, settings.CACHES),
+        ]:
+            with self.subTest(store=store['BACKEND']), override_settings(OTP_CHALLENGE_STORE=store, CACHES=caches):
+                self.assertEqual([error.id for error in check_challenge_store_shared(None)], ['core.W001'])
+
+    def test_shared_store_passes(self):
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379/0'}}
+        for store, caches in [
+            ({'BACKEND': 'core.otp_store.CacheChallengeStore'}, redis),
+            ({'BACKEND': 'core.otp_store.DatabaseChallengeStore'}, settings.CACHES),
+        ]:
+            with self.subTest(store=store['BACKEND']), override_settings(OTP_CHALLENGE_STORE=store, CACHES=caches):
+                self.assertEqual(check_challenge_store_shared(None), [])
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {scope: '1000000/s' for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']},
+})
+class OTPContentionTests(TransactionTestCase):
+    """The otp_contention races through the API, one client per thread."""
+    THREADS = 8
+
+    def setUp(self):
+        cache.clear()
+        self.vehicle_type = VehicleType.objects.create(vehicle_name='Van').id
+        College.objects.create(college_name='Test College', is_active=True)
+        CollegeTiming.objects.create(start_shift='08:00', end_shift='16:00')
+
+    def registration(self, phone_number):
+        return {
+            'phone_number': phone_number, 'full_name': 'Driver', 'dob': '1990-01-01',
+            'email': 'driver@example.com', 'licence_no': 'L1', 'licence_exp_date': '2030-01-01',
+            'vehicle_type': self.vehicle_type, 'vehicle_no': 'KA01', 'college_name': 'Test College',
+            'start_shift': '08:00', 'end_shift': '16:00', 'is_driver': True, 'is_student': False,
+        }
+
+    def post_all(self, url, bodies):
+        clients = [Client() for _ in bodies]
+        return race(len(bodies), lambda number: clients[number].post(url, bodies[number]))
+
+    def register(self, phone_number):
+        response = self.client.post(reverse('register'), self.registration(phone_number))
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['otp_code']
+
+    def test_registration_is_created_once(self):
+        otp = self.register('7100000001')
+        responses = self.post_all(reverse('verify-otp'), [{'phone_number': '7100000001', 'otp_code': otp}] * self.THREADS)
+        statuses = sorted(response.status_code for response in responses)
+        self.assertEqual(statuses, [201] + [404] * (self.THREADS - 1))
+        self.assertEqual(CustomUser.objects.filter(phone_number='+917100000001').count(), 1)
+        self.assertEqual(Profile.objects.filter(user__phone_number='+917100000001').count(), 1)
+
+    def test_wrong_guesses_are_compared_max_attempts_times(self):
+        otp = self.register('7100000002')
+        wrong = [f"{(int(otp) + number + 1) % 1_000_000:06d}" for number in range(self.THREADS)]
+        responses = self.post_all(
+            reverse('verify-otp'), [{'phone_number': '7100000002', 'otp_code': code} for code in wrong],
+        )
+        compared = sorted(
+            response.json()['detail'] for response in responses
+            if str(response.json().get('detail', '')).startswith('Invalid OTP.')
+        )
+        self.assertEqual(compared, sorted(f"Invalid OTP. Attempts left: {left}" for left in range(MAX_ATTEMPTS)))
+        response = self.client.post(reverse('verify-otp'), {'phone_number': '7100000002', 'otp_code': otp})
+        self.assertNotEqual(response.status_code, 201)
+
+    def test_async_registration(self):
+        response = self.client.post(reverse('async-register'), self.registration('7100000004'), content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        otp = response.json()['otp_code']
+        response = self.client.post(reverse('async-verify-otp'), {'phone_number': '7100000004', 'otp_code': otp})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.client.post(reverse('async-send-otp'), {'phone_number': '7100000004'}).status_code, 200)
+
+    def test_login_code_is_used_once(self):
+        CustomUser.objects.create_user('7100000003', is_driver=True)
+        otp = self.client.post(reverse('send-otp'), {'phone_number': '7100000003'}).json()['otp_code']
+        responses = self.post_all(reverse('login'), [{'phone_number': '7100000003', 'otp_code': otp}] * self.THREADS)
+        statuses = sorted(response.status_code for response in responses)
+        self.assertEqual(statuses, [200] + [400] * (self.THREADS - 1))
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {
+        **settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'otp_phone': '1/min', 'otp_global': '3/min',
+    },
+})
+class OTPThrottleTests(TestCase):
+
+    def setUp(self):
+        # Fresh buckets for each test, and none left drained for the tests after
+        reset_bucket_backend('THROTTLE_BUCKET_BACKEND')
+        self.addCleanup(reset_bucket_backend, 'THROTTLE_BUCKET_BACKEND')
+
+    def send_otp(self, phone_number):
+        return self.client.post(reverse('send-otp'), {'phone_number': phone_number})
+
+    def test_formatting_variants_share_a_bucket(self):
+        self.assertEqual(self.send_otp('9000000001').status_code, 404)
+        response = self.send_otp('+91 90000-00001')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_rejected_requests_take_no_global_token(self):
+        for _ in range(5):
+            self.send_otp('9000000001')
+        # The global bucket holds 3: one went to the first request above
+        self.assertEqual(self.send_otp('9000000002').status_code, 404)
+        self.assertEqual(self.send_otp('9000000003').status_code, 404)
+        self.assertEqual(self.send_otp('9000000004').status_code, 429)
+
+    def test_async_views_share_the_buckets_and_ordering(self):
+        for _ in range(5):
+            self.send_otp('9000000001')
+        url = reverse('async-send-otp')
+        self.assertEqual(self.client.post(url, {'phone_number': '9000000002'}).status_code, 404)
+        response = self.client.post(url, {'phone_number': '9000000002'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.client.post(url, {'phone_number': '9000000003'}).status_code, 404)
+
+
+class ImporterTests(TransactionTestCase):
+    """Each chunk commits or rolls back on its own."""
+
+    def setUp(self):
+        self.parent = CustomUser.objects.create_user('9876543210', is_student=True)
+        self.timing = CollegeTiming.objects.create(start_shift='08:00', end_shift='16:00')
+
+    def child(self, **fields):
+        return {
+            'parent': self.parent.id, 'college': 'Import College', 'collegetiming': self.timing.id,
+            'full_name': 'Child', 'dob': '2010-01-01', 'age': 14, 'contact_person_name': 'Parent',
+            'contact_person_number': '9876543210', **fields,
+        }
+
+    def ndjson(self, *lines):
+        return io.BytesIO('\n'.join(lines).encode())
+
+    def test_bad_lines_are_rejected_and_the_rest_imported(self):
+        stream = self.ndjson(
+            json.dumps(self.child()), '{not json', '[1, 2]', json.dumps(self.child(parent=0)), json.dumps(self.child()),
+        )
+        report = import_children(stream, 'ndjson').as_dict()
+        self.assertEqual((report['rows'], report['created'], report['rejected']), (5, 2, 3))
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3, 4])
+        self.assertTrue(report['errors'][0]['errors']['non_field_errors'][0].startswith('Invalid JSON'))
+        self.assertEqual(Children.objects.count(), 2)
+
+    def test_failed_chunk_is_rolled_back_and_later_chunks_saved(self):
+        stream = self.ndjson(json.dumps(self.child()), json.dumps(self.child(college='Second College')))
+        bulk_create = Children.objects.bulk_create
+        calls = []
+
+        def fail_first_chunk(objs, *args, **kwargs):
+            calls.append(objs)
+            if len(calls) == 1:
+                raise DatabaseError('disk I/O error')
+            return bulk_create(objs, *args, **kwargs)
+
+        with mock.patch.object(Children.objects, 'bulk_create', fail_first_chunk):
+            report = import_children(stream, 'ndjson', chunk_size=1).as_dict()
+        self.assertEqual((report['created'], report['rejected']), (1, 1))
+        self.assertEqual(report['errors'][0]['errors']['non_field_errors'], ["Chunk was not saved: disk I/O error"])
+        # The college created for the failed chunk went with it
+        self.assertEqual(list(College.objects.values_list('college_name', flat=True)), ['Second College'])
+        self.assertEqual(Children.objects.get().college.college_name, 'Second College')
+
+    def test_row_without_a_college_is_rejected(self):
+        stream = self.ndjson(json.dumps(self.child(college='')), json.dumps({
+            key: value for key, value in self.child().items() if key != 'college'
+        }))
+        report = import_children(stream, 'ndjson').as_dict()
+        self.assertEqual((report['created'], report['rejected']), (0, 2))
+        self.assertEqual(report['errors'][0]['errors'], {'college': "Provide college or college_name."})
+        self.assertFalse(College.objects.exists())
+
+    def test_chunk_size_is_validated_and_capped(self):
+        with self.assertRaises(ValueError):
+            list(chunked(range(3), 0))
+        self.assertEqual([len(chunk) for chunk in chunked(range(MAX_CHUNK_SIZE + 1), MAX_CHUNK_SIZE * 2)], [MAX_CHUNK_SIZE, 1])
+
+        token = RefreshToken.for_user(CustomUser.objects.create_superuser('9876543211')).access_token
+        url = reverse('bulk-import', args=['children'])
+        for chunk_size in ['0', '-5', 'many']:
+            with self.subTest(chunk_size=chunk_size):
+                upload = SimpleUploadedFile('children.ndjson', json.dumps(self.child()).encode())
+                response = self.client.post(
+                    url, {'file': upload, 'chunk_size': chunk_size}, HTTP_AUTHORIZATION=f'Bearer {token}',
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Children.objects.exists())
+
+
+class SignedChallengeTests(SimpleTestCase):
+
+    def setUp(self):
+        self.challenges = SignedChallenges('test-secret', max_attempts=MAX_ATTEMPTS)
+        self.token = self.challenges.issue('login', '+917100000001', '1234')
+
+    def test_code_verifies_once(self):
+        self.challenges.verify('login', '+917100000001', '1234', self.token)
+        with self.assertRaises(ChallengeRejected):
+            self.challenges.verify('login', '+917100000001', '1234', self.token)
+
+    def test_concurrent_verifies_have_one_winner(self):
+        def verify(number):
+            self.challenges.verify('login', '+917100000001', '1234', self.token)
+            return True
+        results = race(8, verify)
+        self.assertEqual(results.count(True), 1)
+        self.assertTrue(all(isinstance(result, ChallengeRejected) for result in results if result is not True))
+
+    def test_wrong_guesses_stop_at_max_attempts(self):
+        for number in range(MAX_ATTEMPTS):
+            with self.assertRaises(ChallengeRejected):
+                self.challenges.verify('login', '+917100000001', f'000{number}', self.token)
+        with self.assertRaises(ChallengeRejected) as raised:
+            self.challenges.verify('login', '+917100000001', '1234', self.token)
+        self.assertEqual(raised.exception.outcome, OTP_EXHAUSTED)
+
+    def test_concurrent_wrong_guesses_stop_at_max_attempts(self):
+        def guess(number):
+            try:
+                self.challenges.verify('login', '+917100000001', f'{number:04d}', self.token)
+            except ChallengeRejected as exc:
+                return exc.outcome
+        code_mac = SignedChallenges._code_mac
+
+        def slow_code_mac(*args):
+            # Widens the gap between counting a guess and comparing it
+            time.sleep(0.01)
+            return code_mac(*args)
+
+        with mock.patch.object(SignedChallenges, '_code_mac', slow_code_mac):
+            outcomes = race(64, guess)
+        # 1234 is not among the guesses' codes: every compared guess fails
+        self.assertEqual(outcomes.count(OTP_FAILED), MAX_ATTEMPTS)
+        self.assertEqual(outcomes.count(OTP_EXHAUSTED), 64 - MAX_ATTEMPTS)
+
+    def test_token_is_bound_to_purpose_phone_and_key(self):
+        for purpose, phone_number, secret in [
+            ('parent-login', '+917100000001', 'test-secret'),
+            ('login', '+917100000002', 'test-secret'),
+            ('login', '+917100000001', 'other-secret'),
+        ]:
+            with self.subTest(purpose=purpose, phone_number=phone_number, secret=secret):
+                with self.assertRaises(ChallengeRejected):
+                    SignedChallenges(secret).verify(purpose, phone_number, '1234', self.token)
+
+    def test_rotated_key_still_verifies(self):
+        SignedChallenges('new-secret', fallback_keys=['test-secret']).verify('login', '+917100000001', '1234', self.token)
+
+    def test_expired_token(self):
+        token = SignedChallenges('test-secret', ttl=-1).issue('login', '+917100000001', '1234')
+        with self.assertRaises(ChallengeRejected) as raised:
+            self.challenges.verify('login', '+917100000001', '1234', token)
+        self.assertEqual(raised.exception.outcome, OTP_EXPIRED)
+
+
+class DriverProfileConditionalGetTests(TransactionTestCase):
+    # GETs read from a replica when DATABASE_REPLICA_URLS is set
+    databases = '__all__'
+
+    def setUp(self):
+        vehicle_type = VehicleType.objects.create(vehicle_name='Van')
+        with transaction.atomic():
+            self.user, _ = create_driver_account({
+                'phone_number': '9876543210', 'full_name': 'Driver', 'dob': '1990-01-01',
+                'email': 'driver@example.com', 'licence_no': 'L1', 'licence_exp_date': '2030-01-01',
+                'vehicle_type': vehicle_type.id, 'vehicle_no': 'KA01', 'college_name': 'Test College',
+                'start_shift': '08:00', 'end_shift': '16:00', 'is_driver': True, 'is_student': False,
+            })
+        token = RefreshToken.for_user(self.user).access_token
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        self.url = reverse('driver-profile-detail', args=[self.user.id])
+
+    def test_unchanged_profile_gets_304(self):
+        response = self.client.get(self.url, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['full_name'], 'Driver')
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag, **self.headers).status_code, 304)
+        last_modified = response['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified, **self.headers).status_code, 304)
+
+    def test_change_gives_a_new_etag(self):
+        etag = self.client.get(self.url, **self.headers)['ETag']
+        profile = Profile.objects.get(user=self.user)
+        profile.full_name = 'Renamed Driver'
+        profile.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['full_name'], 'Renamed Driver')
+
+    def test_user_save_changes_the_etag_only_for_visible_fields(self):
+        etag = self.client.get(self.url, **self.headers)['ETag']
+        with self.assertNumQueries(1):
+            self.user.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag, **self.headers).status_code, 304)
+        self.user.is_student = True
+        self.user.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag, **self.headers).status_code, 200)
+
+    def test_unknown_driver(self):
+        url = reverse('driver-profile-detail', args=[self.user.id + 1])
+        self.assertEqual(self.client.get(url, **self.headers).status_code, 404)
+
+
+class ReferenceCacheTests(TransactionTestCase):
+    """Names resolve to active colleges, from the cache after the first lookup."""
+
+    def setUp(self):
+        self.references = ReferenceCache()
+
+    def test_hit_after_miss(self):
+        college_id = self.references.college_id('Test  College')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.references.college_id('test college'), college_id)
+        self.assertEqual((self.references.hits, self.references.misses), (1, 1))
+        self.assertEqual(College.objects.get(pk=college_id).college_name, 'Test College')
+
+    def test_inactive_college_is_not_reused(self):
+        retired = College.objects.create(college_name='Test College', is_active=False)
+        college_id = self.references.college_id('test college')
+        self.assertNotEqual(college_id, retired.id)
+        self.assertTrue(College.objects.get(pk=college_id).is_active)
+        self.assertEqual(self.references.college_id('Test College'), college_id)
+
+    def test_saving_a_college_forgets_only_its_names(self):
+        references = get_reference_cache()
+        references.forget_colleges()
+        first, second = references.college_id('First College'), references.college_id('Second College')
+        college = College.objects.get(pk=first)
+        college.college_name = 'Renamed College'
+        college.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(references.college_id('second college'), second)
+        # The old name is no longer cached, so it resolves to a new active college
+        self.assertNotEqual(references.college_id('first college'), first)
+
+    def test_saving_a_vehicle_type_refreshes_reference_data(self):
+        references = get_reference_cache()
+        vehicle_type = VehicleType.objects.create(vehicle_name='Van')
+        self.assertEqual(references.vehicle_type(vehicle_type.id).vehicle_name, 'Van')
+        vehicle_type.vehicle_name = 'Minibus'
+        vehicle_type.save()
+        self.assertEqual(references.vehicle_type(vehicle_type.id).vehicle_name, 'Minibus')
+
+
+class ThumbnailTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=media_root.name, PROFILE_THUMBNAIL_SIZES={'small': 32, 'large': 128})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        images._known_thumbnails.clear()
+        self.user = CustomUser.objects.create_user('9876543210', is_driver=True)
+
+    def picture(self, size=(400, 200)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'PNG')
+        return SimpleUploadedFile('pic.png', buffer.getvalue(), content_type='image/png')
+
+    def test_thumbnails_are_downscaled_copies(self):
+        profile = Profile.objects.create(user=self.user, full_name='Driver', dob='1990-01-01', profile_pic=self.picture())
+        self.assertEqual(images.thumbnail_urls(profile.profile_pic)['small'], profile.profile_pic.url)
+
+        names = images.generate_thumbnails(profile.profile_pic)
+        self.assertEqual(len(names), 2)
+        sizes = {}
+        for name in names:
+            with profile.profile_pic.storage.open(name) as thumbnail, Image.open(thumbnail) as image:
+                sizes[image.width] = image.size
+        self.assertEqual(sizes, {128: (128, 64), 32: (32, 16)})
+        urls = images.thumbnail_urls(profile.profile_pic)
+        self.assertTrue(urls['small'].endswith(images.thumbnail_name(profile.profile_pic.name, 'small')))
+        # Existing thumbnails are kept
+        self.assertEqual(images.generate_thumbnails(profile.profile_pic), [])
+
+    def test_generated_after_commit_for_profiles_only(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Profile.objects.create(user=self.user, full_name='Driver', dob='1990-01-01', profile_pic=self.picture())
+        self.assertEqual(len(callbacks), 1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            TempParent.objects.create(full_name='Parent', dob='1980-01-01', phone_number='9876543211', profile_pic=self.picture())
+        self.assertEqual(callbacks, [])
+
+
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('9876543210', is_driver=True)
+        self.token = RefreshToken.for_user(self.user).access_token
+        self.authentication = CachedJWTAuthentication()
+
+    def test_user_is_cached_until_saved(self):
+        self.authentication.get_user(self.token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authentication.get_user(self.token), self.user)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test_deleted_user_is_rejected(self):
+        self.authentication.get_user(self.token)
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test_evicted_version_is_a_miss(self):
+        cache.delete(user_version_key(self.user.id))
+        self.authentication.get_user(self.token)
+        self.user.is_student = True
+        self.user.save()
+        cache.delete(user_version_key(self.user.id))
+        with self.assertNumQueries(1):
+            self.assertTrue(self.authentication.get_user(self.token).is_student)
+
+
+class UploadTests(TestCase):
+    """Profile pictures, in one multipart request or a resumable session."""
+
+    PNG = b'\x89PNG\r\n\x1a\n' + bytes(56)
+
+    def setUp(self):
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        settings_override = self.settings(UPLOAD_SPOOL_DIR=spool.name, PROFILE_PIC_MAX_BYTES=len(self.PNG))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_bucket_backend('THROTTLE_BUCKET_BACKEND')
+        self.addCleanup(reset_bucket_backend, 'THROTTLE_BUCKET_BACKEND')
+
+    def register(self, content):
+        return self.client.post(reverse('parent-register'), {
+            'phone_number': '9876543210', 'full_name': 'Parent', 'profile_pic': SimpleUploadedFile('pic.png', content),
+        })
+
+    def test_multipart_upload_is_rejected_early(self):
+        response = self.register(b'GIF89a' + bytes(58))
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(self.register(self.PNG + b'!').status_code, 413)
+        self.assertEqual(os.listdir(settings.UPLOAD_SPOOL_DIR), [])
+
+    def session(self, size):
+        response = self.client.post(reverse('upload-create'), {'size': size})
+        self.assertEqual(response.status_code, 201)
+        return reverse('upload-session', args=[response.json()['upload_id']])
+
+    def put(self, url, offset, data):
+        return self.client.put(url, data, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_resumable_upload_in_small_chunks(self):
+        url = self.session(len(self.PNG))
+        for offset in range(0, len(self.PNG), 4):
+            response = self.put(url, offset, self.PNG[offset:offset + 4])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['offset'], offset + 4)
+        self.assertTrue(response.json()['complete'])
+        upload = open_completed_upload(url.rsplit('/', 1)[1])
+        self.addCleanup(upload.close)
+        self.assertEqual((upload.content_type, upload.read()), ('image/png', self.PNG))
+
+    def test_signature_is_checked_across_chunks(self):
+        riff = b'RIFF' + bytes(4) + b'AVI ' + bytes(52)
+        url = self.session(len(riff))
+        for offset in range(0, 12, 4):
+            self.assertEqual(self.put(url, offset, riff[offset:offset + 4]).status_code, 200)
+        self.assertEqual(self.put(url, 12, riff[12:16]).status_code, 415)
+        self.assertEqual(self.client.get(url).json()['offset'], 12)
+
+    def test_offsets_and_sizes_are_enforced(self):
+        self.assertEqual(self.client.post(reverse('upload-create'), {'size': len(self.PNG) + 1}).status_code, 413)
+        url = self.session(len(self.PNG))
+        self.assertEqual(self.put(url, 4, self.PNG[:4]).status_code, 409)
+        self.assertEqual(self.put(url, 0, self.PNG + b'!').status_code, 413)
+        self.assertEqual(self.client.get(url).json()['offset'], 0)
+
+
+class ChildrenListPaginationTests(TransactionTestCase):
+    # GETs read from a replica when DATABASE_REPLICA_URLS is set
+    databases = '__all__'
+
+    def setUp(self):
+        self.parent = CustomUser.objects.create_user('9876543210', is_student=True)
+        self.college = College.objects.create(college_name='Test College')
+        self.timing = CollegeTiming.objects.create(start_shift='08:00', end_shift='16:00')
+        self.url = reverse('list-children-by-parent', args=[self.parent.id])
+
+    def add_children(self, count):
+        return [
+            Children.objects.create(
+                parent=self.parent, college=self.college, collegetiming=self.timing, full_name=f'Child {number}',
+                dob='2010-01-01', age=14, contact_person_name='Parent', contact_person_number='9876543210',
+            ).id
+            for number in range(count)
+        ]
+
+    def pages(self, page_size, before_next=None):
+        ids, url = [], f'{self.url}?page_size={page_size}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.append([child['id'] for child in response.json()['results']])
+            url = response.json()['next']
+            if url and before_next:
+                before_next()
+        return ids
+
+    def test_pages_are_in_id_order(self):
+        ids = self.add_children(5)
+        self.assertEqual(self.pages(2), [ids[:2], ids[2:4], ids[4:]])
+        self.assertEqual([child['id'] for child in self.client.get(self.url).json()], ids)
+
+    def test_rows_added_while_paging_are_neither_skipped_nor_repeated(self):
+        ids = self.add_children(4)
+        pages = self.pages(3, before_next=lambda: ids.extend(self.add_children(1)))
+        self.assertEqual(sum(pages, []), ids)
+
+    def queries(self, url):
+        # Reads may go to a replica or, pinned after a write, to the primary
+        contexts = [CaptureQueriesContext(connections[alias]) for alias in connections]
+        with contextlib.ExitStack() as stack:
+            for context in contexts:
+                stack.enter_context(context)
+            self.client.get(url)
+        return sum(len(context) for context in contexts)
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        self.add_children(1)
+        one = self.queries(f'{self.url}?page_size=50')
+        self.add_children(20)
+        self.assertGreater(one, 0)
+        self.assertEqual(self.queries(f'{self.url}?page_size=50'), one)
+
+    def test_parent_without_children(self):
+        self.assertEqual(self.client.get(f'{self.url}?page_size=2').status_code, 404)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class LoginTests(TestCase):
+    """One query per login, whichever user type."""
+
+    def setUp(self):
+        vehicle_type = VehicleType.objects.create(vehicle_name='Van')
+        self.driver, _ = create_driver_account({
+            'phone_number': '9876543210', 'full_name': 'Driver', 'dob': '1990-01-01',
+            'email': 'driver@example.com', 'licence_no': 'L1', 'licence_exp_date': '2030-01-01',
+            'vehicle_type': vehicle_type.id, 'vehicle_no': 'KA01', 'college_name': 'Test College',
+            'start_shift': '08:00', 'end_shift': '16:00', 'is_driver': True, 'is_student': False,
+        })
+        self.parent = CustomUser.objects.create_user('9876543211', is_student=True)
+        Parent_Profile.objects.create(user=self.parent, full_name='Parent')
+
+    def login(self, url_name, user):
+        otp_code = issue_login_otp(user.phone_number)['otp_code']
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse(url_name), {'phone_number': user.phone_number, 'otp_code': otp_code})
+        self.assertEqual(response.status_code, 200)
+        # The code is used up
+        retry = self.client.post(reverse(url_name), {'phone_number': user.phone_number, 'otp_code': otp_code})
+        self.assertEqual(retry.status_code, 400)
+        return response.json()
+
+    def test_driver_login(self):
+        body = self.login('login', self.driver)
+        self.assertEqual(body['driver_info']['college'], 'Test College')
+        self.assertEqual(body['driver_info']['vehicle_type'], 'Van')
+
+    def test_parent_login(self):
+        body = self.login('parent-login', self.parent)
+        self.assertIn('access', body)
+
+
+class RecordingSMSProvider(BaseSMSProvider):
+    """Keeps each batch; the first `failures` calls raise."""
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+
+    def send_batch(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('gateway unavailable')
+        self.batches.append([message.phone_number for message in messages])
+
+
+class OTPDispatcherTests(SimpleTestCase):
+
+    def dispatcher(self, provider, **options):
+        dispatcher = OTPDispatcher(provider, **{'workers': 1, 'batch_wait': 0.2, 'retry_backoff': 0, **options})
+        self.addCleanup(dispatcher.shutdown)
+        return dispatcher
+
+    def test_messages_are_sent_in_batches(self):
+        provider = RecordingSMSProvider()
+        dispatcher = self.dispatcher(provider, batch_size=3)
+        for number in range(5):
+            self.assertTrue(dispatcher.enqueue(f'+9198765432{number:02}', 'code'))
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual([len(batch) for batch in provider.batches], [3, 2])
+        stats = dispatcher.snapshot()
+        self.assertEqual((stats['enqueued'], stats['sent'], stats['batches']), (5, 5, 2))
+        self.assertIsNotNone(stats['latency_p99_ms'])
+
+    def test_failed_batches_are_retried_then_given_up(self):
+        provider = RecordingSMSProvider(failures=2)
+        dispatcher = self.dispatcher(provider, max_retries=2)
+        dispatcher.enqueue('+919876543210', 'code')
+        dispatcher.flush(timeout=5)
+        self.assertEqual(provider.batches, [['+919876543210']])
+        self.assertEqual((dispatcher.stats['retries'], dispatcher.stats['sent']), (2, 1))
+
+        provider.failures = 3
+        with self.assertLogs('core.sms', 'ERROR'):
+            dispatcher.enqueue('+919876543211', 'code')
+            dispatcher.flush(timeout=5)
+        self.assertEqual(dispatcher.stats['failed'], 1)
+
+    def test_full_queue_drops_without_blocking(self):
+        dispatcher = self.dispatcher(RecordingSMSProvider(), workers=0, queue_size=1)
+        self.assertTrue(dispatcher.enqueue('+919876543210', 'code'))
+        with self.assertLogs('core.sms', 'WARNING'):
+            self.assertFalse(dispatcher.enqueue('+919876543211', 'code'))
+        self.assertEqual(dispatcher.stats['dropped'], 1)
+        dispatcher.queue.get_nowait()
+        dispatcher.queue.task_done()
+
+    def test_http_provider_against_the_standin(self):
+        received = []
+        server = standin_server(port=0, on_batch=received.append)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        provider = HTTPSMSProvider(f'http://127.0.0.1:{server.server_address[1]}/')
+        provider.send_batch([SMSMessage('+919876543210', 'code 1234')])
+        self.assertEqual(received, [[{'phone_number': '+919876543210', 'text': 'code 1234'}]])
+
+
+class SweepTempRegistrationsTests(TransactionTestCase):
+    # The sweeper commits each batch itself
+
+    def setUp(self):
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        settings_override = self.settings(UPLOAD_SPOOL_DIR=spool.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def sweep(self, **options):
+        out = io.StringIO()
+        call_command('sweep_temp_registrations', pause=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_expired_rows_are_deleted_in_batches(self):
+        for number in range(7):
+            TempParent.objects.create(full_name='Parent', dob='1980-01-01', phone_number=f'98765432{number:02}')
+        stale = list(TempParent.objects.order_by('id').values_list('id', flat=True)[:5])
+        TempParent.objects.filter(id__in=stale).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        now = time.time()
+        OTPChallenge.objects.create(key='expired', otp_hash='x', max_attempts=5, expires_at=now - 20, retain_until=now - 10)
+        OTPChallenge.objects.create(key='pending', otp_hash='x', max_attempts=5, expires_at=now + 300, retain_until=now + 310)
+
+        output = self.sweep(batch_size=2)
+        self.assertIn("TempParent: deleted 5 rows in 3 batches", output)
+        self.assertIn("OTPChallenge: deleted 1 rows in 1 batches", output)
+        self.assertFalse(TempParent.objects.filter(id__in=stale).exists())
+        self.assertEqual(TempParent.objects.count(), 2)
+        self.assertEqual(list(OTPChallenge.objects.values_list('key', flat=True)), ['pending'])
+
+    def test_older_than(self):
+        TempParent.objects.create(full_name='Parent', dob='1980-01-01', phone_number='9876543200')
+        TempParent.objects.update(created_at=timezone.now() - datetime.timedelta(minutes=5))
+        self.sweep()
+        self.assertEqual(TempParent.objects.count(), 1)
+        self.sweep(older_than=60)
+        self.assertFalse(TempParent.objects.exists())
+
+
+class CollegeExportTests(TransactionTestCase):
+    # GETs read from a replica when DATABASE_REPLICA_URLS is set
+    databases = '__all__'
+
+    def setUp(self):
+        self.parent = CustomUser.objects.create_user('9876543210', is_student=True)
+        self.timing = CollegeTiming.objects.create(start_shift='08:00', end_shift='16:00')
+        self.college = College.objects.create(college_name='Test College')
+        other = College.objects.create(college_name='Other College')
+        for number, college in enumerate([self.college, other, self.college]):
+            Children.objects.create(
+                parent=self.parent, college=college, collegetiming=self.timing, full_name=f'Child {number}',
+                dob='2010-01-01', age=14, contact_person_name='Parent', contact_person_number='9876543210',
+            )
+        token = RefreshToken.for_user(CustomUser.objects.create_superuser('9876543211')).access_token
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def export(self, kind='children', **params):
+        return self.client.get(reverse('college-export', args=[kind, self.college.id]), params, **self.headers)
+
+    def test_csv_streams_the_college_rows(self):
+        with mock.patch('core.exporters.FLUSH_BYTES', 1):
+            response = self.export()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/csv')
+            pieces = list(response.streaming_content)
+        # Header, then one piece per row
+        self.assertEqual(len(pieces), 3)
+        rows = list(csv.DictReader(io.StringIO(b''.join(pieces).decode())))
+        self.assertEqual([row['full_name'] for row in rows], ['Child 0', 'Child 2'])
+        self.assertEqual({row['college_name'] for row in rows}, {'Test College'})
+
+    def test_ndjson(self):
+        response = self.export(file_format='ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['full_name'] for line in lines], ['Child 0', 'Child 2'])
+        self.assertEqual(json.loads(lines[0])['start_shift'], '08:00:00')
+
+    def test_rejected_requests(self):
+        self.assertEqual(self.export(kind='teachers').status_code, 404)
+        self.assertEqual(self.export(file_format='xml').status_code, 400)
+        token = RefreshToken.for_user(self.parent).access_token
+        url = reverse('college-export', args=['children', self.college.id])
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 403)
+
+
+class RegisteredPhonesTests(TestCase):
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = range(919000000000, 919000001000)
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(key in bloom for key in range(918000000000, 918000010000))
+        self.assertLess(false_positives, 300)
+
+    def test_unseen_numbers_skip_the_database(self):
+        user = CustomUser.objects.create_user('9876543210')
+        phones = RegisteredPhones(1000, 0.01, refresh_seconds=3600)
+        phones.load()
+        with self.assertNumQueries(0):
+            self.assertFalse(phones.is_registered(919876543211))
+        with self.assertNumQueries(1):
+            self.assertTrue(phones.is_registered(user.phone_key))
+        # A false positive is settled by the query
+        phones.add(919876543212)
+        with self.assertNumQueries(1):
+            self.assertFalse(phones.is_registered(919876543212))
+        self.assertEqual(phones.snapshot(), {'skipped': 1, 'checked': 2})
+
+    def test_users_saved_here_are_added(self):
+        # A filter of its own, loaded from this test's rows
+        with self.settings(PHONE_NUMBERS={**settings.PHONE_NUMBERS, 'BLOOM_CAPACITY': 1000}):
+            phones = get_registered_phones()
+            phones.load()
+            user = CustomUser.objects.create_user('9876543213')
+            self.assertTrue(phones.might_exist(user.phone_key))
+
+
+class WriteQueueTests(TransactionTestCase):
+    """Jobs run on the writer thread, committed together in batches."""
+
+    def setUp(self):
+        self.write_queue = WriteQueue(batch_wait=0.05, timeout=5)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def hold_writer(self):
+        started = threading.Event()
+
+        def wait():
+            started.set()
+            self.release.wait(5)
+        self.write_queue.submit(wait)
+        started.wait(5)
+
+    def test_queued_jobs_share_a_batch(self):
+        self.hold_writer()
+        futures = [self.write_queue.submit(VehicleType.objects.create, vehicle_name=f'Van {number}') for number in range(4)]
+        self.release.set()
+        names = [future.result(5).vehicle_name for future in futures]
+        self.assertEqual(names, ['Van 0', 'Van 1', 'Van 2', 'Van 3'])
+        self.assertEqual(VehicleType.objects.count(), 4)
+        stats = self.write_queue.snapshot()
+        self.assertEqual((stats['jobs'], stats['batches'], stats['max_batch']), (5, 2, 4))
+
+    def test_failing_job_is_rolled_back_alone(self):
+        def fail():
+            VehicleType.objects.create(vehicle_name='Bus')
+            raise ValueError('bad row')
+
+        self.hold_writer()
+        failing = self.write_queue.submit(fail)
+        saved = self.write_queue.submit(VehicleType.objects.create, vehicle_name='Van')
+        self.release.set()
+        with self.assertRaisesMessage(ValueError, 'bad row'):
+            failing.result(5)
+        self.assertEqual(saved.result(5).vehicle_name, 'Van')
+        self.assertEqual(list(VehicleType.objects.values_list('vehicle_name', flat=True)), ['Van'])
+        self.assertEqual(self.write_queue.stats['failed'], 1)
+
+    def test_job_not_started_in_time_is_withdrawn(self):
+        self.write_queue.timeout = 0.05
+        self.hold_writer()
+        with self.assertRaises(WriteQueueBusy):
+            self.write_queue.run(VehicleType.objects.create, vehicle_name='Van')
+        self.release.set()
+        # Once the writer has moved past it, the withdrawn job is gone
+        self.write_queue.timeout = 5
+        self.write_queue.run(lambda: None)
+        self.assertFalse(VehicleType.objects.exists())
+        self.assertEqual(self.write_queue.stats['cancelled'], 1)
+
+    def test_runs_inline_inside_a_transaction(self):
+        with transaction.atomic():
+            self.assertIs(self.write_queue.run(threading.current_thread), threading.current_thread())
+        self.assertIsNone(self.write_queue._thread)
+
+
+class LoadTestReportTests(SimpleTestCase):
+
+    def test_mix_and_login_body(self):
+        self.assertEqual(parse_mix('driver=1, parent=3,admin'), {'driver': 1.0, 'parent': 3.0, 'admin': 1.0})
+        sent = {'otp_code': '1234', 'challenge': 'signed'}
+        self.assertEqual(login_body('+919876543210', sent), {'phone_number': '+919876543210', 'otp_code': '1234', 'challenge': 'signed'})
+        self.assertNotIn('challenge', login_body('+919876543210', {'otp_code': '1234'}))
+
+    def test_jwt_user_id(self):
+        token = str(RefreshToken.for_user(CustomUser(id=42)).access_token)
+        self.assertEqual(str(jwt_user_id(token)), '42')
+
+    def test_summary_and_comparison(self):
+        recorder = Recorder()
+        for milliseconds in range(1, 101):
+            recorder.record('login', milliseconds / 1000, 200 if milliseconds <= 90 else 500, 2)
+        recorder.journey('driver', True)
+        recorder.finished = recorder.started + 10
+        summary = recorder.summary()
+        login = summary['endpoints']['login']
+        self.assertEqual((login['requests'], login['rps'], login['error_rate']), (100, 10.0, 0.1))
+        self.assertEqual((login['p50_ms'], login['p95_ms'], login['queries_per_request']), (51.0, 96.0, 2.0))
+        self.assertEqual(summary['journeys'], {'driver': {'completed': 1, 'failed': 0}})
+
+        baseline = {'endpoints': {'login': {**login, 'p95_ms': 48.0}}}
+        rows = {metric: change for _, metric, _, _, change in compare(summary, baseline)}
+        self.assertEqual(rows['p95_ms'], 1.0)
+        self.assertEqual(rows['rps'], 0.0)
+
+
+class MicrobenchTests(TestCase):
+    # Row benchmarks read from a replica when DATABASE_REPLICA_URLS is set
+    databases = '__all__'
+
+    def test_every_benchmark_runs(self):
+        results = run_benchmarks(Fixtures(children=3), min_time=0.001, rounds=1)
+        self.assertEqual(set(results), set(BENCHMARKS))
+        for name, result in results.items():
+            with self.subTest(name):
+                self.assertGreater(result['ops_per_second'], 0)
+                self.assertGreaterEqual(result['peak_bytes'], 0)
+        self.assertEqual(results['hash_otp']['queries'], 0)
+
+    def test_regressions(self):
+        results = {'fast': {'ops_per_second': 90.0}, 'slow': {'ops_per_second': 80.0}, 'new': {'ops_per_second': 1.0}}
+        baseline = {'fast': {'ops_per_second': 100.0}, 'slow': {'ops_per_second': 100.0}}
+        self.assertEqual(regressions(results, baseline, 0.15), [('slow', 100.0, 80.0, 80.0 / 100.0 - 1)])
+
+
+class CollegeSearchTests(TransactionTestCase):
+    # GETs read from a replica when DATABASE_REPLICA_URLS is set
+    databases = '__all__'
+
+    NAMES = ['St Xavier College', 'Xavier Institute', 'College of Engineering', 'City College of Arts']
+
+    def index(self):
+        return CollegeIndex.from_rows(enumerate(self.NAMES, 1))
+
+    def test_prefixes_rank_before_word_prefixes(self):
+        results = self.index().search('xav')
+        self.assertEqual([name for _, name, _ in results], ['Xavier Institute', 'St Xavier College'])
+        self.assertGreater(results[0][2], results[1][2])
+
+    def test_typos_match_by_trigram(self):
+        results = self.index().search('colege of enginering')
+        self.assertEqual(results[0][1], 'College of Engineering')
+        self.assertEqual(self.index().search('  '), [])
+        self.assertEqual(len(self.index().search('college', limit=2)), 2)
+
+    def test_updates_touch_only_that_college(self):
+        index = self.index()
+        index.add(2, 'Loyola Institute')
+        index.remove(3)
+        self.assertEqual([name for _, name, _ in index.search('xav')], ['St Xavier College'])
+        self.assertEqual(index.search('loy')[0][:2], (2, 'Loyola Institute'))
+        self.assertNotIn('College of Engineering', [name for _, name, _ in index.search('engineering')])
+
+    def test_endpoint_follows_saved_colleges(self):
+        reset_college_index()
+        self.addCleanup(reset_college_index)
+        college = College.objects.create(college_name='St Xavier College')
+        url = reverse('college-search')
+        response = self.client.get(url, {'q': 'xavier'})
+        self.assertEqual(response.json()['results'][0]['id'], college.id)
+        college.is_active = False
+        college.save()
+        self.assertEqual(self.client.get(url, {'q': 'xavier'}).json()['results'], [])
+        self.assertEqual(self.client.get(url, {'q': 'xavier', 'limit': 'ten'}).status_code, 400)
+
+
+class RowSerializerParityTests(TransactionTestCase):
+    """The values() renderers give exactly the serializers' JSON."""
+    # Reads go to a replica when DATABASE_REPLICA_URLS is set
+    databases = '__all__'
+
+    def setUp(self):
+        self.context = {'request': RequestFactory().get('/')}
+        college = College.objects.create(college_name='Test College')
+        timing = CollegeTiming.objects.create(start_shift='08:00', end_shift='16:00')
+        group = Group.objects.create(name='parents')
+        self.parents = [
+            CustomUser.objects.create_user('9876543210', is_student=True),
+            CustomUser.objects.create_user('9876543211', is_student=True),
+        ]
+        self.parents[0].groups.add(group)
+        self.parents[0].user_permissions.add(Permission.objects.get(codename='view_children'))
+        Parent_Profile.objects.create(user=self.parents[0], full_name='Parent')
+        # Picture names without the post_save thumbnail job (core.signals)
+        Parent_Profile.objects.update(profile_pic='parent_profiles/pic.jpg')
+        for number, parent in enumerate(self.parents * 2):
+            Children.objects.create(
+                parent=parent, college=college, collegetiming=timing, full_name=f'Child {number}', dob='2010-01-01',
+                age=14, children_class='5A' if number else None, contact_person_name='Parent',
+                contact_person_number='9876543210',
+            )
+
+        vehicle_type = VehicleType.objects.create(vehicle_name='Van')
+        with transaction.atomic():
+            create_driver_account({
+                'phone_number': '9876543212', 'full_name': 'Driver', 'dob': '1990-01-01',
+                'email': 'driver@example.com', 'licence_no': 'L1', 'licence_exp_date': '2030-01-01',
+                'vehicle_type': vehicle_type.id, 'vehicle_no': 'KA01', 'college_name': 'Test College',
+                'start_shift': '08:00', 'end_shift': '16:00', 'is_driver': True, 'is_student': False,
+            })
+        # Without a vehicle type, college mapping or picture
+        Profile.objects.create(user=CustomUser.objects.create_user('9876543213', is_driver=True), full_name='New', dob='1991-01-01')
+        Profile.objects.filter(full_name='Driver').update(profile_pic='driver.jpg')
+
+    def as_json(self, data):
+        return json.loads(JSONRenderer().render(data))
+
+    def assert_parity(self, rows, serializer_class, queryset):
+        expected = self.as_json(serializer_class(queryset, many=True, context=self.context).data)
+        self.assertEqual(self.as_json(rows.render(rows.values(queryset), self.context)), expected)
+        return expected
+
+    def test_children_list(self):
+        expected = self.assert_parity(CHILDREN_LIST_ROWS, ChildrenListSerializer, Children.objects.order_by('id'))
+        self.assertEqual(len(expected), 4)
+        self.assertIsNone(expected[1]['parent_profile'])
+
+    def test_profile_list(self):
+        expected = self.assert_parity(PROFILE_LIST_ROWS, ProfileListSerializer, Profile.objects.order_by('id'))
+        self.assertEqual(expected[0]['college']['college_name'], 'Test College')
+        self.assertIsNone(expected[1]['college'])
@@ -0,0 +1,280 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .phones import InvalidPhoneNumber, normalize_phone
+
+
+class MemoryBucketBackend:
+    """
+    Token buckets kept in this process. The least recently used buckets are
+    dropped once `max_entries` is reached; a dropped bucket simply starts
+    full again.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now):
+        """
+        Take one token from the bucket at `key`.
+        Returns 0 if allowed, otherwise the seconds until a token is available.
+        """
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / refill_rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+            return wait
+
+    async def aconsume(self, key, capacity, refill_rate, now):
+        return self.consume(key, capacity, refill_rate, now)
+
+
+class CacheBucketBackend:
+    """
+    Token buckets kept in a Django cache alias, shared by every worker that
+    uses the same cache. The read-modify-write is not atomic, so a burst of
+    simultaneous requests on one key may let a few extra through.
+    """
+
+    def __init__(self, cache_alias='default'):
+        self.cache_alias = cache_alias
+
+    def consume(self, key, capacity, refill_rate, now):
+        cache = caches[self.cache_alias]
+        tokens, updated_at = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0
+        else:
+            wait = (1 - tokens) / refill_rate
+        # Keep the bucket only as long as it takes to refill completely
+        cache.set(key, (tokens, now), int(capacity / refill_rate) + 1)
+        return wait
+
+    async def aconsume(self, key, capacity, refill_rate, now):
+        return await sync_to_async(self.consume)(key, capacity, refill_rate, now)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# Per-scope allowed/rejected counts for this process
+_counters = defaultdict(lambda: {'allowed': 0, 'rejected': 0})
+_counters_lock = threading.Lock()
+
+
+def get_bucket_backend():
+    """Return the backend configured by settings.THROTTLE_BUCKET_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = getattr(settings, 'THROTTLE_BUCKET_BACKEND', {})
+                backend = import_string(config.get('BACKEND', 'core.throttling.MemoryBucketBackend'))
+                _backend = backend(**config.get('OPTIONS', {}))
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_bucket_backend(setting, **kwargs):
+    global _backend
+    if setting == 'THROTTLE_BUCKET_BACKEND':
+        _backend = None
+
+
+def get_throttle_counters():
+    """Snapshot of allowed/rejected counts per throttle scope."""
+    with _counters_lock:
+        return {scope: dict(counts) for scope, counts in _counters.items()}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket throttle. The rate for `scope` comes from
+    REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] in DRF's "<n>/<period>" form:
+    the bucket holds n tokens and refills at n per period.
+
+    DRF runs throttles before the handler, so rejected requests never reach
+    the database and get a 429 with Retry-After.
+    """
+    scope = None
+
+    def __init__(self):
+        num, period = self.parse_rate(api_settings.DEFAULT_THROTTLE_RATES[self.scope])
+        self.capacity = num
+        self.refill_rate = num / period
+        self.wait_seconds = 0
+
+    def parse_rate(self, rate):
+        num, period = rate.split('/')
+        duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+        return int(num), duration
+
+    def get_ident_key(self, request, view):
+        """Return the bucket identity for this request, or None to skip throttling."""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+
+        key = f"throttle:{self.scope}:{ident}"
+        self.wait_seconds = get_bucket_backend().consume(
+            key, self.capacity, self.refill_rate, time.time()
+        )
+        return self._count()
+
+    async def aallow_request(self, request, view):
+        """allow_request() for the async views; `request` needs .data, .headers and .META."""
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+
+        key = f"throttle:{self.scope}:{ident}"
+        self.wait_seconds = await get_bucket_backend().aconsume(
+            key, self.capacity, self.refill_rate, time.time()
+        )
+        return self._count()
+
+    def _count(self):
+        allowed = self.wait_seconds == 0
+        with _counters_lock:
+            _counters[self.scope]['allowed' if allowed else 'rejected'] += 1
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def rejecting_throttle(throttles, request, view):
+    """
+    The first of `throttles` that turns the request away, or None. Unlike
+    DRF's APIView.check_throttles the rest are not consulted, so a request
+    rejected per phone number or per address takes no token from a shared
+    bucket listed after them.
+    """
+    for throttle in throttles:
+        if not throttle.allow_request(request, view):
+            return throttle
+    return None
+
+
+async def arejecting_throttle(throttles, request, view):
+    """rejecting_throttle() for the async views (core.views.auth_async)."""
+    for throttle in throttles:
+        if not await throttle.aallow_request(request, view):
+            return throttle
+    return None
+
+
+class OrderedThrottlesMixin:
+    """
+    For views whose throttle_classes run from the narrowest bucket to the
+    shared ones (OTP_THROTTLE_CLASSES, REGISTRATION_THROTTLE_CLASSES): stop
+    at the first rejection, so one client cannot drain a global bucket
+    with requests that are refused anyway.
+    """
+
+    def check_throttles(self, request):
+        throttle = rejecting_throttle(self.get_throttles(), request, self)
+        if throttle is not None:
+            self.throttled(request, throttle.wait())
+
+
+class PhoneNumberThrottle(TokenBucketThrottle):
+    """One bucket per phone number in the request body."""
+    scope = 'otp_phone'
+
+    def get_ident_key(self, request, view):
+        phone_number = request.data.get('phone_number')
+        if not phone_number:
+            return None
+        try:
+            # Formatting variants of one number share a bucket
+            return normalize_phone(phone_number)
+        except InvalidPhoneNumber:
+            return str(phone_number)
+
+
+class ClientIPThrottle(TokenBucketThrottle):
+    """One bucket per client address (honours NUM_PROXIES like DRF's own throttles)."""
+    scope = 'otp_ip'
+
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+class GlobalOTPThrottle(TokenBucketThrottle):
+    """
+    A single bucket shared by every caller. Caps the total OTP rate so a
+    storm spread over many phones and addresses still cannot saturate the
+    database writer.
+    """
+    scope = 'otp_global'
+
+    def get_ident_key(self, request, view):
+        return 'all'
+
+
+# Narrowest first; checked in order by OrderedThrottlesMixin
+OTP_THROTTLE_CLASSES = [PhoneNumberThrottle, ClientIPThrottle, GlobalOTPThrottle]
+
+
+class RegistrationIPThrottle(ClientIPThrottle):
+    """
+    Per-address bucket for register and parent-register. Not per phone
+    number: that would parse the (possibly multipart) body before the
+    view's size checks.
+    """
+    scope = 'register_ip'
+
+
+class GlobalRegistrationThrottle(GlobalOTPThrottle):
+    """
+    Caps pending registrations across all callers, so a flood cannot push
+    real users' challenges out of a bounded store (MemoryChallengeStore's
+    max_entries, a cache's MAX_ENTRIES).
+    """
+    scope = 'register_global'
+
+
+REGISTRATION_THROTTLE_CLASSES = [RegistrationIPThrottle, GlobalRegistrationThrottle]
+
+
+class UploadSessionIPThrottle(ClientIPThrottle):
+    """Per-address bucket for opening resumable upload sessions."""
+    scope = 'upload_ip'
+
+
+class GlobalUploadSessionThrottle(GlobalOTPThrottle):
+    """Caps how fast upload sessions are opened across all callers."""
+    scope = 'upload_global'
+
+
+class UploadChunkIPThrottle(ClientIPThrottle):
+    """Per-address bucket for the chunk PUTs and status GETs of upload sessions."""
+    scope = 'upload_chunk_ip'
+
+
+UPLOAD_SESSION_THROTTLE_CLASSES = [UploadSessionIPThrottle, GlobalUploadSessionThrottle]
@@ -0,0 +1,307 @@
+import fcntl
+import json
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from rest_framework import status
+
+# Leading bytes of the image formats accepted for profile pictures
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'RIFF', 'image/webp'),  # followed by a size and b'WEBP', checked in sniff_image_type
+)
+# How many leading bytes sniff_image_type needs
+SIGNATURE_BYTES = 16
+
+
+def spool_dir():
+    path = str(getattr(settings, 'UPLOAD_SPOOL_DIR', os.path.join(settings.BASE_DIR, 'spool')))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def upload_chunk_size():
+    return getattr(settings, 'UPLOAD_CHUNK_SIZE', 64 * 1024)
+
+
+def max_upload_bytes():
+    return getattr(settings, 'PROFILE_PIC_MAX_BYTES', 10 * 1024 * 1024)
+
+
+def sniff_image_type(head):
+    """Content type from the first bytes of a file, or None if it is not an accepted image."""
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            if content_type == 'image/webp' and head[8:12] != b'WEBP':
+                return None
+            return content_type
+    return None
+
+
+class UploadRejected(Exception):
+    def __init__(self, detail, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def request_content_length(request):
+    """The request's Content-Length as an int (0 when absent); UploadRejected if it is malformed."""
+    value = request.META.get('CONTENT_LENGTH') or '0'
+    if not str(value).isdigit():
+        raise UploadRejected("Invalid Content-Length header.")
+    return int(value)
+
+
+class SpooledUploadedFile(UploadedFile):
+    """
+    An upload written to the spool directory. Unlike Django's
+    TemporaryUploadedFile it is not deleted on close, so a pending
+    registration can keep it until the OTP is verified.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class SpooledImageUploadHandler(FileUploadHandler):
+    """
+    Writes every file part straight to the spool directory in fixed-size
+    chunks, checking the image signature on the first chunk and the size on
+    every chunk. A violation stops the upload immediately
+    (connection_reset=True), so the rest of the body is never read, and is
+    kept in `rejection` for the view to report.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.chunk_size = upload_chunk_size()
+        self.max_bytes = max_upload_bytes()
+        self.rejection = None
+        self.spool_file = None
+        self.path = None
+        self.size = 0
+
+    def reject(self, detail, status_code):
+        self.rejection = UploadRejected(detail, status_code)
+        if self.spool_file is not None:
+            self.spool_file.close()
+            os.remove(self.path)
+            self.spool_file = None
+        raise StopUpload(connection_reset=True)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        if self.content_length and self.content_length > self.max_bytes:
+            self.reject("Uploaded file is too large.", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.path = os.path.join(spool_dir(), f"{uuid.uuid4().hex}.upload")
+        self.spool_file = open(self.path, 'w+b')
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0:
+            content_type = sniff_image_type(raw_data[:SIGNATURE_BYTES])
+            if content_type is None:
+                self.reject("Only JPEG, PNG and WebP images are accepted.", status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+            self.content_type = content_type
+        self.size += len(raw_data)
+        if self.size > self.max_bytes:
+            self.reject("Uploaded file is too large.", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.spool_file.write(raw_data)
+        return None
+
+    def upload_interrupted(self):
+        if self.spool_file is not None:
+            self.spool_file.close()
+            os.remove(self.path)
+            self.spool_file = None
+
+    def file_complete(self, file_size):
+        self.spool_file.seek(0)
+        uploaded = SpooledUploadedFile(
+            file=self.spool_file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
+        self.spool_file = None
+        return uploaded
+
+
+# ============================ Resumable uploads ============================
+#
+# A session is two files in the spool directory: <id>.part with the bytes
+# received so far, and <id>.json with the declared size. The offset to resume
+# from is simply the size of the .part file, so any worker sharing the spool
+# directory can continue an upload. Writers hold an flock on the .part file,
+# so two PUTs for one session cannot both append at the same offset.
+
+def _session_paths(upload_id):
+    if not (len(upload_id) == 32 and all(char in '0123456789abcdef' for char in upload_id)):
+        raise UploadRejected("Unknown upload.", status.HTTP_404_NOT_FOUND)
+    base = os.path.join(spool_dir(), upload_id)
+    return f"{base}.part", f"{base}.json"
+
+
+def upload_quotas():
+    """(sessions per client, open sessions, declared bytes of open sessions) allowed at once."""
+    return (
+        getattr(settings, 'UPLOAD_MAX_SESSIONS_PER_CLIENT', 5),
+        getattr(settings, 'UPLOAD_MAX_OPEN_SESSIONS', 1000),
+        getattr(settings, 'UPLOAD_MAX_OPEN_BYTES', 1024 * 1024 * 1024),
+    )
+
+
+def open_upload_sessions():
+    """Metadata of every session still in the spool directory."""
+    sessions = []
+    with os.scandir(spool_dir()) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path) as handle:
+                    sessions.append(json.load(handle))
+            except (FileNotFoundError, ValueError):
+                pass
+    return sessions
+
+
+def create_upload_session(size, client=None):
+    """
+    Open a session for `size` bytes on behalf of `client` (an address).
+    Sessions are refused with 429 once the client has too many open, and
+    with 503 once all open sessions together reach the global caps; the
+    counts are read from the spool directory, so they hold across workers
+    up to a few racing requests.
+    """
+    if size <= 0 or size > max_upload_bytes():
+        raise UploadRejected("Uploaded file is too large.", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    purge_stale_uploads()
+    per_client, max_sessions, max_bytes = upload_quotas()
+    sessions = open_upload_sessions()
+    if client is not None and sum(session.get('client') == client for session in sessions) >= per_client:
+        raise UploadRejected("Too many uploads in progress.", status.HTTP_429_TOO_MANY_REQUESTS)
+    if len(sessions) >= max_sessions or sum(session['size'] for session in sessions) + size > max_bytes:
+        raise UploadRejected("Uploads are busy, try again later.", status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    upload_id = uuid.uuid4().hex
+    part_path, meta_path = _session_paths(upload_id)
+    open(part_path, 'wb').close()
+    with open(meta_path, 'w') as handle:
+        json.dump({'size': size, 'created': time.time(), 'client': client}, handle)
+    return upload_session_status(upload_id)
+
+
+def upload_session_status(upload_id):
+    part_path, meta_path = _session_paths(upload_id)
+    try:
+        with open(meta_path) as handle:
+            meta = json.load(handle)
+        offset = os.path.getsize(part_path)
+    except FileNotFoundError:
+        raise UploadRejected("Unknown upload.", status.HTTP_404_NOT_FOUND)
+    return {
+        'upload_id': upload_id,
+        'size': meta['size'],
+        'offset': offset,
+        'complete': offset == meta['size'],
+        'chunk_size': upload_chunk_size(),
+    }
+
+
+def append_upload_chunk(upload_id, offset, stream, length):
+    """
+    Copy `length` bytes from `stream` onto the session at `offset`, in
+    fixed-size pieces. `offset` must equal the bytes already received, and
+    only one request at a time may write to a session. Until the session
+    holds SIGNATURE_BYTES, data is buffered and checked with the bytes
+    before it, however small the chunks.
+    """
+    state = upload_session_status(upload_id)
+    part_path, _ = _session_paths(upload_id)
+    chunk_size = upload_chunk_size()
+    remaining = length
+    with open(part_path, 'ab') as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadRejected("Another chunk of this upload is being written.", status.HTTP_409_CONFLICT)
+        # The size under the lock, not the one read before it
+        received = os.fstat(handle.fileno()).st_size
+        if offset != received:
+            raise UploadRejected(f"Upload is at offset {received}, not {offset}.", status.HTTP_409_CONFLICT)
+        if offset + length > state['size']:
+            raise UploadRejected("Chunk goes past the declared size.", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        head = None
+        if received < SIGNATURE_BYTES:
+            with open(part_path, 'rb') as existing:
+                head = existing.read()
+        while remaining:
+            data = stream.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            if head is not None:
+                head += data
+                complete = offset + length - remaining == state['size']
+                if len(head) < SIGNATURE_BYTES and not complete:
+                    continue
+                if sniff_image_type(head[:SIGNATURE_BYTES]) is None:
+                    raise UploadRejected("Only JPEG, PNG and WebP images are accepted.", status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+                data, head = head[received:], None
+            handle.write(data)
+        if head is not None:
+            # Too short to check yet: the next chunk checks it with what follows
+            handle.write(head[received:])
+    return upload_session_status(upload_id)
+
+
+def open_completed_upload(upload_id, name='profile_pic'):
+    """Return the finished upload as a SpooledUploadedFile, ending the session."""
+    state = upload_session_status(upload_id)
+    if not state['complete']:
+        raise UploadRejected(f"Upload is incomplete ({state['offset']} of {state['size']} bytes).")
+    part_path, meta_path = _session_paths(upload_id)
+    handle = open(part_path, 'rb')
+    content_type = sniff_image_type(handle.read(SIGNATURE_BYTES))
+    handle.seek(0)
+    os.remove(meta_path)
+    extension = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/webp': 'webp'}.get(content_type, 'bin')
+    return SpooledUploadedFile(handle, f"{name}.{extension}", content_type, state['size'], None)
+
+
+def keep_upload(upload):
+    """
+    Make sure `upload` lives in the spool directory and return its path, so
+    it can wait there (e.g. for OTP verification) after the request ends.
+    """
+    if isinstance(upload, SpooledUploadedFile):
+        upload.close()
+        return upload.temporary_file_path()
+    path = os.path.join(spool_dir(), f"{uuid.uuid4().hex}.upload")
+    with open(path, 'wb') as handle:
+        for chunk in upload.chunks(upload_chunk_size()):
+            handle.write(chunk)
+    return path
+
+
+def purge_stale_uploads(max_age=None):
+    """Delete spool files older than `max_age` seconds (default: UPLOAD_SPOOL_MAX_AGE)."""
+    max_age = max_age or getattr(settings, 'UPLOAD_SPOOL_MAX_AGE', 24 * 3600)
+    cutoff = time.time() - max_age
+    with os.scandir(spool_dir()) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -27,6 +27,23 @@ from core.views.children import (
     ChildrenListByParentView,
 )
 
+from core.views.auth_async import (
+    AsyncRegisterView,
+    AsyncRegisterVerifyView,
+    AsyncSendOTPView,
+    AsyncLoginView,
+    AsyncParentRegisterView,
+    AsyncParentRegisterVerifyView,
+    AsyncParentSendOTPView,
+    AsyncParentLoginView,
+)
+
+from core.views.imports import BulkImportView
+from core.views.exports import CollegeExportView
+from core.views.uploads import UploadSessionCreateView, UploadSessionView
+from core.views.reference import CollegeSearchView, ReferenceDataView
+from core.views.metrics import ThrottleStatsView, OTPDeliveryStatsView, PrometheusMetricsView
+
 urlpatterns = [
     path('register', RegisterView.as_view(), name='register'),
     path('verify-otp', RegisterVerifyView.as_view(), name='verify-otp'),
@@ -43,11 +60,36 @@ urlpatterns = [
     path('parent-verify-otp', ParentRegisterVerifyView.as_view(), name='parent-verify-otp'),
     path('parent-send-otp', ParentSendOTPView.as_view(), name='parent-send-otp'),
     path('parent-login', ParentLoginView.as_view(), name='parent-login'),
+    path('uploads', UploadSessionCreateView.as_view(), name='upload-create'),
+    path('uploads/<str:upload_id>', UploadSessionView.as_view(), name='upload-session'),
 
     #===========================Children Details==========================
     path('children/add/', ChildrenCreateView.as_view(), name='add-child'),
     path('children/edit/<int:pk>/', ChildrenUpdateView.as_view(), name='edit-child'),
     path('children/delete/<int:pk>/', ChildrenDeleteView.as_view(), name='delete-child'),
     path('children/list/<int:parent_id>/', ChildrenListByParentView.as_view(), name='list-children-by-parent'),
+
+    #===========================Async auth (ASGI)==========================
+    path('async/register', AsyncRegisterView.as_view(), name='async-register'),
+    path('async/verify-otp', AsyncRegisterVerifyView.as_view(), name='async-verify-otp'),
+    path('async/send-otp', AsyncSendOTPView.as_view(), name='async-send-otp'),
+    path('async/login', AsyncLoginView.as_view(), name='async-login'),
+    path('async/parent-register', AsyncParentRegisterView.as_view(), name='async-parent-register'),
+    path('async/parent-verify-otp', AsyncParentRegisterVerifyView.as_view(), name='async-parent-verify-otp'),
+    path('async/parent-send-otp', AsyncParentSendOTPView.as_view(), name='async-parent-send-otp'),
+    path('async/parent-login', AsyncParentLoginView.as_view(), name='async-parent-login'),
+
+    #===========================Reference data==========================
+    path('reference-data', ReferenceDataView.as_view(), name='reference-data'),
+    path('colleges/search', CollegeSearchView.as_view(), name='college-search'),
+
+    #===========================Bulk import / export==========================
+    path('import/<str:kind>', BulkImportView.as_view(), name='bulk-import'),
+    path('export/<str:kind>/<int:college_id>/', CollegeExportView.as_view(), name='college-export'),
+
+    #===========================Operations==========================
+    path('throttle-stats', ThrottleStatsView.as_view(), name='throttle-stats'),
+    path('otp-delivery-stats', OTPDeliveryStatsView.as_view(), name='otp-delivery-stats'),
+    path('metrics', PrometheusMetricsView.as_view(), name='metrics'),
     
 ]
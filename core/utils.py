@@ -1,26 +1,32 @@
-from .models import College,CollegeTiming,DriverProfileMapping
+from .models import DriverProfileMapping
+from .reference import get_reference_cache
 from django.db import transaction
 
-def save_driver_profile_mapping(driver_profile, college_name, start_shift, end_shift):
+def save_driver_profile_mapping(driver_profile, college_name, start_shift, end_shift, college_id=None):
     """
     This function will handle:
-      - Checking if the college exists or creating a new one.
-      - Checking if the college timing exists or creating a new one.
+      - Resolving the college by name, creating it if it is new, unless
+        `college_id` names an existing one.
+      - Resolving the college timing, creating it if it is new.
       - Creating the mapping for the driver with the found/created college and timing.
+    Colleges and timings come from the in-process reference cache (core.reference),
+    so known ones cost no queries.
     """
+    references = get_reference_cache()
     try:
         with transaction.atomic():
-            # Step 1: Check if the College exists or create it
-            college, created = College.objects.get_or_create(college_name=college_name, is_active=True)
+            # Step 1: Find the College (case- and whitespace-insensitive) or create it
+            if college_id is None:
+                college_id = references.college_id(college_name)
 
-            # Step 2: Check if the CollegeTiming exists or create it
-            timing, created = CollegeTiming.objects.get_or_create(start_shift=start_shift, end_shift=end_shift)
+            # Step 2: Find the CollegeTiming or create it
+            timing_id = references.timing_id(start_shift, end_shift)
 
             # Step 3: Create DriverProfileMapping
             driver_mapping, created = DriverProfileMapping.objects.get_or_create(
                 driver=driver_profile,
-                college=college,
-                timing=timing
+                college_id=college_id,
+                timing_id=timing_id
             )
 
             if created:
@@ -32,4 +38,4 @@ def save_driver_profile_mapping(driver_profile, college_name, start_shift, end_s
 
     except Exception as e:
         # If any error occurs, handle it here
-        return {"error": f"An error occurred while saving the driver profile mapping: {str(e)}"}
\ No newline at end of file
+        return {"error": f"An error occurred while saving the driver profile mapping: {str(e)}"}
@@ -0,0 +1,262 @@
+"""
+Async versions of the driver and parent register, verify-otp, send-otp and
+login endpoints, served under /api/async/. They answer like the DRF views
+in core.views.driver and core.views.parent and share their OTP and account
+steps (core.views.otp), so an ASGI worker (see DMS/asgi.py) can hold many
+slow clients without a thread for each.
+
+On the event loop: body parsing, the throttles (their buckets are
+awaited, core.throttling.arejecting_throttle), user lookups with the async
+ORM (CustomUser.objects.aget_by_phone), challenge issue and verify
+through the store's aissue()/averify(), validation of the verify and login
+bodies (no queries), the login response (built from the relations loaded
+with the user) and queueing the OTP SMS.
+
+Still sync, each run in a worker thread through sync_to_async:
+  - save_registration(): registration validation reads the registered
+    phones filter and the reference cache, may query for both, and the
+    parent form moves an uploaded picture into the spool directory;
+  - account_response: the user, profile and mapping are created in one
+    transaction through run_write(), and the async ORM cannot open one;
+  - DatabaseChallengeStore.averify() and CacheChallengeStore's methods
+    (core.otp_store), for the same reason and because Django's cache
+    API is sync.
+
+Bodies are JSON or form data without files: a parent's picture is sent
+beforehand through the resumable `uploads` endpoints and referenced by
+upload_id, or posted to the sync parent-register, which streams it to the
+spool directory.
+"""
+import json
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError, Throttled, UnsupportedMediaType
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.metrics import count_otp, OTP_ISSUED
+from core.models import CustomUser, hash_otp
+from core.otp_store import get_challenge_store, challenge_key, DRIVER_REGISTRATION, PARENT_REGISTRATION
+from core.phones import InvalidPhoneNumber, normalize_phone
+from core.serializers import LoginOTPSerializer, ParentRegistrationSerializer, RegistrationSerializer, VerifyOTPSerializer
+from core.sms import send_otp_sms
+from core.throttling import OTP_THROTTLE_CLASSES, REGISTRATION_THROTTLE_CLASSES, arejecting_throttle
+from core.views.driver import DRIVER_LOGIN_RELATIONS, driver_account_response, driver_login_response
+from core.views.otp import acheck_login_otp, aissue_login_otp, registration_rejection
+from core.views.parent import parent_account_response, parent_login_response
+
+FORM_MEDIA_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+
+def respond(body, status_code=status.HTTP_200_OK):
+    return JsonResponse(body, status=status_code, encoder=JSONEncoder)
+
+
+def exception_response(exc, context):
+    """The response of DRF's EXCEPTION_HANDLER for an APIException, rendered as JSON."""
+    handled = api_settings.EXCEPTION_HANDLER(exc, context)
+    response = JsonResponse(handled.data, status=handled.status_code, encoder=JSONEncoder, safe=False)
+    # Retry-After, WWW-Authenticate
+    for header, value in handled.headers.items():
+        if header != 'Content-Type':
+            response[header] = value
+    return response
+
+
+def parse_body(request):
+    """The request data as a dict, from a JSON or form body without files."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+        if not isinstance(data, dict):
+            raise ParseError("JSON parse error - expected an object.")
+        return data
+    if request.content_type in FORM_MEDIA_TYPES or not request.body:
+        if request.FILES:
+            raise UnsupportedMediaType(
+                request.content_type,
+                "File uploads are not accepted here; send the file through the uploads endpoints and pass its upload_id.",
+            )
+        return request.POST.dict()
+    raise UnsupportedMediaType(request.content_type)
+
+
+def validated(serializer_class, data):
+    serializer = serializer_class(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def save_registration(serializer_class, data):
+    """Validate a registration and store its challenge; returns (challenge, otp_code)."""
+    serializer = serializer_class(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+class AsyncAPIView(View):
+    """
+    Base class: parses the body into self.data, runs the throttles and
+    renders handler results and APIExceptions the way DRF would.
+    """
+    http_method_names = ['post', 'options']
+    throttle_classes = ()
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Token-based API: no CSRF check, like DRF's APIView
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method == 'POST':
+                self.data = parse_body(request)
+                await self.check_throttles(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return exception_response(exc, {'view': self, 'args': args, 'kwargs': kwargs, 'request': request})
+
+    async def check_throttles(self, request):
+        # In order, stopping at the first rejection, like the sync views
+        # (core.throttling.OrderedThrottlesMixin). The throttles read only
+        # .data, .headers and .META of the request.
+        throttle_request = SimpleNamespace(data=self.data, headers=request.headers, META=request.META)
+        throttles = [throttle_class() for throttle_class in self.throttle_classes]
+        throttle = await arejecting_throttle(throttles, throttle_request, self)
+        if throttle is not None:
+            raise Throttled(wait=throttle.wait())
+
+
+class AsyncRegisterView(AsyncAPIView):
+    """Driver registration step 1 (core.views.driver.RegisterView), with the same throttles."""
+    serializer_class = RegistrationSerializer
+    purpose = DRIVER_REGISTRATION
+    throttle_classes = REGISTRATION_THROTTLE_CLASSES
+
+    async def post(self, request, *args, **kwargs):
+        challenge, otp_code = await sync_to_async(save_registration)(self.serializer_class, self.data)
+        count_otp(self.purpose, OTP_ISSUED)
+        phone_number = challenge.payload['phone_number']
+
+        # Queue the OTP SMS; delivery happens in the background
+        send_otp_sms(phone_number, otp_code)
+
+        return respond({
+            "message": "Registration step 1 complete. OTP sent (demo).",
+            "phone_number": str(phone_number),
+            "otp_code": otp_code  # DO NOT return this in production
+        })
+
+
+class AsyncParentRegisterView(AsyncRegisterView):
+    """Parent registration step 1 (core.views.parent.ParentRegisterView), without multipart uploads."""
+    serializer_class = ParentRegistrationSerializer
+    purpose = PARENT_REGISTRATION
+
+
+class AsyncRegisterVerifyView(AsyncAPIView):
+    """Driver registration step 2 (core.views.driver.RegisterVerifyView)."""
+    purpose = DRIVER_REGISTRATION
+    account_response = staticmethod(driver_account_response)
+
+    async def post(self, request, *args, **kwargs):
+        data = validated(VerifyOTPSerializer, self.data)
+
+        # One atomic check: counts the guess, or takes the pending registration
+        verification = await get_challenge_store().averify(
+            challenge_key(self.purpose, data['phone_number']), hash_otp(data['otp_code'])
+        )
+        rejection = registration_rejection(self.purpose, verification)
+        if rejection is not None:
+            return respond(*rejection)
+
+        return respond(*await sync_to_async(self.account_response)(verification.challenge.payload))
+
+
+class AsyncParentRegisterVerifyView(AsyncRegisterVerifyView):
+    """Parent registration step 2 (core.views.parent.ParentRegisterVerifyView)."""
+    purpose = PARENT_REGISTRATION
+    account_response = staticmethod(parent_account_response)
+
+
+class AsyncSendOTPView(AsyncAPIView):
+    """Driver login OTP (core.views.driver.SendOTPView), with the same throttles."""
+    throttle_classes = OTP_THROTTLE_CLASSES
+    not_found = "User not found with this phone number."
+
+    def user_type_allowed(self, user):
+        return user.is_driver and not user.is_student
+
+    async def post(self, request, *args, **kwargs):
+        phone_number = self.data.get("phone_number")
+
+        if not phone_number:
+            return respond({"detail": "Phone number is required."}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = await CustomUser.objects.aget_by_phone(phone_number)
+        except CustomUser.DoesNotExist:
+            try:
+                normalize_phone(phone_number)
+            except InvalidPhoneNumber as exc:
+                return respond({"detail": str(exc)}, status.HTTP_400_BAD_REQUEST)
+            return respond({"detail": self.not_found}, status.HTTP_404_NOT_FOUND)
+
+        if not user.is_active:
+            return respond({"detail": "User is not active."}, status.HTTP_400_BAD_REQUEST)
+
+        if not self.user_type_allowed(user):
+            return respond({"detail": "Invalid user type."}, status.HTTP_400_BAD_REQUEST)
+
+        return respond(await aissue_login_otp(user.phone_number))
+
+
+class AsyncParentSendOTPView(AsyncSendOTPView):
+    """Parent login OTP (core.views.parent.ParentSendOTPView)."""
+    not_found = "Parent not found with this phone number."
+
+    def user_type_allowed(self, user):
+        return user.is_student
+
+
+class AsyncLoginView(AsyncAPIView):
+    """Driver login (core.views.driver.LoginView)."""
+    relations = DRIVER_LOGIN_RELATIONS
+    not_found = "User not found with this phone number."
+    not_active = "User is not active."
+    login_response = staticmethod(driver_login_response)
+
+    async def post(self, request, *args, **kwargs):
+        data = validated(LoginOTPSerializer, self.data)
+        phone_number = data['phone_number']
+
+        # Everything the response needs comes with the user, so building it runs no queries
+        try:
+            user = await CustomUser.objects.select_related(*self.relations).aget_by_phone(phone_number)
+        except CustomUser.DoesNotExist:
+            return respond({"detail": self.not_found}, status.HTTP_404_NOT_FOUND)
+
+        if not user.is_active:
+            return respond({"detail": self.not_active}, status.HTTP_400_BAD_REQUEST)
+
+        rejection = await acheck_login_otp(user.phone_number, data['otp_code'], data.get('challenge'))
+        if rejection is not None:
+            return respond(*rejection)
+
+        return respond(self.login_response(user))
+
+
+class AsyncParentLoginView(AsyncLoginView):
+    """Parent login (core.views.parent.ParentLoginView)."""
+    relations = ('profile', 'parent_profile')
+    not_found = "Parent not found with this phone number."
+    not_active = "Parent is not active."
+    login_response = staticmethod(parent_login_response)
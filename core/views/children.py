@@ -2,7 +2,8 @@ from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework import status
 from core.models import Children
-from core.serializers import ChildrenSerializer,ChildrenListSerializer
+from core.serializers import ChildrenSerializer,ChildrenListSerializer,CHILDREN_LIST_ROWS
+from core.pagination import ChildrenCursorPagination
 
 # ================== Create a child entry
 class ChildrenCreateView(generics.CreateAPIView):
@@ -65,20 +66,49 @@ class ChildrenDeleteView(generics.DestroyAPIView):
 
 
 class ChildrenListByParentView(generics.ListAPIView):
+    """
+    List the children of a parent.
+
+    The rows are rendered from one values() query joining the college,
+    timing, parent and parent profile, plus one query each for the parent's
+    groups and permissions (CHILDREN_LIST_ROWS, core.row_serializers), so
+    the query count stays constant however many children the parent has
+    and no model instances are built. The JSON is the same as
+    ChildrenListSerializer's.
+
+    Passing `cursor` or `page_size` switches to keyset pagination on
+    Children.id; without them the full list is returned as before.
+    """
     serializer_class = ChildrenListSerializer
+    pagination_class = ChildrenCursorPagination
 
     def get_queryset(self):
         parent_id = self.kwargs['parent_id']  
-        return Children.objects.filter(parent_id=parent_id)  
+        return Children.objects.filter(parent_id=parent_id).order_by('id')
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
+    def is_paginated_request(self):
+        params = self.request.query_params
+        return (
+            self.paginator.cursor_query_param in params
+            or self.paginator.page_size_query_param in params
+        )
 
-        if not queryset.exists():  
+    def list(self, request, *args, **kwargs):
+        rows = CHILDREN_LIST_ROWS.values(self.get_queryset())
+
+        if self.is_paginated_request():
+            page = self.paginate_queryset(rows)
+            if page or self.paginator.cursor_query_param in request.query_params:
+                data = CHILDREN_LIST_ROWS.render(page, self.get_serializer_context())
+                return self.get_paginated_response(data)
+            children = page
+        else:
+            children = list(rows)
+
+        if not children:  
             return Response({
                 "message": "No record found in the table for this ID",
                 "sms": f"No children records found for parent ID {self.kwargs['parent_id']}."
             }, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(CHILDREN_LIST_ROWS.render(children, self.get_serializer_context()), status=status.HTTP_200_OK)
@@ -1,35 +1,155 @@
-import random
-import hashlib
 import logging
-from django.utils import timezone
 from rest_framework import status, generics
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from core.models import TempUser, CustomUser, Profile, hash_otp,College,CollegeTiming,DriverProfileMapping
-from core.serializers import RegistrationSerializer, VerifyOTPSerializer, GetCustomUserSerializer,ProfileListSerializer,ProfileUpdateSerializer,DriverProfileMappingSerializer
+from core.models import CustomUser, Profile, hash_otp,DriverProfileMapping
+from core.serializers import RegistrationSerializer, VerifyOTPSerializer, LoginOTPSerializer, GetCustomUserSerializer,ProfileListSerializer,ProfileUpdateSerializer,DriverProfileMappingSerializer,PROFILE_LIST_ROWS
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db import transaction
+from django.db import IntegrityError
 from core.utils import save_driver_profile_mapping
-from rest_framework.views import APIView
+from core.throttling import OTP_THROTTLE_CLASSES, REGISTRATION_THROTTLE_CLASSES, OrderedThrottlesMixin
+from core.phones import InvalidPhoneNumber, normalize_phone, phone_key
+from core.sms import send_otp_sms
+from core.images import thumbnail_urls
+from core.profile_cache import ProfileVersion, cached_profile_data
+from core.otp_store import get_challenge_store, challenge_key, DRIVER_REGISTRATION
+from core.views.otp import check_login_otp, issue_login_otp, registration_rejection
+from core.write_queue import run_write
+from core.metrics import count_otp, OTP_ISSUED
 from rest_framework.permissions import IsAuthenticated
-from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
-from rest_framework import serializers, status
-from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-class RegisterView(generics.GenericAPIView):
+# Everything LoginView needs, loaded in the same query as the user
+DRIVER_LOGIN_RELATIONS = (
+    'profile',
+    'profile__vehicle_type',
+    'profile__driverprofilemapping',
+    'profile__driverprofilemapping__college',
+    'profile__driverprofilemapping__timing',
+)
+
+
+def create_driver_account(registration):
+    """
+    Create the user, profile and college mapping of a verified registration.
+    Returns (user, mapping result). Run through run_write(), as one transaction.
+    """
+    user = CustomUser.objects.create_user(
+        phone_number=registration['phone_number'],
+        is_driver=registration['is_driver'],
+        is_student=registration['is_student'],
+    )
+    profile = Profile.objects.create(
+        user=user,
+        full_name=registration['full_name'],
+        dob=registration['dob'],
+        email=registration['email'],
+        licence_no=registration['licence_no'],
+        licence_exp_date=registration['licence_exp_date'],
+        vehicle_type_id=registration['vehicle_type'],
+        vehicle_no=registration['vehicle_no'],
+    )
+
+    # Map the driver to the college and shift
+    mapping_result = {}
+    if registration['is_driver']:
+        mapping_result = save_driver_profile_mapping(
+            profile,
+            registration['college_name'],
+            registration['start_shift'],
+            registration['end_shift'],
+            college_id=registration.get('college'),
+        )
+    return user, mapping_result
+
+
+def driver_account_response(registration):
+    """
+    Create the account of a verified registration and return the
+    verify-otp response as (body, status).
+    """
+    try:
+        user, mapping_result = run_write(create_driver_account, registration)
+    except IntegrityError:
+        # Another registration of this number was verified first; the
+        # unique phone_key rolled back this user, profile and mapping
+        if not CustomUser.objects.filter(phone_key=phone_key(registration['phone_number'])).exists():
+            raise
+        return {"detail": "A user with this phone number already exists."}, status.HTTP_409_CONFLICT
+    if 'error' in mapping_result:
+        return {"detail": mapping_result['error']}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    # Generate JWT tokens
+    refresh = RefreshToken.for_user(user)
+    user_data = GetCustomUserSerializer(user).data
+
+    return {
+        "user": user_data,
+        "refresh": str(refresh),
+        "access": str(refresh.access_token),
+        "message": "Registration successful"
+    }, status.HTTP_201_CREATED
+
+
+def driver_login_response(user):
+    """
+    The login response body for a user loaded with DRIVER_LOGIN_RELATIONS;
+    runs no queries, so the async login can call it from the event loop.
+    """
+    refresh = RefreshToken.for_user(user)
+    user_data = GetCustomUserSerializer(user).data
+
+    # Driver mapping details come from the relations loaded with the user
+    driver_data = None
+    if user.is_driver:
+        try:
+            profile = user.profile
+            driver_mapping = profile.driverprofilemapping
+            driver_data = {
+                "full_name": profile.full_name,
+                "profile_pic": profile.profile_pic.url if profile.profile_pic else None,
+                "profile_pic_thumbnails": thumbnail_urls(profile.profile_pic),
+                "dob": profile.dob,
+                "email": profile.email,
+                "licence_no": profile.licence_no,
+                "licence_exp_date": profile.licence_exp_date,
+                "vehicle_type": profile.vehicle_type.vehicle_name if profile.vehicle_type else None,
+                "vehicle_no": profile.vehicle_no,
+                "college": driver_mapping.college.college_name,
+                "shift": {
+                    "start": driver_mapping.timing.start_shift,
+                    "end": driver_mapping.timing.end_shift
+                }
+            }
+        except (Profile.DoesNotExist, DriverProfileMapping.DoesNotExist):
+            driver_data = None
+
+    # Return JWT tokens and user data
+    return {
+        "user": user_data,
+        "driver_info": driver_data,
+        "refresh": str(refresh),
+        "access": str(refresh.access_token),
+        "message": "Login successful"
+    }
+
+
+class RegisterView(OrderedThrottlesMixin, generics.GenericAPIView):
     """
     Step 1: 
       - Accept registration data (phone_number, full_name, etc.).
-      - Create TempUser with hashed OTP.
+      - Store it in the OTP challenge store with the hashed OTP.
       - (Production: send OTP to phone).
     """
     serializer_class = RegistrationSerializer
     permission_classes = [AllowAny]
+    throttle_classes = REGISTRATION_THROTTLE_CLASSES
 
     def post(self, request, *args, **kwargs):
         """
@@ -38,16 +158,18 @@ class RegisterView(generics.GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        # Create TempUser using validated data and OTP
-        temp_user, otp_code = serializer.save()
+        # Store the pending registration and OTP
+        challenge, otp_code = serializer.save()
+        count_otp(DRIVER_REGISTRATION, OTP_ISSUED)
+        phone_number = challenge.payload['phone_number']
 
-        # Simulate sending OTP via SMS (e.g., Twilio)
-        logger.info(f"OTP for {temp_user.phone_number} is {otp_code}")  # Log for debugging (don't return OTP in production)
+        # Queue the OTP SMS; delivery happens in the background
+        send_otp_sms(phone_number, otp_code)
         
         return Response(
             {
                 "message": "Registration step 1 complete. OTP sent (demo).",
-                "phone_number": str(temp_user.phone_number),
+                "phone_number": str(phone_number),
                 "otp_code": otp_code  # DO NOT return this in production
             },
             status=status.HTTP_200_OK
@@ -59,7 +181,7 @@ class RegisterVerifyView(generics.GenericAPIView):
     """
     Step 2:
       - Verify phone_number & otp_code.
-      - If correct and not expired, create real user & profile, delete TempUser.
+      - If correct and not expired, create real user & profile from the pending registration.
       - Map the driver to a college and timing.
     """
     serializer_class = VerifyOTPSerializer
@@ -73,91 +195,25 @@ class RegisterVerifyView(generics.GenericAPIView):
         otp_code = serializer.validated_data['otp_code']
         hashed_input_otp = hash_otp(otp_code)
 
-        try:
-            temp_user = TempUser.objects.get(phone_number=phone_number)
-        except TempUser.DoesNotExist:
-            return Response(
-                {"detail": "No pending registration found for this phone number."},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Check max attempts
-        if temp_user.attempt_count >= temp_user.max_attempts:
-            temp_user.delete()
-            return Response(
-                {"detail": "Maximum OTP attempts exceeded. Please register again."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Check if OTP is expired
-        if (timezone.now() - temp_user.otp_created_at).total_seconds() > 300:  # 5 minutes
-            temp_user.delete()
-            return Response(
-                {"detail": "OTP expired. Please register again."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Compare hashed OTP
-        if temp_user.otp_hash != hashed_input_otp:
-            temp_user.attempt_count += 1
-            temp_user.save()
-            return Response(
-                {"detail": f"Invalid OTP. Attempts left: {temp_user.max_attempts - temp_user.attempt_count}"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # OTP is correct -> Create real user
-        user = CustomUser.objects.create_user(
-            phone_number=temp_user.phone_number,
-            is_driver=temp_user.is_driver,
-            is_student=temp_user.is_student,
-        )
-        profile = Profile.objects.create(
-            user=user,
-            full_name=temp_user.full_name,
-            dob=temp_user.dob,
-            email=temp_user.email,
-            licence_no=temp_user.licence_no,
-            licence_exp_date=temp_user.licence_exp_date,
-            vehicle_type=temp_user.vehicle_type,
-            vehicle_no=temp_user.vehicle_no,
-        )
-
-        # Map the driver to the college and shift
-        if temp_user.is_driver:
-            mapping_result = save_driver_profile_mapping(
-                profile,
-                temp_user.college_name,
-                temp_user.start_shift,
-                temp_user.end_shift
-            )
-            if 'error' in mapping_result:
-                return Response(
-                    {"detail": mapping_result['error']},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-
-        # Clean up the TempUser
-        temp_user.delete()
+        # One atomic check: counts the guess, or takes the pending registration
+        # so that concurrent verifies of the right code succeed exactly once
+        verification = get_challenge_store().verify(challenge_key(DRIVER_REGISTRATION, phone_number), hashed_input_otp)
+        rejection = registration_rejection(DRIVER_REGISTRATION, verification)
+        if rejection is not None:
+            return Response(*rejection)
 
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
-        user_data = GetCustomUserSerializer(user).data
+        # OTP is correct -> Create real user, profile and mapping
+        return Response(*driver_account_response(verification.challenge.payload))
 
-        return Response({
-            "user": user_data,
-            "refresh": str(refresh),
-            "access": str(refresh.access_token),
-            "message": "Registration successful"
-        }, status=status.HTTP_201_CREATED)
 
 
-
-class SendOTPView(generics.GenericAPIView):
+class SendOTPView(OrderedThrottlesMixin, generics.GenericAPIView):
     """
     Generate and send OTP via phone number for login.
+    Throttled per phone number, per client IP and globally.
     """
     permission_classes = [AllowAny]
+    throttle_classes = OTP_THROTTLE_CLASSES
     
     def post(self, request, *args, **kwargs):
         phone_number = request.data.get("phone_number")
@@ -168,8 +224,12 @@ class SendOTPView(generics.GenericAPIView):
         
         # Check if the user exists
         try:
-            user = CustomUser.objects.get(phone_number=phone_number)
+            user = CustomUser.objects.get_by_phone(phone_number)
         except CustomUser.DoesNotExist:
+            try:
+                normalize_phone(phone_number)
+            except InvalidPhoneNumber as exc:
+                return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
             return Response({"detail": "User not found with this phone number."}, status=status.HTTP_404_NOT_FOUND)
         
         # Check if user is active and the correct type
@@ -179,33 +239,14 @@ class SendOTPView(generics.GenericAPIView):
         if not user.is_driver or user.is_student:
             return Response({"detail": "Invalid user type."}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Generate OTP
-        otp_code = str(random.randint(1000, 9999))
-        hashed_otp = hashlib.sha256(otp_code.encode()).hexdigest()
-        
-        # Save OTP hash temporarily (you can store it in a user-specific field if needed)
-        user.otp_hash = hashed_otp
-        user.otp_created_at = timezone.now()
-        user.save()
-        
-        # Log OTP (In production, DO NOT log OTP, this is for debugging only)
-        logger.info(f"OTP for {phone_number} is {otp_code}")  # Log for debugging (don't return OTP in production)
-        
-        return Response(
-            {
-                "message": "OTP sent successfully.",
-                "phone_number": phone_number,
-                "otp_code": otp_code
-            },
-            status=status.HTTP_200_OK
-        )
+        return Response(issue_login_otp(user.phone_number), status=status.HTTP_200_OK)
 
 
 class LoginView(generics.GenericAPIView):
     """
     Login using phone number and OTP.
     """
-    serializer_class = VerifyOTPSerializer
+    serializer_class = LoginOTPSerializer
     permission_classes = [AllowAny]
 
     def post(self, request, *args, **kwargs):
@@ -220,11 +261,10 @@ class LoginView(generics.GenericAPIView):
 
         phone_number = serializer.validated_data['phone_number']
         otp_code = serializer.validated_data['otp_code']
-        hashed_input_otp = hashlib.sha256(otp_code.encode()).hexdigest()
 
-        # Check if the user exists
+        # Fetch the user together with profile, mapping, college, timing and vehicle type
         try:
-            user = CustomUser.objects.get(phone_number=phone_number)
+            user = CustomUser.objects.select_related(*DRIVER_LOGIN_RELATIONS).get_by_phone(phone_number)
         except CustomUser.DoesNotExist:
             return Response(
                 {"detail": "User not found with this phone number."},
@@ -235,61 +275,12 @@ class LoginView(generics.GenericAPIView):
         if not user.is_active:
             return Response({"detail": "User is not active."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Compare OTP hash
-        if user.otp_hash != hashed_input_otp:
-            return Response(
-                {"detail": "Invalid OTP."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        rejection = check_login_otp(user.phone_number, otp_code, serializer.validated_data.get('challenge'))
+        if rejection is not None:
+            return Response(*rejection)
 
-        # Check if OTP is expired (e.g., 5 minutes)
-        if (timezone.now() - user.otp_created_at).total_seconds() > 300:  # 5 minutes
-            return Response(
-                {"detail": "OTP expired. Please request a new OTP."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # OTP is correct, generate JWT tokens for the user
-        refresh = RefreshToken.for_user(user)
-        user_data = GetCustomUserSerializer(user).data
-
-        # Fetch driver mapping details if the user is a driver
-        driver_data = None
-        if user.is_driver:
-            try:
-                profile = user.profile
-                driver_mapping = DriverProfileMapping.objects.get(driver=profile)
-                driver_data = {
-                    "full_name": profile.full_name,
-                    "profile_pic": profile.profile_pic.url if profile.profile_pic else None,
-                    "dob": profile.dob,
-                    "email": profile.email,
-                    "licence_no": profile.licence_no,
-                    "licence_exp_date": profile.licence_exp_date,
-                    "vehicle_type": driver_mapping.driver.vehicle_type.vehicle_name if driver_mapping.driver.vehicle_type else None,
-                    "vehicle_no": driver_mapping.driver.vehicle_no,
-                    "college": driver_mapping.college.college_name,
-                    "shift": {
-                        "start": driver_mapping.timing.start_shift,
-                        "end": driver_mapping.timing.end_shift
-                    }
-                }
-            except (Profile.DoesNotExist, DriverProfileMapping.DoesNotExist):
-                driver_data = None
-
-        # Clean up OTP fields after successful login (optional, for security reasons)
-        user.otp_hash = None
-        user.otp_created_at = None
-        user.save()
-
-        # Return JWT tokens and user data
-        return Response({
-            "user": user_data,
-            "driver_info": driver_data,
-            "refresh": str(refresh),
-            "access": str(refresh.access_token),
-            "message": "Login successful"
-        }, status=status.HTTP_200_OK)
+        # OTP is correct: JWT tokens, user data and driver mapping details
+        return Response(driver_login_response(user), status=status.HTTP_200_OK)
 
 
 # ======================== API View for  Updating  Driver Profile
@@ -297,20 +288,41 @@ class LoginView(generics.GenericAPIView):
 
 
 class DriverProfileDetailView(generics.RetrieveAPIView):
+    """
+    A driver's profile with its college and shift. Responses carry an ETag
+    and Last-Modified from the updated_at of the profile and its college
+    mapping; saving the user, college or timing advances them too
+    (core.signals). Polls that send either back (If-None-Match /
+    If-Modified-Since) get a 304 after one version query. Full responses
+    are cached per version (core.profile_cache).
+    """
     permission_classes = [IsAuthenticated]
     serializer_class = ProfileListSerializer
+    renderer_classes = [JSONRenderer]
 
-    def get_object(self):
-        driver_id = self.kwargs['driver_id']
-        try:
-            return Profile.objects.get(user_id=driver_id)  # Match with user_id in Profile
-        except Profile.DoesNotExist:
+    def profile_data(self):
+        # ProfileListSerializer's output, from values() rows (core.row_serializers)
+        rows = PROFILE_LIST_ROWS.values(Profile.objects.filter(user_id=self.kwargs['driver_id']))
+        data = PROFILE_LIST_ROWS.render(rows, self.get_serializer_context())
+        if not data:
+            raise NotFound({"message": "No profile found for the given driver ID."})
+        return data[0]
+
+    def retrieve(self, request, *args, **kwargs):
+        version = ProfileVersion.load(self.kwargs['driver_id'])
+        if version is None:
             raise NotFound({"message": "No profile found for the given driver ID."})
-        # try:
-        #     return Profile.objects.get(id=driver_id)
-        # except Profile.DoesNotExist:
-        #     raise NotFound({"message": "No profile found for this driver ID"})
 
+        last_modified = int(version.last_modified.timestamp())
+        response = get_conditional_response(request, etag=version.etag, last_modified=last_modified)
+        if response is None:
+            data = cached_profile_data(version, request, self.profile_data)
+            response = Response(data, status=status.HTTP_200_OK)
+        response['ETag'] = version.etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Clients may keep the response but must revalidate it on every poll
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
 
 class DriverProfileUpdateView(generics.UpdateAPIView):
@@ -0,0 +1,30 @@
+from django.http import StreamingHttpResponse
+from rest_framework import generics, status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from core.exporters import EXPORTS, stream_export
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class CollegeExportView(generics.GenericAPIView):
+    """
+    Stream every child or driver of a college as CSV (default) or NDJSON
+    (?file_format=ndjson). DRF reserves ?format= for renderer selection.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, kind, college_id, *args, **kwargs):
+        fmt = request.query_params.get('file_format', 'csv')
+        if kind not in EXPORTS:
+            return Response({"detail": f"Unknown export type {kind}."}, status=status.HTTP_404_NOT_FOUND)
+        if fmt not in CONTENT_TYPES:
+            return Response({"detail": f"Unsupported format {fmt}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(stream_export(kind, college_id, fmt), content_type=CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="college-{college_id}-{kind}.{fmt}"'
+        return response
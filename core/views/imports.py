@@ -0,0 +1,48 @@
+from django.db import DatabaseError
+from rest_framework import generics, status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from core.importers import IMPORTERS, MAX_CHUNK_SIZE, format_from_name
+
+
+class BulkImportView(generics.GenericAPIView):
+    """
+    Upload a CSV or NDJSON file in the `file` field to import drivers or
+    children. The upload is read record by record, so the file is never
+    loaded into memory as a whole. Rows that fail validation, and chunks
+    whose transaction fails, are listed in the report; the other chunks
+    are saved.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, kind, *args, **kwargs):
+        if kind not in IMPORTERS:
+            return Response({"detail": f"Unknown import type {kind}."}, status=status.HTTP_404_NOT_FOUND)
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "A file is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('format') or format_from_name(upload.name)
+        try:
+            chunk_size = int(request.data.get('chunk_size', 1000))
+        except ValueError:
+            chunk_size = 0
+        if chunk_size < 1:
+            return Response({"detail": "chunk_size must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            report = IMPORTERS[kind](upload.file, fmt, chunk_size=min(chunk_size, MAX_CHUNK_SIZE))
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except DatabaseError as exc:
+            # Outside a chunk's writes, e.g. the lookups before one; earlier chunks are saved
+            return Response(
+                {"detail": f"Import stopped: {exc}. Chunks before the failure were saved."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
@@ -0,0 +1,49 @@
+from django.http import HttpResponse
+from rest_framework import generics, status
+from rest_framework.permissions import BasePermission, IsAdminUser
+from rest_framework.response import Response
+
+from core.metrics import metrics_token_matches, render_prometheus
+from core.sms import get_otp_dispatcher
+from core.throttling import get_throttle_counters
+
+
+class ThrottleStatsView(generics.GenericAPIView):
+    """
+    Allowed/rejected request counts per throttle scope, for this process.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_throttle_counters(), status=status.HTTP_200_OK)
+
+
+class OTPDeliveryStatsView(generics.GenericAPIView):
+    """
+    OTP SMS dispatcher counters and delivery latency, for this process.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_otp_dispatcher().snapshot(), status=status.HTTP_200_OK)
+
+
+class IsAdminOrMetricsScraper(BasePermission):
+    """Staff users, or a scraper sending settings.METRICS_TOKEN as X-Metrics-Token."""
+
+    def has_permission(self, request, view):
+        if metrics_token_matches(request):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+class PrometheusMetricsView(generics.GenericAPIView):
+    """
+    Per-route latency, SQL and non-SQL time histograms, response counts, OTP
+    events, throttle decisions and SMS/write-queue counters for this
+    process, in the Prometheus text format.
+    """
+    permission_classes = [IsAdminOrMetricsScraper]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
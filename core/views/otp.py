@@ -0,0 +1,123 @@
+"""
+OTP steps shared by the driver and parent views, sync (core.views.driver,
+core.views.parent) and async (core.views.auth_async). Each returns plain
+(body, status) pairs so either kind of view can render them.
+"""
+import random
+
+from rest_framework import status
+
+from core.metrics import count_otp, OTP_ISSUED, OTP_VERIFIED, OTP_FAILED, OTP_EXPIRED, OTP_EXHAUSTED
+from core.models import hash_otp
+from core.otp_store import get_challenge_store, challenge_key, LOGIN, NOT_FOUND
+from core.otp_tokens import ChallengeRejected, get_signed_challenges, signed_challenges_enabled
+from core.sms import send_otp_sms
+
+
+def registration_rejection(purpose, verification):
+    """
+    (body, status) for a registration verify that did not get the pending
+    registration, after counting the event; None once it is verified.
+    """
+    if verification.outcome == NOT_FOUND:
+        return {"detail": "No pending registration found for this phone number."}, status.HTTP_404_NOT_FOUND
+    count_otp(purpose, verification.outcome)
+
+    if verification.outcome == OTP_EXHAUSTED:
+        return {"detail": "Maximum OTP attempts exceeded. Please register again."}, status.HTTP_400_BAD_REQUEST
+
+    if verification.outcome == OTP_EXPIRED:
+        return {"detail": "OTP expired. Please register again."}, status.HTTP_400_BAD_REQUEST
+
+    if verification.outcome == OTP_FAILED:
+        return {"detail": f"Invalid OTP. Attempts left: {verification.attempts_left}"}, status.HTTP_400_BAD_REQUEST
+    return None
+
+
+def login_rejection(verification):
+    """(body, status) for a login OTP the challenge store did not accept; None if it did."""
+    if verification.outcome == OTP_EXPIRED:
+        count_otp(LOGIN, OTP_EXPIRED)
+        return {"detail": "OTP expired. Please request a new OTP."}, status.HTTP_400_BAD_REQUEST
+
+    if verification.outcome == OTP_EXHAUSTED:
+        count_otp(LOGIN, OTP_EXHAUSTED)
+        return {"detail": "Maximum OTP attempts exceeded. Please request a new OTP."}, status.HTTP_400_BAD_REQUEST
+
+    # Wrong code, no code issued, or a concurrent login already used it
+    if not verification.verified:
+        count_otp(LOGIN, OTP_FAILED)
+        return {"detail": "Invalid OTP."}, status.HTTP_400_BAD_REQUEST
+    return None
+
+
+def signed_login_rejection(phone_number, otp_code, signed_challenge):
+    """The same for a signed challenge, checked in memory (core.otp_tokens)."""
+    try:
+        get_signed_challenges().verify(LOGIN, phone_number, otp_code, signed_challenge)
+    except ChallengeRejected as exc:
+        count_otp(LOGIN, exc.outcome)
+        return {"detail": exc.detail}, status.HTTP_400_BAD_REQUEST
+    return None
+
+
+def check_login_otp(phone_number, otp_code, signed_challenge=None):
+    """Use up a login OTP; returns (body, status) when it is rejected, else None."""
+    if signed_challenge and signed_challenges_enabled():
+        rejection = signed_login_rejection(phone_number, otp_code, signed_challenge)
+    else:
+        rejection = login_rejection(get_challenge_store().verify(challenge_key(LOGIN, phone_number), hash_otp(otp_code)))
+    if rejection is None:
+        count_otp(LOGIN, OTP_VERIFIED)
+    return rejection
+
+
+async def acheck_login_otp(phone_number, otp_code, signed_challenge=None):
+    if signed_challenge and signed_challenges_enabled():
+        rejection = signed_login_rejection(phone_number, otp_code, signed_challenge)
+    else:
+        verification = await get_challenge_store().averify(challenge_key(LOGIN, phone_number), hash_otp(otp_code))
+        rejection = login_rejection(verification)
+    if rejection is None:
+        count_otp(LOGIN, OTP_VERIFIED)
+    return rejection
+
+
+def new_login_otp(phone_number):
+    """A login code and the send-otp response body, before the code is stored."""
+    otp_code = str(random.randint(1000, 9999))
+    body = {
+        "message": "OTP sent successfully.",
+        "phone_number": phone_number,
+        "otp_code": otp_code
+    }
+    return otp_code, body
+
+
+def issue_login_otp(phone_number):
+    """
+    Keep the OTP hash in the challenge store, or hand the client a signed
+    challenge to send back with the code; the user row is not written.
+    Queues the SMS and returns the response body.
+    """
+    otp_code, body = new_login_otp(phone_number)
+    if signed_challenges_enabled():
+        body["challenge"] = get_signed_challenges().issue(LOGIN, phone_number, otp_code)
+    else:
+        get_challenge_store().issue(challenge_key(LOGIN, phone_number), hash_otp(otp_code))
+    count_otp(LOGIN, OTP_ISSUED)
+
+    # Queue the OTP SMS; delivery happens in the background
+    send_otp_sms(phone_number, otp_code)
+    return body
+
+
+async def aissue_login_otp(phone_number):
+    otp_code, body = new_login_otp(phone_number)
+    if signed_challenges_enabled():
+        body["challenge"] = get_signed_challenges().issue(LOGIN, phone_number, otp_code)
+    else:
+        await get_challenge_store().aissue(challenge_key(LOGIN, phone_number), hash_otp(otp_code))
+    count_otp(LOGIN, OTP_ISSUED)
+    send_otp_sms(phone_number, otp_code)
+    return body
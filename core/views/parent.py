@@ -1,51 +1,161 @@
-import random
-import hashlib
 import logging
-from django.utils import timezone
 from rest_framework import status, generics
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from core.models import TempUser,TempParent, CustomUser, Profile, hash_otp,College,CollegeTiming,DriverProfileMapping,Parent_Profile
-from core.serializers import RegistrationSerializer, VerifyOTPSerializer, GetCustomUserSerializer,ParentRegistrationSerializer,ParentProfileSerializer
+from core.models import CustomUser, hash_otp,Parent_Profile
+from core.serializers import VerifyOTPSerializer, LoginOTPSerializer, GetCustomUserSerializer,ParentRegistrationSerializer,ParentProfileSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db import transaction
-from core.utils import save_driver_profile_mapping
+from django.db import IntegrityError
+from core.throttling import OTP_THROTTLE_CLASSES, REGISTRATION_THROTTLE_CLASSES, OrderedThrottlesMixin
+from core.phones import InvalidPhoneNumber, normalize_phone, phone_key
+from core.sms import send_otp_sms
+from core.otp_store import get_challenge_store, challenge_key, PARENT_REGISTRATION
+from core.views.otp import check_login_otp, issue_login_otp, registration_rejection
+from core.uploads import SpooledImageUploadHandler, UploadRejected, max_upload_bytes, request_content_length
+from core.write_queue import run_write
+from core.metrics import count_otp, OTP_ISSUED
+from django.core.files import File
 from rest_framework.parsers import MultiPartParser, FormParser
+import os
 # Set up logging
 logger = logging.getLogger(__name__)
 
 
-class ParentRegisterView(generics.GenericAPIView):
+def create_parent_account(registration, profile):
+    """
+    Create the user of a verified registration and save its (unsaved)
+    Parent_Profile. Run through run_write(), as one transaction.
+    """
+    user = CustomUser.objects.create_user(
+        phone_number=registration['phone_number'],
+        is_student=registration['is_student'],
+    )
+    profile.user = user
+    profile.save()
+    return user
+
+
+def parent_account_response(registration):
+    """
+    Create the account of a verified registration, moving its spooled
+    picture into media storage, and return the verify response as
+    (body, status).
+    """
+    profile = Parent_Profile(
+        full_name=registration['full_name'],
+        dob=registration['dob'],
+        email=registration['email'],
+    )
+
+    # Move the spooled picture into media storage (before taking the
+    # write lock), then drop the spool copy
+    spooled_path = registration.get('profile_pic_path')
+    if spooled_path and os.path.exists(spooled_path):
+        with open(spooled_path, 'rb') as handle:
+            profile.profile_pic.save(registration['profile_pic_name'], File(handle), save=False)
+        os.remove(spooled_path)
+
+    try:
+        user = run_write(create_parent_account, registration, profile)
+    except IntegrityError:
+        # Another registration of this number was verified first
+        if not CustomUser.objects.filter(phone_key=phone_key(registration['phone_number'])).exists():
+            raise
+        if profile.profile_pic:
+            profile.profile_pic.delete(save=False)
+        return {"detail": "A user with this phone number already exists."}, status.HTTP_409_CONFLICT
+
+    # Generate JWT tokens
+    refresh = RefreshToken.for_user(user)
+    user_data = GetCustomUserSerializer(user).data
+
+    return {
+        "user": user_data,
+        "refresh": str(refresh),
+        "access": str(refresh.access_token),
+        "message": "Registration successful"
+    }, status.HTTP_201_CREATED
+
+
+def parent_login_response(user):
+    """The login response body for a user loaded with its profiles; runs no queries."""
+    refresh = RefreshToken.for_user(user)
+    user_data = GetCustomUserSerializer(user).data
+
+    # Fetch the parent profile (Assuming One-to-One relation)
+    parent_profile_data = None
+    if hasattr(user, 'parent_profile'):  # Check if the related profile exists
+        parent_profile_data = ParentProfileSerializer(user.parent_profile).data
+
+    # Return JWT tokens, user data, and parent profile
+    return {
+        "user": user_data,
+        "parent_profile": parent_profile_data,
+        "refresh": str(refresh),
+        "access": str(refresh.access_token),
+        "message": "Login successful"
+    }
+
+
+class ParentRegisterView(OrderedThrottlesMixin, generics.GenericAPIView):
     """
     Step 1: 
       - Accept registration data (phone_number, full_name, etc.).
-      - Create TempParent with hashed OTP.
+      - Store it in the OTP challenge store with the hashed OTP.
       - (Production: send OTP to phone).
+
+    The profile picture is streamed to the spool directory in fixed-size
+    chunks (core.uploads), never held in memory. Oversized or non-image
+    uploads are rejected as soon as the limit is hit; large pictures can
+    also be sent beforehand through the resumable `uploads` endpoints and
+    referenced here by `upload_id`.
     """
     serializer_class = ParentRegistrationSerializer
     permission_classes = [AllowAny]
     parser_classes = [MultiPartParser, FormParser]
+    throttle_classes = REGISTRATION_THROTTLE_CLASSES
+    # Room for the form fields and multipart boundaries around the picture
+    FORM_OVERHEAD_BYTES = 64 * 1024
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [SpooledImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
         """
         Handle registration step 1, where the OTP is generated and sent to the user's phone.
         """
-        print("Request Data:", request.data)  # Debugging
-        print("Request Files:", request.FILES) 
+        # Refuse bodies that cannot fit before reading any of them
+        try:
+            content_length = request_content_length(request)
+        except UploadRejected as exc:
+            return Response({"detail": exc.detail}, status=exc.status_code)
+        if content_length > max_upload_bytes() + self.FORM_OVERHEAD_BYTES:
+            return Response(
+                {"detail": "Uploaded file is too large."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
 
-        serializer = self.get_serializer(data=request.data)
+        data = request.data
+        handler = request.upload_handlers[0]
+        if handler.rejection is not None:
+            return Response({"detail": handler.rejection.detail}, status=handler.rejection.status_code)
+
+        serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
 
-        # Create TempUser using validated data and OTP
-        temp_user, otp_code = serializer.save()
+        # Store the pending registration and OTP
+        challenge, otp_code = serializer.save()
+        count_otp(PARENT_REGISTRATION, OTP_ISSUED)
+        phone_number = challenge.payload['phone_number']
         
-        # Simulate sending OTP via SMS (e.g., Twilio)
-        logger.info(f"OTP for {temp_user.phone_number} is {otp_code}")  # Log for debugging (don't return OTP in production)
+        # Queue the OTP SMS; delivery happens in the background
+        send_otp_sms(phone_number, otp_code)
         
         return Response(
             {
                 "message": "Registration step 1 complete. OTP sent (demo).",
-                "phone_number": str(temp_user.phone_number),
+                "phone_number": str(phone_number),
                 "otp_code": otp_code  # DO NOT return this in production
             },
             status=status.HTTP_200_OK
@@ -59,7 +169,7 @@ class ParentRegisterVerifyView(generics.GenericAPIView):
     """
     Step 2:
       - Verify phone_number & otp_code.
-      - If correct and not expired, create real user & profile, delete TempUser.
+      - If correct and not expired, create real user & profile from the pending registration.
       
     """
     serializer_class = VerifyOTPSerializer
@@ -73,75 +183,25 @@ class ParentRegisterVerifyView(generics.GenericAPIView):
         otp_code = serializer.validated_data['otp_code']
         hashed_input_otp = hash_otp(otp_code)
 
-        try:
-            temp_user = TempParent.objects.get(phone_number=phone_number)
-        except TempParent.DoesNotExist:
-            return Response(
-                {"detail": "No pending registration found for this phone number."},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Check max attempts
-        if temp_user.attempt_count >= temp_user.max_attempts:
-            temp_user.delete()
-            return Response(
-                {"detail": "Maximum OTP attempts exceeded. Please register again."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Check if OTP is expired
-        if (timezone.now() - temp_user.otp_created_at).total_seconds() > 300:  # 5 minutes
-            temp_user.delete()
-            return Response(
-                {"detail": "OTP expired. Please register again."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Compare hashed OTP
-        if temp_user.otp_hash != hashed_input_otp:
-            temp_user.attempt_count += 1
-            temp_user.save()
-            return Response(
-                {"detail": f"Invalid OTP. Attempts left: {temp_user.max_attempts - temp_user.attempt_count}"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        # One atomic check: counts the guess, or takes the pending registration
+        # so that concurrent verifies of the right code succeed exactly once
+        verification = get_challenge_store().verify(challenge_key(PARENT_REGISTRATION, phone_number), hashed_input_otp)
+        rejection = registration_rejection(PARENT_REGISTRATION, verification)
+        if rejection is not None:
+            return Response(*rejection)
 
         # OTP is correct -> Create real user
-        user = CustomUser.objects.create_user(
-            phone_number=temp_user.phone_number,
-            
-            is_student=temp_user.is_student,
-        )
-        profile = Parent_Profile.objects.create(
-            user=user,
-            full_name=temp_user.full_name,
-            dob=temp_user.dob,
-            email=temp_user.email,
-            
-        )
-
-       
-        # Clean up the TempUser
-        temp_user.delete()
+        return Response(*parent_account_response(verification.challenge.payload))
 
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
-        user_data = GetCustomUserSerializer(user).data
 
-        return Response({
-            "user": user_data,
-            "refresh": str(refresh),
-            "access": str(refresh.access_token),
-            "message": "Registration successful"
-        }, status=status.HTTP_201_CREATED)
 
-
-
-class ParentSendOTPView(generics.GenericAPIView):
+class ParentSendOTPView(OrderedThrottlesMixin, generics.GenericAPIView):
     """
     Generate and send OTP via phone number for login.
+    Throttled per phone number, per client IP and globally.
     """
     permission_classes = [AllowAny]
+    throttle_classes = OTP_THROTTLE_CLASSES
     
     def post(self, request, *args, **kwargs):
         phone_number = request.data.get("phone_number")
@@ -152,8 +212,12 @@ class ParentSendOTPView(generics.GenericAPIView):
         
         # Check if the user exists
         try:
-            user = CustomUser.objects.get(phone_number=phone_number)
+            user = CustomUser.objects.get_by_phone(phone_number)
         except CustomUser.DoesNotExist:
+            try:
+                normalize_phone(phone_number)
+            except InvalidPhoneNumber as exc:
+                return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
             return Response({"detail": "Parent not found with this phone number."}, status=status.HTTP_404_NOT_FOUND)
         
         # Check if user is active and the correct type
@@ -163,26 +227,7 @@ class ParentSendOTPView(generics.GenericAPIView):
         if not user.is_student:
             return Response({"detail": "Invalid user type."}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Generate OTP
-        otp_code = str(random.randint(1000, 9999))
-        hashed_otp = hashlib.sha256(otp_code.encode()).hexdigest()
-        
-        # Save OTP hash temporarily (you can store it in a user-specific field if needed)
-        user.otp_hash = hashed_otp
-        user.otp_created_at = timezone.now()
-        user.save()
-        
-        # Log OTP (In production, DO NOT log OTP, this is for debugging only)
-        logger.info(f"OTP for {phone_number} is {otp_code}")  # Log for debugging (don't return OTP in production)
-        
-        return Response(
-            {
-                "message": "OTP sent successfully.",
-                "phone_number": phone_number,
-                "otp_code": otp_code
-            },
-            status=status.HTTP_200_OK
-        )
+        return Response(issue_login_otp(user.phone_number), status=status.HTTP_200_OK)
 
 
 
@@ -191,7 +236,7 @@ class ParentLoginView(generics.GenericAPIView):
     """
     Login using phone number and OTP.
     """
-    serializer_class = VerifyOTPSerializer
+    serializer_class = LoginOTPSerializer
     permission_classes = [AllowAny]
 
     def post(self, request, *args, **kwargs):
@@ -205,11 +250,10 @@ class ParentLoginView(generics.GenericAPIView):
 
         phone_number = serializer.validated_data['phone_number']
         otp_code = serializer.validated_data['otp_code']
-        hashed_input_otp = hashlib.sha256(otp_code.encode()).hexdigest()
 
-        # Check if the user exists
+        # Fetch the user together with both profiles in one query
         try:
-            user = CustomUser.objects.get(phone_number=phone_number)
+            user = CustomUser.objects.select_related('profile', 'parent_profile').get_by_phone(phone_number)
         except CustomUser.DoesNotExist:
             return Response(
                 {"detail": "Parent not found with this phone number."},
@@ -220,39 +264,9 @@ class ParentLoginView(generics.GenericAPIView):
         if not user.is_active:
             return Response({"detail": "Parent is not active."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Compare OTP hash
-        if user.otp_hash != hashed_input_otp:
-            return Response(
-                {"detail": "Invalid OTP."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Check if OTP is expired (e.g., 5 minutes)
-        if (timezone.now() - user.otp_created_at).total_seconds() > 300:  # 5 minutes
-            return Response(
-                {"detail": "OTP expired. Please request a new OTP."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        rejection = check_login_otp(user.phone_number, otp_code, serializer.validated_data.get('challenge'))
+        if rejection is not None:
+            return Response(*rejection)
 
-        # OTP is correct, generate JWT tokens for the user
-        refresh = RefreshToken.for_user(user)
-        user_data = GetCustomUserSerializer(user).data
-
-        # Fetch the parent profile (Assuming One-to-One relation)
-        parent_profile_data = None
-        if hasattr(user, 'parent_profile'):  # Check if the related profile exists
-            parent_profile_data = ParentProfileSerializer(user.parent_profile).data
-
-        # Clean up OTP fields after successful login (optional, for security reasons)
-        user.otp_hash = None
-        user.otp_created_at = None
-        user.save()
-
-        # Return JWT tokens, user data, and parent profile
-        return Response({
-            "user": user_data,
-            "parent_profile": parent_profile_data,
-            "refresh": str(refresh),
-            "access": str(refresh.access_token),
-            "message": "Login successful"
-        }, status=status.HTTP_200_OK)
+        # OTP is correct: JWT tokens, user data and parent profile
+        return Response(parent_login_response(user), status=status.HTTP_200_OK)
@@ -0,0 +1,68 @@
+from django.utils.http import parse_etags
+from rest_framework import generics, status
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from core.college_search import get_college_index
+from core.reference import get_reference_cache, reference_cache_settings
+
+# A year: a URL naming the current version never changes content
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+SEARCH_MAX_AGE = 60
+
+
+class ReferenceDataView(generics.GenericAPIView):
+    """
+    Active vehicle types and colleges and all college timings, for the
+    apps' pickers. The response carries a strong ETag of its `version`;
+    send it back as If-None-Match to get a 304. Requests for
+    ?version=<current version> may be cached indefinitely.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    renderer_classes = [JSONRenderer]
+
+    def get(self, request, *args, **kwargs):
+        data = get_reference_cache().reference_data()
+        etag = f'"{data.version}"'
+        if request.query_params.get('version') == data.version:
+            cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            cache_control = f"public, max-age={reference_cache_settings()['HTTP_MAX_AGE']}"
+
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if '*' in if_none_match or etag in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({'version': data.version, **data.document}, status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
+
+
+class CollegeSearchView(generics.GenericAPIView):
+    """
+    Typeahead over active colleges: GET colleges/search?q=<text>&limit=10.
+    Name and word prefixes rank first, then fuzzy (trigram) matches.
+    Registration accepts the returned id as `college`.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    renderer_classes = [JSONRenderer]
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(max(int(request.query_params.get('limit', DEFAULT_SEARCH_LIMIT)), 1), MAX_SEARCH_LIMIT)
+        except ValueError:
+            return Response({"detail": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        results = [
+            {'id': college_id, 'college_name': name, 'score': score}
+            for college_id, name, score in get_college_index().search(query, limit)
+        ]
+        response = Response({'results': results}, status=status.HTTP_200_OK)
+        response['Cache-Control'] = f'public, max-age={SEARCH_MAX_AGE}'
+        return response
@@ -0,0 +1,71 @@
+import re
+
+from rest_framework import generics, status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+from core.throttling import UPLOAD_SESSION_THROTTLE_CLASSES, OrderedThrottlesMixin, UploadChunkIPThrottle
+from core.uploads import (
+    UploadRejected, append_upload_chunk, create_upload_session, request_content_length, upload_session_status,
+)
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+class UploadSessionCreateView(OrderedThrottlesMixin, generics.GenericAPIView):
+    """
+    Start a resumable profile picture upload: POST {"size": <bytes>}.
+    Send the bytes with PUT uploads/<upload_id>, then pass `upload_id`
+    to parent-register instead of the file. Open sessions are capped per
+    client address and in total (core.uploads.create_upload_session).
+    """
+    permission_classes = [AllowAny]
+    throttle_classes = UPLOAD_SESSION_THROTTLE_CLASSES
+
+    def post(self, request, *args, **kwargs):
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({"detail": "size is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = create_upload_session(size, client=BaseThrottle().get_ident(request))
+        except UploadRejected as exc:
+            return Response({"detail": exc.detail}, status=exc.status_code)
+        return Response(session, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionView(generics.GenericAPIView):
+    """
+    GET reports how many bytes have been received, so an interrupted client
+    knows where to resume. PUT appends the raw request body at the offset
+    given by the Upload-Offset header (or a Content-Range header); the body
+    is copied to disk in fixed-size chunks as it arrives. A PUT made while
+    another is still writing to the session gets a 409.
+    """
+    permission_classes = [AllowAny]
+    throttle_classes = [UploadChunkIPThrottle]
+
+    def get(self, request, upload_id, *args, **kwargs):
+        try:
+            return Response(upload_session_status(upload_id), status=status.HTTP_200_OK)
+        except UploadRejected as exc:
+            return Response({"detail": exc.detail}, status=exc.status_code)
+
+    def put(self, request, upload_id, *args, **kwargs):
+        offset = request.headers.get('Upload-Offset')
+        if offset is None:
+            match = CONTENT_RANGE.fullmatch(request.headers.get('Content-Range', ''))
+            offset = match.group(1) if match else None
+        if offset is None or not offset.isdigit():
+            return Response(
+                {"detail": "An Upload-Offset or Content-Range header is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            length = request_content_length(request)
+            session = append_upload_chunk(upload_id, int(offset), request.stream, length) if length else upload_session_status(upload_id)
+        except UploadRejected as exc:
+            return Response({"detail": exc.detail}, status=exc.status_code)
+        return Response(session, status=status.HTTP_200_OK)
@@ -0,0 +1,201 @@
+import contextvars
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueueBusy(APIException):
+    """A write waited `timeout` seconds without being started; it was withdrawn and never runs."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The server is busy, please try again."
+    default_code = 'write_queue_busy'
+    wait = 1
+
+
+class WriteJob:
+    __slots__ = ('fn', 'args', 'kwargs', 'context', 'future')
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        # Run in the caller's context, so e.g. the request's routing state sees the write
+        self.context = contextvars.copy_context()
+        self.future = Future()
+
+    def run(self):
+        return self.context.run(self.fn, *self.args, **self.kwargs)
+
+
+class WriteQueue:
+    """
+    Serializes writes to one database through a single background thread.
+
+    SQLite allows one writer at a time; instead of every request thread
+    fighting for the lock, jobs are handed to this thread, which runs up to
+    `batch_size` of them (waiting at most `batch_wait` seconds to fill a
+    batch) in one transaction: a group commit. Each job runs in its own
+    savepoint, so a failing job is rolled back and reported to its caller
+    without affecting the rest of the batch.
+
+    The queue is per process; with several gunicorn workers the busy
+    timeout still arbitrates between processes, but each process holds the
+    lock once per batch instead of once per write.
+
+    `timeout` bounds how long a job may wait for the writer to pick it up.
+    A job still queued then is cancelled and its caller gets WriteQueueBusy
+    (a 503 with Retry-After); a job the writer has started is always waited
+    for, so a caller never reports a failure for a write that commits.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, batch_size=32, batch_wait=0.002, timeout=10):
+        self.using = using
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.timeout = timeout
+        self.queue = queue.Queue()
+        self.stats = {'jobs': 0, 'failed': 0, 'cancelled': 0, 'batches': 0, 'max_batch': 0}
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"write-queue-{self.using}", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs); returns a Future with its result."""
+        if self._thread is None:
+            self.start()
+        job = WriteJob(fn, args, kwargs)
+        self.queue.put(job)
+        return job.future
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the writer thread and wait for its result.
+        Inside an open transaction the job runs inline instead: the writer
+        could neither see that transaction's rows nor get the lock it holds.
+        """
+        if connections[self.using].in_atomic_block or threading.current_thread() is self._thread:
+            return fn(*args, **kwargs)
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            if future.cancel():
+                with self._stats_lock:
+                    self.stats['cancelled'] += 1
+                raise WriteQueueBusy()
+        # Started before it could be cancelled: the outcome is on its way
+        return future.result()
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._commit(batch)
+            except Exception as exc:
+                logger.exception(f"Write batch of {len(batch)} jobs failed to commit")
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(exc)
+                connections[self.using].close()
+
+    def _commit(self, batch):
+        # Jobs whose callers gave up are dropped; the rest can no longer be cancelled
+        batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        with transaction.atomic(using=self.using):
+            for job in batch:
+                try:
+                    with transaction.atomic(using=self.using):
+                        outcomes.append((job, job.run(), None))
+                except Exception as exc:
+                    outcomes.append((job, None, exc))
+
+        # Results are only released once the whole batch is committed
+        failed = 0
+        for job, result, exc in outcomes:
+            if exc is None:
+                job.future.set_result(result)
+            else:
+                failed += 1
+                job.future.set_exception(exc)
+        with self._stats_lock:
+            self.stats['jobs'] += len(batch)
+            self.stats['failed'] += failed
+            self.stats['batches'] += 1
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+
+    def snapshot(self):
+        with self._stats_lock:
+            data = dict(self.stats)
+        data['queued'] = self.queue.qsize()
+        data['mean_batch'] = round(data['jobs'] / data['batches'], 2) if data['batches'] else None
+        return data
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    """
+    The queue configured by settings.SQLITE_WRITE_QUEUE, or None when it is
+    disabled or the default database is not SQLite.
+    """
+    global _write_queue
+    config = dict(getattr(settings, 'SQLITE_WRITE_QUEUE', {}))
+    if not config.pop('ENABLED', False) or connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+        return None
+    if _write_queue is None:
+        with _write_queue_lock:
+            if _write_queue is None:
+                _write_queue = WriteQueue(**{key.lower(): value for key, value in config.items()})
+    return _write_queue
+
+
+@receiver(setting_changed)
+def reset_write_queue(setting, **kwargs):
+    global _write_queue
+    if setting in ('SQLITE_WRITE_QUEUE', 'DATABASES'):
+        _write_queue = None
+
+
+def run_write(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) as one transaction on the default database,
+    through the write queue when it is enabled.
+    """
+    write_queue = get_write_queue()
+    if write_queue is None:
+        with transaction.atomic():
+            return fn(*args, **kwargs)
+    return write_queue.run(fn, *args, **kwargs)